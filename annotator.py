@@ -0,0 +1,62 @@
+# =====================================
+# 🎨 标注引擎：直接在上传的原工作簿上标红/标黄
+# =====================================
+"""
+不再把 DataFrame 写入临时 BytesIO 再 load_workbook 回来：
+原工作簿只加载一次，错误单元格直接在原 sheet 上填色（保留原格式），
+导出时只把目标 sheet 写出。标注成本与错误数量成正比。
+"""
+
+from io import BytesIO
+
+from openpyxl.styles import PatternFill
+from openpyxl.workbook.defined_name import DefinedNameDict
+
+# 共享样式对象：所有单元格引用同一个 fill，openpyxl 只登记一次样式
+RED_FILL = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
+YELLOW_FILL = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+
+# 月重卡 sheet 的表头在第 2 行（header=1），DataFrame 第 i 行对应 Excel 第 i+3 行
+MAIN_SHEET_FIRST_DATA_ROW = 3
+
+
+def fill_cells(ws, cells, fill):
+    """给 (excel_row, excel_col) 坐标逐个上色，只触及出错的单元格。"""
+    count = 0
+    for row, col in cells:
+        ws.cell(row=row, column=col).fill = fill
+        count += 1
+    return count
+
+
+def save_single_sheet(wb, sheet_name):
+    """
+    只把 wb 中的 sheet_name 写出为一个独立的 xlsx（BytesIO）。
+    临时摘掉其它 sheet 及指向它们的全局名称，写完后恢复，wb 本身不被破坏。
+    """
+    ws = wb[sheet_name]
+    sheets = wb._sheets
+    active_index = wb._active_sheet_index
+    defined_names = wb.defined_names
+
+    kept_names = DefinedNameDict()
+    for name, dn in defined_names.items():
+        try:
+            titles = {title for title, _ in dn.destinations}
+        except Exception:
+            titles = set()
+        if titles <= {sheet_name}:
+            kept_names[name] = dn
+
+    output = BytesIO()
+    try:
+        wb._sheets = [ws]
+        wb._active_sheet_index = 0
+        wb.defined_names = kept_names
+        wb.save(output)
+    finally:
+        wb._sheets = sheets
+        wb._active_sheet_index = active_index
+        wb.defined_names = defined_names
+    output.seek(0)
+    return output
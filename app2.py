@@ -5,503 +5,352 @@
 
 import streamlit as st
 import pandas as pd
-import time
-from openpyxl import load_workbook, Workbook
-from openpyxl.styles import PatternFill
-from openpyxl.utils.dataframe import dataframe_to_rows
-from io import BytesIO
+import os
+import json
+import uuid
 
-# =====================================
-# 🧰 工具函数区 (不变)
-# =====================================
-
-def normalize_contract_key(series: pd.Series) -> pd.Series:
-    s = series.astype(str)
-    s = s.str.replace(r"\.0$", "", regex=True) 
-    s = s.str.strip()
-    s = s.str.upper() 
-    s = s.str.replace('－', '-', regex=False)
-    s = s.str.replace(r'\s+', '', regex=True)
-    return s
-
-def find_file(files_list, keyword):
-    """
-    注意：此版本接收 Streamlit 的 UploadedFile 对象列表
-    """
-    for f in files_list:
-        if keyword in f.name:
-            return f
-    # (修改：返回 None 而不是 raise Error, 允许缓存函数处理)
-    return None 
-
-def normalize_colname(c): return str(c).strip().lower()
-
-def find_col(df, keyword, exact=False):
-    key = keyword.strip().lower()
-    for col in df.columns:
-        cname = normalize_colname(col)
-        if (exact and cname == key) or (not exact and key in cname):
-            return col
-    return None
-
-def find_sheet(xls, keyword):
-    for s in xls.sheet_names:
-        if keyword in s:
-            return s
-    raise ValueError(f"❌ 未找到包含关键词「{keyword}」的sheet: {keyword}")
+import audit_engine
+from audit_admission import AdmissionGate
+from audit_cache import LRUCache, file_digest
+from audit_engine import default_workers
+from audit_jobs import JobManager, detach_files
+from audit_prefetch import Prefetcher
+from output_store import OutputStore
 
-def normalize_num(val):
-    if pd.isna(val): return None
-    s = str(val).replace(",", "").strip()
-    if s in ["", "-", "nan"]: return None
-    try:
-        if "%" in s: return float(s.replace("%", "")) / 100
-        return float(s)
-    except ValueError:
-        return s
-
-def prepare_ref_df(ref_df, mapping, prefix):
-    contract_col = find_col(ref_df, "合同") 
-    if not contract_col:
-        st.warning(f"⚠️ 在 {prefix} 参考表中未找到'合同'列，跳过此数据源。")
-        return pd.DataFrame(columns=['__KEY__'])
-        
-    std_df = pd.DataFrame()
-    std_df['__KEY__'] = normalize_contract_key(ref_df[contract_col])
-    
-    for main_kw, ref_kw in mapping.items():
-        exact = (main_kw == "城市经理")
-        ref_col_name = find_col(ref_df, ref_kw, exact=exact)
-        
-        if ref_col_name:
-            s_ref_raw = ref_df[ref_col_name]
-            if prefix == 'fk' and main_kw == '租赁期限':
-                s_ref_transformed = pd.to_numeric(s_ref_raw, errors='coerce') * 12
-                std_df[f'ref_{prefix}_{main_kw}'] = s_ref_transformed
-            else:
-                std_df[f'ref_{prefix}_{main_kw}'] = s_ref_raw
-        else:
-            st.warning(f"⚠️ 在 {prefix} 参考表中未找到列 (main: '{main_kw}', ref: '{ref_kw}')")
-
-    std_df = std_df.drop_duplicates(subset=['__KEY__'], keep='first')
-    return std_df
-
-def compare_series_vec(s_main, s_ref, main_kw):
-    merge_failed_mask = s_ref.isna() 
-    main_is_na = pd.isna(s_main) | (s_main.astype(str).str.strip().isin(["", "nan", "None"]))
-    ref_is_na = pd.isna(s_ref) | (s_ref.astype(str).str.strip().isin(["", "nan", "None"]))
-    both_are_na = main_is_na & ref_is_na
-    
-    if any(k in main_kw for k in ["日期", "时间"]):
-        d_main = pd.to_datetime(s_main, errors='coerce')
-        d_ref = pd.to_datetime(s_ref, errors='coerce')
-        valid_dates_mask = d_main.notna() & d_ref.notna()
-        date_diff_mask = (d_main.dt.date != d_ref.dt.date)
-        errors = valid_dates_mask & date_diff_mask
-    else:
-        s_main_norm = s_main.apply(normalize_num)
-        s_ref_norm = s_ref.apply(normalize_num)
-        main_is_na_norm = pd.isna(s_main_norm) | (s_main_norm.astype(str).str.strip().isin(["", "nan", "None"]))
-        ref_is_na_norm = pd.isna(s_ref_norm) | (s_ref_norm.astype(str).str.strip().isin(["", "nan", "None"]))
-        both_are_na_norm = main_is_na_norm & ref_is_na_norm
-        is_num_main = s_main_norm.apply(lambda x: isinstance(x, (int, float)))
-        is_num_ref = s_ref_norm.apply(lambda x: isinstance(x, (int, float)))
-        both_are_num = is_num_main & is_num_ref
-        errors = pd.Series(False, index=s_main.index)
-        
-        if both_are_num.any():
-            num_main = s_main_norm[both_are_num].fillna(0)
-            num_ref = s_ref_norm[both_are_num].fillna(0)
-            diff = (num_main - num_ref).abs()
-            
-            if main_kw == "保证金比例":
-                num_errors = (diff > 0.00500001)
-            elif "租赁期限" in main_kw:
-                num_errors = (diff >= 1.0) 
-            else:
-                num_errors = (diff > 1e-6)
-            
-            errors.loc[both_are_num] = num_errors
-
-        not_num_mask = ~both_are_num
-        if not_num_mask.any():
-            str_main = s_main_norm[not_num_mask].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
-            str_ref = s_ref_norm[not_num_mask].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
-            str_errors = (str_main != str_ref)
-            errors.loc[not_num_mask] = str_errors
-            
-        errors = errors & ~both_are_na_norm
-
-    final_errors = errors & ~both_are_na
-    lookup_failure_mask = merge_failed_mask & ~main_is_na
-    final_errors = final_errors & ~lookup_failure_mask
-    return final_errors
 
 # --- VVVV (【修改点 1】: 将 reboot_app1 移到这里) VVVV ---
 def reboot_app1():
     """
     一个用于“重新上传”按钮的回调函数。
-    它会清除所有缓存和 session 状态，让 app 恢复到初始状态。
+    它只清除本会话的 session 状态和本会话命名空间下的审核缓存，让 app 恢复到初始状态。
+    (其他用户的缓存条目不受影响)
     """
-    # 1. 清除函数缓存
-    run_full_audit.clear()
-    
+    # 1. 清掉本会话的缓存命名空间与后台预解析
+    if 'cache_ns_app1' in st.session_state:
+        get_audit_cache().clear_namespace(st.session_state.cache_ns_app1)
+        get_prefetcher().discard(st.session_state.cache_ns_app1)
+
     # 2. 定义需要从 session_state 中清除的 key
-    keys_to_delete = ['audit_run_app1', 'uploader_app1'] # <--- 'uploader_app1' 是关键
+    keys_to_delete = ['audit_run_app1', 'uploader_app1', 'audit_job_app1', 'upload_digests_app1'] # <--- 'uploader_app1' 是关键
     
-    # 3. 循环删除
+    # 3. 循环删除（网址里的任务 id 也一并去掉，刷新后不再重新连接）
     for key in keys_to_delete:
         if key in st.session_state:
             del st.session_state[key]
+    if "job" in st.query_params:
+        del st.query_params["job"]
     
     # (不需要 st.rerun(), on_click 会自动触发)
 # --- ^^^^ (修改结束) ^^^^ ---
 
 
 # =====================================
-# 🧮 (修改) 单sheet检查函数 - 现在返回文件
+# 🚀 (新) 审核入口：引擎见 audit_engine.run_full_audit
 # =====================================
-def check_one_sheet(sheet_keyword, main_file, ref_dfs_std_dict, mappings_all):
+AUDIT_CACHE_MAX_BYTES = int(os.environ.get("AUDIT_CACHE_MAX_MB", "1024")) * 1024 ** 2   # 全局缓存内存预算（估算字节数）
+AUDIT_CACHE_MAX_ENTRIES = 128       # 全局缓存条目上限
+# 单个会话最多占用的缓存（估算字节数），避免一个用户的大文件把其他人的缓存全部挤掉
+AUDIT_SESSION_CACHE_MAX_BYTES = int(os.environ.get("AUDIT_SESSION_CACHE_MAX_MB", "384")) * 1024 ** 2
+# 同时运行的审核数上限，其余用户排队（页面上显示排队位置）
+AUDIT_MAX_CONCURRENT = int(os.environ.get("AUDIT_MAX_CONCURRENT", "2"))
+AUDIT_WORKERS = default_workers()   # 并行检查的 sheet 数（环境变量 AUDIT_WORKERS 可覆盖，1 = 串行）
+# "thread" 或 "process"。网页服务默认用线程：Streamlit 本身是多线程服务，在其中 fork 子进程
+# 与其他会话的审核并发时风险较大；单用户部署、sheet 较多时可设为 "process" 换取多核并行
+AUDIT_EXECUTOR = os.environ.get("AUDIT_EXECUTOR", "thread")
+# 漏填报告除 xlsx 外额外导出的格式，如 "csv,parquet"（字段表很大时便于下游处理）
+AUDIT_PROFILE = os.environ.get("AUDIT_PROFILE", "") == "1"  # 默认勾选“性能剖析”
+# 默认勾选“增量模式”；指纹库位置见 incremental.default_store_path（环境变量 AUDIT_INCREMENTAL_DB）
+AUDIT_INCREMENTAL = os.environ.get("AUDIT_INCREMENTAL", "") == "1"
+# 参考数据列式存储目录：设置后参考文件按内容摘要入库，之后的审核直接按列读取，不再解析 Excel
+AUDIT_REF_STORE = os.environ.get("AUDIT_REF_STORE") or None
+# 报告输出目录（默认系统临时目录）的容量上限与保留时间，超出后从最久未访问的报告开始删除
+AUDIT_OUTPUT_MAX_BYTES = int(os.environ.get("AUDIT_OUTPUT_MAX_MB", "2048")) * 1024 ** 2
+AUDIT_OUTPUT_TTL = float(os.environ.get("AUDIT_OUTPUT_TTL_HOURS", "6")) * 3600
+# 月重卡超过 AUDIT_STREAM_MIN_MB 时改用流式模式（每块 AUDIT_STREAM_ROWS 行），内存不随行数增长；0 表示不启用
+AUDIT_STREAM_MIN_BYTES = float(os.environ.get("AUDIT_STREAM_MIN_MB", "50")) * 1024 ** 2
+AUDIT_STREAM_ROWS = int(os.environ.get("AUDIT_STREAM_ROWS", "20000"))
+# 文件上传后立即在后台预解析（同时解析的文件数），点击“开始审核”时直接取用；0 表示不预解析
+AUDIT_PREFETCH_WORKERS = int(os.environ.get("AUDIT_PREFETCH_WORKERS", "1"))
+# 预解析结果上传后保留多久（分钟）等待点击“开始审核”，过期由后台定时释放；结果同时计入会话缓存预算
+AUDIT_PREFETCH_KEEP = float(os.environ.get("AUDIT_PREFETCH_KEEP_MINUTES", "10")) * 60
+LEAKY_EXTRA_FORMATS = tuple(f.strip() for f in os.environ.get("AUDIT_LEAKY_FORMATS", "").split(",") if f.strip())
+# 另生成一份“审核错误明细”（"parquet" 或 "jsonl"，每处错误、每个漏填合同一条记录），供下游程序读取；空表示不生成
+AUDIT_LEDGER = os.environ.get("AUDIT_LEDGER", "").strip() or None
+
+
+@st.cache_resource
+def get_audit_cache():
     """
-    (已修改)
-    1. 移除 st.download_button
-    2. 返回 (stats, files_dict)
+    进程内共享的审核缓存（按内容摘要寻址，LRU 淘汰）。
+    参考表预处理结果、单 sheet 结果、漏填结果分别缓存。
     """
-    start_time = time.time()
-    xls_main = pd.ExcelFile(main_file)
+    return LRUCache(max_bytes=AUDIT_CACHE_MAX_BYTES, max_entries=AUDIT_CACHE_MAX_ENTRIES)
 
-    try:
-        target_sheet = find_sheet(xls_main, sheet_keyword)
-    except ValueError:
-        st.warning(f"⚠️ 未找到包含「{sheet_keyword}」的sheet，跳过。")
-        return (0, None, 0, set()), {} # 返回 (stats, files_dict)
 
-    try:
-        main_df = pd.read_excel(xls_main, sheet_name=target_sheet, header=1)
-    except Exception as e:
-        st.error(f"❌ 读取「{sheet_keyword}」时出错: {e}")
-        return (0, None, 0, set()), {}
-        
-    if main_df.empty:
-        st.warning(f"⚠️ 「{sheet_keyword}」为空，跳过。")
-        return (0, None, 0, set()), {}
-
-    contract_col_main = find_col(main_df, "合同")
-    if not contract_col_main:
-        st.error(f"❌ 在「{sheet_keyword}」中未找到合同列。")
-        return (0, None, 0, set()), {}
-
-    # --- 写入临时 BytesIO 而不是磁盘 ---
-    temp_output_stream = BytesIO()
-    with pd.ExcelWriter(temp_output_stream, engine='openpyxl') as writer:
-        # (保留原始空行)
-        empty_row = pd.DataFrame([[""] * len(main_df.columns)], columns=main_df.columns)
-        pd.concat([empty_row, main_df], ignore_index=True).to_excel(writer, index=False, sheet_name=target_sheet)
-    temp_output_stream.seek(0)
-    
-    wb = load_workbook(temp_output_stream)
-    ws = wb[target_sheet] # 确保激活正确的 sheet
-    
-    red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")
-    yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+@st.cache_resource
+def get_admission_gate():
+    """进程内共享的审核准入闸：最多 AUDIT_MAX_CONCURRENT 个审核同时运行，其余先来后到排队。"""
+    return AdmissionGate(max_running=AUDIT_MAX_CONCURRENT)
 
-    main_df['__ROW_IDX__'] = main_df.index
-    main_df['__KEY__'] = normalize_contract_key(main_df[contract_col_main])
-    contracts_seen = set(main_df['__KEY__'].dropna())
 
-    merged_df = main_df.copy()
-    for prefix, std_df in ref_dfs_std_dict.items():
-        if not std_df.empty:
-            merged_df = pd.merge(merged_df, std_df, on='__KEY__', how='left')
-    
-    total_errors = 0
-    skip_city_manager = [0]
-    errors_locations = set()
-    row_has_error = pd.Series(False, index=merged_df.index) 
-
-    progress = st.progress(0)
-    status = st.empty()
-
-    total_comparisons = sum(len(m[0]) for m in mappings_all.values())
-    current_comparison = 0
-
-    for prefix, (mapping, std_df) in mappings_all.items():
-        if std_df.empty:
-            current_comparison += len(mapping)
-            continue
-            
-        for main_kw, ref_kw in mapping.items():
-            current_comparison += 1
-            status.text(f"检查「{sheet_keyword}」: {prefix} - {main_kw}...")
-            
-            exact = (main_kw == "城市经理")
-            main_col = find_col(main_df, main_kw, exact=exact)
-            ref_col = f'ref_{prefix}_{main_kw}'
-
-            if not main_col or ref_col not in merged_df.columns:
-                continue 
-
-            s_main = merged_df[main_col]
-            s_ref = merged_df[ref_col]
-
-            skip_mask = pd.Series(False, index=merged_df.index)
-            if main_kw == "城市经理":
-                na_strings = ["", "-", "nan", "none", "null"]
-                skip_mask = pd.isna(s_ref) | s_ref.astype(str).str.strip().isin(na_strings)
-                skip_city_manager[0] += skip_mask.sum()
-            
-            errors_mask = compare_series_vec(s_main, s_ref, main_kw)
-            final_errors_mask = errors_mask & ~skip_mask
-            
-            if final_errors_mask.any():
-                total_errors += final_errors_mask.sum()
-                row_has_error |= final_errors_mask
-                bad_indices = merged_df[final_errors_mask]['__ROW_IDX__']
-                for idx in bad_indices:
-                    errors_locations.add((idx, main_col))
-            
-            progress.progress(current_comparison / total_comparisons)
-
-    status.text(f"「{sheet_keyword}」比对完成，正在生成标注文件...")
-
-    original_cols_list = list(main_df.drop(columns=['__ROW_IDX__', '__KEY__']).columns)
-    col_name_to_idx = {name: i + 1 for i, name in enumerate(original_cols_list)}
-
-    for (row_idx, col_name) in errors_locations:
-        if col_name in col_name_to_idx:
-            ws.cell(row_idx + 3, col_name_to_idx[col_name]).fill = red_fill
-
-    if contract_col_main in col_name_to_idx:
-        contract_col_excel_idx = col_name_to_idx[contract_col_main]
-        error_row_indices = merged_df[row_has_error]['__ROW_IDX__']
-        for row_idx in error_row_indices:
-            ws.cell(row_idx + 3, contract_col_excel_idx).fill = yellow_fill
-
-    # --- (10. 修改为 return 文件) ---
-    output = BytesIO()
-    wb.save(output)
-    output.seek(0)
-    
-    files_to_save = {
-        "full_report": (f"月重卡_{sheet_keyword}_审核标注版.xlsx", output),
-        "error_report": (None, None)
-    }
-    output_errors_only = None
-
-    # --- (11. 修改为 return 文件) ---
-    if row_has_error.any():
-        try:
-            df_errors_only = merged_df.loc[row_has_error, original_cols_list].copy()
-            original_indices_with_error = merged_df.loc[row_has_error, '__ROW_IDX__']
-            original_idx_to_new_excel_row = {
-                original_idx: new_row_num 
-                for new_row_num, original_idx in enumerate(original_indices_with_error, start=2)
-            }
-            wb_errors = Workbook()
-            ws_errors = wb_errors.active
-            for r in dataframe_to_rows(df_errors_only, index=False, header=True):
-                ws_errors.append(r)
-            for (original_row_idx, col_name) in errors_locations:
-                if original_row_idx in original_idx_to_new_excel_row:
-                    new_row = original_idx_to_new_excel_row[original_row_idx]
-                    if col_name in col_name_to_idx:
-                        new_col = col_name_to_idx[col_name]
-                        ws_errors.cell(row=new_row, column=new_col).fill = red_fill
-            
-            output_errors_only = BytesIO()
-            wb_errors.save(output_errors_only)
-            output_errors_only.seek(0)
-            
-            files_to_save["error_report"] = (f"月重卡_{sheet_keyword}_仅错误行_标红.xlsx", output_errors_only)
-            
-        except Exception as e:
-            st.error(f"❌ 生成“仅错误行”文件时出错: {e}")
-            
-    elapsed = time.time() - start_time
-    st.success(f"✅ {sheet_keyword} 检查完成，共 {total_errors} 处错误，用时 {elapsed:.2f} 秒。")
-    
-    stats = (total_errors, elapsed, skip_city_manager[0], contracts_seen)
-    return stats, files_to_save
+@st.cache_resource
+def get_job_manager():
+    """
+    进程内共享的后台任务表：审核在后台线程运行，页面刷新、切换控件都不会打断它；
+    任务 id 写在网址里（?job=...），刷新后凭它重新连接到正在运行或已完成的任务。
+    """
+    return JobManager(gate=get_admission_gate(), keep_seconds=AUDIT_OUTPUT_TTL)
 
-# =====================================
-# 🕵️ (新) 漏填检查函数
-# =====================================
-def run_leaky_check(zd_df, contract_col_zd, contracts_seen_all_sheets):
+
+@st.cache_resource
+def get_prefetcher():
     """
-    执行漏填检查并返回 BytesIO 文件。
+    进程内共享的预解析任务表：文件一上传就在后台解析、标准化参考表，
+    文件被移除或替换时取消对应任务（见 audit_prefetch）。
     """
-    st.info("ℹ️ 正在执行漏填检查...")
-    files_to_save = {}
-    
-    field_contracts = zd_df[contract_col_zd].dropna().astype(str).str.strip()
-    col_car_manager = find_col(zd_df, "是否车管家", exact=True)
-    col_bonus_type = find_col(zd_df, "提成类型", exact=True)
+    return Prefetcher(workers=AUDIT_PREFETCH_WORKERS, keep_seconds=AUDIT_PREFETCH_KEEP)
 
-    missing_contracts_mask = (~field_contracts.isin(contracts_seen_all_sheets))
 
-    if col_car_manager:
-        missing_contracts_mask &= ~(zd_df[col_car_manager].astype(str).str.strip().str.lower() == "是")
-    if col_bonus_type:
-        missing_contracts_mask &= ~(
-            zd_df[col_bonus_type].astype(str).str.strip().isin(["联合租赁", "驻店"])
-        )
+def upload_digests(files):
+    """上传文件的内容摘要，按 file_id 记在 session 里，每次脚本运行不再重复整文件哈希。"""
+    known = st.session_state.get('upload_digests_app1', {})
+    digests = {}
+    for f in files:
+        file_id = getattr(f, "file_id", None) or id(f)
+        digests[file_id] = known.get(file_id) or file_digest(f)
+    st.session_state.upload_digests_app1 = digests
+    return [digests[getattr(f, "file_id", None) or id(f)] for f in files]
 
-    zd_df_missing = zd_df.copy()
-    zd_df_missing["漏填检查"] = ""
-    zd_df_missing.loc[missing_contracts_mask, "漏填检查"] = "❗ 漏填"
-    漏填合同数 = zd_df_missing["漏填检查"].eq("❗ 漏填").sum()
-    st.warning(f"⚠️ 共发现 {漏填合同数} 个合同在记录表中未出现（已排除车管家、联合租赁、驻店）")
 
-    # --- 导出文件逻辑 ---
-    yellow_fill = PatternFill(start_color="FFFF00", end_color="FFFF00", fill_type="solid")
+def uploaded_digest(f):
+    """单个上传文件的内容摘要（优先取 upload_digests 记下的值）。"""
+    file_id = getattr(f, "file_id", None) or id(f)
+    return st.session_state.get('upload_digests_app1', {}).get(file_id) or file_digest(f)
 
-    # 文件1：全字段表
-    wb = Workbook()
-    ws = wb.active
-    for r in dataframe_to_rows(zd_df_missing, index=False, header=True):
-        ws.append(r)
-    
-    check_col_idx = -1
-    for c_idx, cell in enumerate(ws[1], 1): # 遍历表头
-        if cell.value == "漏填检查":
-            check_col_idx = c_idx
-            break
-            
-    if check_col_idx > 0:
-        for row in ws.iter_rows(min_row=2, min_col=check_col_idx, max_col=check_col_idx):
-            cell = row[0]
-            if cell.value == "❗ 漏填":
-                cell.fill = yellow_fill
-
-    output_all = BytesIO()
-    wb.save(output_all)
-    output_all.seek(0)
-    files_to_save["leaky_full"] = ("字段表_漏填标注版.xlsx", output_all)
-
-    # 文件2：仅漏填
-    zd_df_only_missing = zd_df_missing[zd_df_missing["漏填检查"] == "❗ 漏填"].copy()
-    if not zd_df_only_missing.empty:
-        wb2 = Workbook()
-        ws2 = wb2.active
-        for r in dataframe_to_rows(zd_df_only_missing, index=False, header=True):
-            ws2.append(r)
-        
-        check_col_idx_2 = -1
-        for c_idx, cell in enumerate(ws2[1], 1):
-            if cell.value == "漏填检查":
-                check_col_idx_2 = c_idx
-                break
-        if check_col_idx_2 > 0:
-            for row in ws2.iter_rows(min_row=2, min_col=check_col_idx_2, max_col=check_col_idx_2):
-                if row[0].value == "❗ 漏填":
-                    row[0].fill = yellow_fill
-
-        out2 = BytesIO()
-        wb2.save(out2)
-        out2.seek(0)
-        files_to_save["leaky_only"] = ("字段表_仅漏填.xlsx", out2)
-    else:
-        files_to_save["leaky_only"] = (None, None)
-
-    return 漏填合同数, files_to_save
 
+def stream_rows_for(files):
+    """月重卡超过 AUDIT_STREAM_MIN_MB 时返回流式模式的块行数，否则为 None。"""
+    main_file = audit_engine.find_file(files, "月重卡")
+    if AUDIT_STREAM_MIN_BYTES and main_file is not None and main_file.getbuffer().nbytes >= AUDIT_STREAM_MIN_BYTES:
+        return AUDIT_STREAM_ROWS
+    return None
 
-# =====================================
-# 🚀 (新) 缓存的审核主函数
-# =====================================
-@st.cache_data(show_spinner="正在执行审核，请稍候...")
-def run_full_audit(_uploaded_files):
+
+def prefetch_uploads(uploaded_files):
+    """把当前上传的文件同步到后台预解析（新文件开始解析，移除/替换的取消）。流式模式下月重卡不整表预解析。"""
+    session_cache()  # 确保本会话已分配缓存命名空间
+    upload_digests(uploaded_files)
+    skip = ('main',) if stream_rows_for(uploaded_files) else ()
+    get_prefetcher().update(st.session_state.cache_ns_app1, uploaded_files, cache=session_cache(),
+                            skip=skip, digest=uploaded_digest)
+
+
+def session_cache():
+    """本会话在共享缓存中的命名空间（会话第一次用到时分配一个随机 id）。"""
+    if 'cache_ns_app1' not in st.session_state:
+        st.session_state.cache_ns_app1 = uuid.uuid4().hex
+    return get_audit_cache().namespace(st.session_state.cache_ns_app1, max_bytes=AUDIT_SESSION_CACHE_MAX_BYTES)
+
+
+@st.cache_resource
+def get_output_store():
     """
-    执行所有文件读取、预处理和检查，并返回所有结果。
-    此函数被缓存，只有在 _uploaded_files 更改时才会重新运行。
+    进程内共享的报告输出目录：生成的报告写到磁盘，缓存和会话里只保留句柄，
+    下载时才从磁盘读取，不再让每个用户的全部报告常驻内存。
     """
-    
-    # --- 1. 📖 文件读取 ---
-    main_file = find_file(_uploaded_files, "月重卡")
-    fk_file = find_file(_uploaded_files, "放款明细")
-    zd_file = find_file(_uploaded_files, "字段")
-    ec_file = find_file(_uploaded_files, "二次明细")
-    
-    if not all([main_file, fk_file, zd_file, ec_file]):
-        raise FileNotFoundError("未能找到所有必需的文件（月重卡、放款明细、字段、二次明细）。")
-
-    st.info("ℹ️ 正在读取并预处理参考文件...")
-    fk_df = pd.read_excel(pd.ExcelFile(fk_file), sheet_name=find_sheet(pd.ExcelFile(fk_file), "威田"))
-    zd_df = pd.read_excel(pd.ExcelFile(zd_file), sheet_name=find_sheet(pd.ExcelFile(zd_file), "重卡"))
-    ec_df = pd.read_excel(ec_file)
-
-    contract_col_zd = find_col(zd_df, "合同") # 仅为漏填检查
-
-    # --- 2. 🗺️ 映射表 ---
-    mapping_fk = {
-        "授信方": "授信方",
-        "租赁本金": "租赁本金", 
-        "租赁期限": "租赁期限",
-        "挂车台数": "挂车数量",
-        "起租收益率": "XIRR"
-    }
-    mapping_zd = {"保证金比例": "保证金比例_2", "项目提报人": "提报", "起租时间": "起租日_商", "客户经理": "客户经理_资产", "所属省区": "区域", "主车台数": "主车台数", "城市经理": "城市经理"}
-    mapping_ec = {"二次时间": "出本流程时间"}
+    return OutputStore(max_bytes=AUDIT_OUTPUT_MAX_BYTES, ttl=AUDIT_OUTPUT_TTL)
 
-    mappings_all = {
-        'fk': (mapping_fk, None), # DF 稍后填充
-        'zd': (mapping_zd, None),
-        'ec': (mapping_ec, None),
-    }
 
-    # --- 3. 🚀 预处理 ---
-    fk_std = prepare_ref_df(fk_df, mapping_fk, 'fk')
-    zd_std = prepare_ref_df(zd_df, mapping_zd, 'zd')
-    ec_std = prepare_ref_df(ec_df, mapping_ec, 'ec')
+def submit_audit(uploaded_files, run_key, profile=False, incremental=False):
+    """
+    把审核提交为后台任务（使用本会话的缓存命名空间），返回 Job。
+    同时运行的审核数达到上限时任务先排队，页面上显示排队位置。
+    profile=True 时本次运行附带 cProfile 热点函数（见统计摘要 ["metrics"]["profile"]）。
+    incremental=True 时与上次运行的行指纹比对，只重新比较有变化的行（结果与全量一致）。
+    月重卡文件超过 AUDIT_STREAM_MIN_MB 时使用流式模式（标注版不保留原格式）。
+    上传后已在后台预解析好的文件直接取用，不再重新解析。
+    """
+    files = detach_files(uploaded_files)
+    cache = session_cache()
+    output_store = get_output_store()
+    stream_rows = stream_rows_for(files)
+    prefetched = get_prefetcher().session(st.session_state.cache_ns_app1)
+
+    def audit(reporter):
+        return audit_engine.run_full_audit(
+            files,
+            reporter=reporter,
+            cache=cache,
+            workers=AUDIT_WORKERS,
+            executor=AUDIT_EXECUTOR,
+            leaky_formats=LEAKY_EXTRA_FORMATS,
+            profile=profile,
+            incremental=incremental or None,
+            ref_store=AUDIT_REF_STORE,
+            output_store=output_store,
+            stream_rows=stream_rows,
+            prefetched=prefetched,
+            ledger=AUDIT_LEDGER,
+        )
 
-    ref_dfs_std_dict = {
-        'fk': fk_std,
-        'zd': zd_std,
-        'ec': ec_std
-    }
-    
-    mappings_all['fk'] = (mapping_fk, fk_std)
-    mappings_all['zd'] = (mapping_zd, zd_std)
-    mappings_all['ec'] = (mapping_ec, ec_std)
-    st.success("✅ 参考数据预处理完成。")
-    
-    # --- 4. 🧾 多sheet循环 ---
-    sheet_keywords = ["二次", "部分担保", "随州", "驻店客户"]
-    total_all = elapsed_all = skip_total = 0
-    contracts_seen_all_sheets = set()
-    
-    all_generated_files = [] # 存储所有 (文件名, BytesIO) 元组
-
-    for kw in sheet_keywords:
-        stats, files_dict = check_one_sheet(kw, main_file, ref_dfs_std_dict, mappings_all)
-        (count, used, skipped, seen) = stats
-        
-        all_generated_files.append(files_dict["full_report"])
-        if files_dict["error_report"][0] is not None:
-            all_generated_files.append(files_dict["error_report"])
-        
-        total_all += count
-        elapsed_all += used or 0
-        skip_total += skipped
-        contracts_seen_all_sheets.update(seen)
-
-    # --- 5. 🕵️ 漏填检查 ---
-    漏填合同数, leaky_files_dict = run_leaky_check(
-        zd_df, contract_col_zd, contracts_seen_all_sheets
+    return get_job_manager().submit(audit, key=run_key, owner=st.session_state.cache_ns_app1)
+
+
+def current_job():
+    """本会话正在查看的任务：优先取 session，其次取网址里的 ?job=（刷新页面后重新连接）。"""
+    job_id = st.session_state.get('audit_job_app1') or st.query_params.get("job")
+    job = get_job_manager().get(job_id) if job_id else None
+    if job is None and "job" in st.query_params:
+        del st.query_params["job"]  # 任务已过期（或服务重启过）
+    return job
+
+
+def job_outputs_alive(job):
+    """已完成任务的报告是否都还在输出目录里（可能已按 TTL / 容量淘汰）。"""
+    return job.status == "done" and all(
+        not hasattr(data, "exists") or data.exists() for _, data in job.result[0]
     )
-    
-    all_generated_files.append(leaky_files_dict["leaky_full"])
-    if leaky_files_dict["leaky_only"][0] is not None:
-        all_generated_files.append(leaky_files_dict["leaky_only"])
-
-    # --- 6. 返回所有结果 ---
-    stats_summary = {
-        "total_all": total_all,
-        "elapsed_all": elapsed_all,
-        "漏填合同数": 漏填合同数
+
+
+def replay_logs(logs):
+    for level, text in logs:
+        getattr(st, level)(text)
+
+
+@st.fragment(run_every=1.0)
+def show_job_progress(job_id):
+    """每秒刷新一次的任务进度（只重跑这个片段）；任务结束后整页重跑以展示结果。"""
+    job = get_job_manager().get(job_id)
+    if job is None or job.done:
+        st.rerun(scope="app")
+    snap = job.snapshot()
+    if snap["status"] == "queued":
+        st.info(
+            f"⏳ 当前已有 {get_admission_gate().max_running} 个审核在运行，您排在第 {snap['queue_position'] or 1} 位"
+            f"（已等待 {snap['elapsed']:.0f} 秒），轮到后自动开始。可以刷新或稍后再打开本页面，审核不会中断。"
+        )
+        return
+    replay_logs(snap["logs"])
+    st.progress(snap["progress"], text=snap["text"] or "正在执行审核，请稍候...")
+    if snap["sheets"]:
+        st.dataframe(
+            pd.DataFrame([
+                {"sheet": kw, "进度": f"{frac:.0%}", "当前": text} for kw, (frac, text) in snap["sheets"].items()
+            ]),
+            hide_index=True, use_container_width=True,
+        )
+    st.caption(f"任务 {snap['id']} 已运行 {snap['elapsed']:.0f} 秒。刷新页面后会自动重新连接到这个任务。")
+
+
+def show_metrics(metrics):
+    """可折叠的运行指标明细：各阶段、各 sheet、各比对列，以及可选的 cProfile 热点；可导出 JSON。"""
+    peak = f"，进程内存峰值 {metrics['peak_rss_mb']:.0f} MB" if metrics["peak_rss_mb"] else ""
+    with st.expander(f"⏱️ 运行指标：总耗时 {metrics['total_seconds']:.2f} 秒{peak}"):
+        st.markdown("**各阶段**（read=解析文件，prepare=参考表预处理，sheet_checks=四个 sheet 比对+标注+保存，leaky=漏填检查）")
+        st.dataframe(
+            pd.DataFrame(metrics["stages"]).rename(columns={
+                "name": "阶段", "seconds": "耗时（秒）", "rows": "行数", "peak_rss_mb": "内存峰值（MB）", "cached": "命中缓存",
+                "source": "来源", "frame_mb": "数据占用（MB）"
+            }),
+            hide_index=True, use_container_width=True
+        )
+        st.markdown("**各 sheet 分阶段耗时（秒）**")
+        st.dataframe(
+            pd.DataFrame([
+                {"sheet": name, "行数": s["rows"], "总耗时": s["seconds"], "命中缓存": s["cached"], **s["phases"]}
+                for name, s in metrics["sheets"].items()
+            ]),
+            hide_index=True, use_container_width=True
+        )
+        st.markdown("**各比对列（四个 sheet 合计）**")
+        st.dataframe(
+            pd.DataFrame([
+                {"比对列": label, "耗时（秒）": c["seconds"], "比对行数": c["rows"], "错误数": c["errors"]}
+                for label, c in sorted(metrics["columns"].items(), key=lambda kv: -kv[1]["seconds"])
+            ]),
+            hide_index=True, use_container_width=True
+        )
+        if metrics.get("profile"):
+            st.markdown("**cProfile 热点函数（按累计耗时）**")
+            st.dataframe(pd.DataFrame(metrics["profile"]["top"]), hide_index=True, use_container_width=True)
+        st.download_button(
+            "📥 导出运行指标 JSON",
+            data=json.dumps(metrics, ensure_ascii=False, indent=2, default=str),
+            file_name="审核运行指标.json",
+            mime="application/json",
+            key="download_metrics_json",
+        )
+
+def show_job(job):
+    """展示一个后台任务：未结束时显示进度（自动刷新）；失败时抛出任务的异常；完成时展示统计与下载。"""
+    if not job.done:
+        show_job_progress(job.id)
+        return
+    if job.status == "failed":
+        raise job.error
+    all_files, stats = job.result
+
+    # 1. 回放审核日志，显示统计摘要
+    replay_logs(job.snapshot()["logs"])
+    queued = f"（排队 {job.queued_seconds:.0f} 秒）" if job.queued_seconds >= 1 else ""
+    st.success(f"🎯 全部审核完成，共 {stats['total_all']} 处错误，总耗时 {stats['elapsed_total']:.2f} 秒{queued}。")
+    st.warning(f"⚠️ 共发现 {stats['漏填合同数']} 个合同在记录表中未出现（已排除车管家、联合租赁、驻店）")
+    if stats.get("近似匹配数"):
+        st.info(f"🔎 {stats['近似匹配数']} 个找不到的合同键有近似的已知合同键（可能是录入错误），见「合同键近似匹配候选.xlsx」")
+    show_metrics(stats["metrics"])
+
+    # 2. 显示所有下载按钮
+    st.divider()
+    st.subheader("📤 下载审核结果文件")
+
+    # (新) 报告都在磁盘上：页面只读入选中的一份（下载按钮的数据会留在内存里），
+    # 不再一次把全部报告放进每个会话
+    output_store = get_output_store()
+    handles = {
+        filename: data if hasattr(data, "open") else output_store.put(filename, data)
+        for (filename, data) in all_files if filename and data
     }
-    
-    return all_generated_files, stats_summary
+    chosen = st.selectbox(
+        "选择要下载的文件",
+        list(handles),
+        format_func=lambda name: f"{name}（{handles[name].size / 1024:.0f} KB）",
+        key="download_choice",
+    )
+    st.download_button(
+        label=f"📥 下载 {chosen}",
+        data=handles[chosen].getvalue(),
+        file_name=chosen,
+        key="download_btn_selected"
+    )
+    if st.toggle("📦 打包下载全部报告（ZIP）", key="download_zip_toggle"):
+        zip_handle = output_store.zip(handles.values(), "审核结果_全部报告.zip")
+        st.download_button(
+            label=f"📥 下载全部报告 ZIP（{zip_handle.size / 1024 / 1024:.1f} MB）",
+            data=zip_handle.getvalue(),
+            file_name=zip_handle.filename,
+            mime="application/zip",
+            key="download_btn_zip"
+        )
+
+    st.success("✅ 所有检查、标注与导出完成！")
+
+
+def show_job_safely(job):
+    """show_job 外加错误提示；任务失败时重置审核状态，再次点击“开始审核”会重新提交。"""
+    try:
+        show_job(job)
+    except FileNotFoundError as e:
+        st.error(f"❌ 文件查找失败: {e}")
+        st.info("请确保您上传了所有必需的文件（月重卡、放款明细、字段、二次明细）。")
+        st.session_state.audit_run_app1 = False 
+    except ValueError as e:
+        st.error(f"❌ Sheet 查找失败: {e}")
+        st.info(f"请确保您的Excel文件包含必需的 sheet（例如 '威田', '重卡'）。错误详情: {e}")
+        st.session_state.audit_run_app1 = False
+    except Exception as e:
+        st.error(f"❌ 审核过程中发生未知错误: {e}")
+        st.exception(e)
+        st.session_state.audit_run_app1 = False
 
 # =====================================
 # 🏁 应用标题与说明 (重构版)
@@ -526,18 +375,23 @@ uploaded_files = st.file_uploader(
 def reboot_app1():
     """
     一个用于“重新上传”按钮的回调函数。
-    它会清除所有缓存和 session 状态，让 app 恢复到初始状态。
+    它只清除本会话的 session 状态和本会话命名空间下的审核缓存，让 app 恢复到初始状态。
+    (其他用户的缓存条目不受影响)
     """
-    # 1. 清除函数缓存
-    run_full_audit.clear()
-    
+    # 1. 清掉本会话的缓存命名空间与后台预解析
+    if 'cache_ns_app1' in st.session_state:
+        get_audit_cache().clear_namespace(st.session_state.cache_ns_app1)
+        get_prefetcher().discard(st.session_state.cache_ns_app1)
+
     # 2. 定义需要从 session_state 中清除的 key
-    keys_to_delete = ['audit_run_app1', 'uploader_app1'] # <--- 'uploader_app1' 是关键
+    keys_to_delete = ['audit_run_app1', 'uploader_app1', 'audit_job_app1', 'upload_digests_app1'] # <--- 'uploader_app1' 是关键
     
-    # 3. 循环删除
+    # 3. 循环删除（网址里的任务 id 也一并去掉，刷新后不再重新连接）
     for key in keys_to_delete:
         if key in st.session_state:
             del st.session_state[key]
+    if "job" in st.query_params:
+        del st.query_params["job"]
     
     # (不需要 st.rerun(), on_click 会自动触发)
 
@@ -548,12 +402,22 @@ def reboot_app1():
 # --- VVVV (【核心修改】把 Reboot 按钮移到最前面) VVVV ---
 # 无论是否上传文件，始终显示 Reboot 按钮
 # (我们用 st.empty() 作为一个小技巧来控制它的位置，或者直接放在 uploader 下面)
-st.button("🔄 先按这个刷新缓存", on_click=reboot_app1, use_container_width=True)
+st.button("🔄 重新上传文件", on_click=reboot_app1, use_container_width=True)
 st.divider() # 添加一个分隔线
 # --- ^^^^ (修改结束) ^^^^ ---
 
+job = current_job()
+
+# (新) 文件一上传就在后台预解析（参考表顺带标准化）；移除或替换的文件取消对应的预解析
+if uploaded_files or 'cache_ns_app1' in st.session_state:
+    prefetch_uploads(uploaded_files or [])
 
 if not uploaded_files or len(uploaded_files) < 4:
+    # (新) 刷新页面后上传框是空的：网址里带着任务 id 时，直接重新连接到那个任务
+    if job is not None:
+        st.info(f"🔗 已重新连接到审核任务 {job.id}。")
+        show_job_safely(job)
+        st.stop()
     st.warning("⚠️ 请上传所有 4 个文件后继续")
     # (健壮性：如果用户清空了文件, 也重置审核状态)
     if 'audit_run_app1' in st.session_state:
@@ -561,55 +425,32 @@ if not uploaded_files or len(uploaded_files) < 4:
     st.stop()
 else:
     st.success("✅ 文件上传完成")
+    prefetch_status = get_prefetcher().status(st.session_state.cache_ns_app1)
+    if prefetch_status:
+        state_labels = {"queued": "排队中", "running": "解析中", "done": "已就绪", "taken": "已使用", "failed": "未成功", "cancelled": "已取消"}
+        role_labels = {'main': "月重卡", **audit_engine.REF_FILE_KEYWORDS}
+        st.caption("⏩ 后台预解析：" + "，".join(
+            f"{role_labels.get(role, role)} {state_labels.get(state, state)}" for role, (state, _) in prefetch_status.items()
+        ))
     
     # (新) “开始审核”按钮
-    if st.button("🚀 开始审核", type="primary", use_container_width=True):
+    start_clicked = st.button("🚀 开始审核", type="primary", use_container_width=True)
+    if start_clicked:
         # 将运行状态存入 session state
         st.session_state.audit_run_app1 = True 
         # (点击按钮会自动 rerun)
+    profile_run = st.checkbox("🔬 记录本次运行的性能剖析（cProfile，sheet 检查改为串行，会略慢）", value=AUDIT_PROFILE)
+    incremental_run = st.checkbox("🔁 增量模式（只重新比较与上次审核相比有变化的行）", value=AUDIT_INCREMENTAL)
     
     # (注意：Reboot 按钮已移到 if 块之外)
 
-    # (新) 只有在 "开始审核" 被点击后才执行
+    # (新) 只有在 "开始审核" 被点击后才执行：审核在后台任务中运行，
+    # 同一组文件和选项的任务已经在跑（或已完成、报告仍在）时直接沿用，不会重新计算
     if 'audit_run_app1' in st.session_state and st.session_state.audit_run_app1:
-        try:
-            # 1. (新) 调用缓存的审核函数
-            all_files, stats = run_full_audit(uploaded_files)
-
-            # 2. (新) 显示统计摘要
-            st.success(f"🎯 全部审核完成，共 {stats['total_all']} 处错误，总耗时 {stats['elapsed_all']:.2f} 秒。")
-            st.warning(f"⚠️ 共发现 {stats['漏填合同数']} 个合同在记录表中未出现（已排除车管家、联合租赁、驻店）")
-            
-            # 3. (新) 显示所有下载按钮
-            st.divider()
-            st.subheader("📤 下载审核结果文件")
-            
-            # (新) 将下载按钮放入两列
-            cols_dl = st.columns(2) 
-            col_idx = 0
-            
-            for (filename, data) in all_files:
-                if filename and data: 
-                    with cols_dl[col_idx % 2]:
-                        st.download_button(
-                            label=f"📥 下载 {filename}",
-                            data=data,
-                            file_name=filename,
-                            key=f"download_btn_{filename}" 
-                        )
-                    col_idx += 1
-            
-            st.success("✅ 所有检查、标注与导出完成！")
-            
-        except FileNotFoundError as e:
-            st.error(f"❌ 文件查找失败: {e}")
-            st.info("请确保您上传了所有必需的文件（月重卡、放款明细、字段、二次明细）。")
-            st.session_state.audit_run_app1 = False 
-        except ValueError as e:
-            st.error(f"❌ Sheet 查找失败: {e}")
-            st.info(f"请确保您的Excel文件包含必需的 sheet（例如 '威田', '重卡'）。错误详情: {e}")
-            st.session_state.audit_run_app1 = False
-        except Exception as e:
-            st.error(f"❌ 审核过程中发生未知错误: {e}")
-            st.exception(e)
-            st.session_state.audit_run_app1 = False
+        session_cache()  # 确保本会话已分配缓存命名空间
+        run_key = (tuple(upload_digests(uploaded_files)), profile_run, incremental_run)
+        if job is None or job.key != run_key or (start_clicked and job.status == "failed") or (job.done and not job_outputs_alive(job)):
+            job = submit_audit(uploaded_files, run_key, profile=profile_run, incremental=incremental_run)
+            st.session_state.audit_job_app1 = job.id
+            st.query_params["job"] = job.id
+        show_job_safely(job)
@@ -0,0 +1,67 @@
+# =====================================
+# 🚦 审核准入控制：同时运行的审核数有上限，其余按先来后到排队
+# =====================================
+"""
+Streamlit 服务是所有用户共用的一个进程。月底多人同时审核时，几个重量级审核一起跑
+会互相抢 CPU 和内存，谁都跑不完。AdmissionGate 限制同时运行的审核数，其余的排队：
+
+    gate = AdmissionGate(max_running=2)
+    with gate.slot(on_wait=lambda position, waited: ...):   # 排队时每隔 poll 秒回调一次
+        run_full_audit(...)
+
+position 从 1 开始，表示前面还有 position - 1 个人在等。on_wait 抛出异常时排队的票据随之撤销，
+不会占着队伍（网页中审核由后台任务提交，见 audit_jobs.JobManager，排队位置记在任务上）。
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+
+class AdmissionGate:
+    """先进先出的计数信号量，可以查询排队位置。线程安全。"""
+
+    def __init__(self, max_running=2):
+        self.max_running = max(1, int(max_running))
+        self._cond = threading.Condition()
+        self._queue = []  # 等待中的票据，队首最先放行
+        self._running = 0
+
+    def snapshot(self):
+        """{"running": 正在运行的审核数, "waiting": 排队数, "max_running": 上限}"""
+        with self._cond:
+            return {"running": self._running, "waiting": len(self._queue), "max_running": self.max_running}
+
+    @contextmanager
+    def slot(self, on_wait=None, poll=0.5):
+        """
+        取得一个运行名额（yield 出排队等待的秒数），退出时归还。
+        名额已满时排队，每 poll 秒调用一次 on_wait(position, waited_seconds)。
+        """
+        ticket = object()
+        start = time.time()
+        admitted = False
+        with self._cond:
+            self._queue.append(ticket)
+        try:
+            while True:
+                with self._cond:
+                    if self._queue[0] is ticket and self._running < self.max_running:
+                        self._queue.pop(0)
+                        self._running += 1
+                        admitted = True
+                        break
+                    position = self._queue.index(ticket) + 1
+                # 回调放在锁外：它可能很慢，也可能抛出异常（页面被关闭）
+                if on_wait is not None:
+                    on_wait(position, time.time() - start)
+                with self._cond:
+                    self._cond.wait(poll)
+            yield time.time() - start
+        finally:
+            with self._cond:
+                if admitted:
+                    self._running -= 1
+                elif ticket in self._queue:
+                    self._queue.remove(ticket)
+                self._cond.notify_all()
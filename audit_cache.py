@@ -0,0 +1,241 @@
+# =====================================
+# 🗄️ 审核缓存层：按文件内容摘要寻址 + LRU 淘汰
+# =====================================
+"""
+缓存键由「上传文件的内容摘要 + 映射配置摘要」组成，
+因此同一份文件重新上传会直接命中，换了文件则一定不会拿到旧结果，
+不再需要任何人去按全局的“刷新缓存”按钮。
+
+多个用户共用一个进程时，每个会话通过 cache.namespace(会话 id) 拿到自己的视图：
+条目记在各自的命名空间下，共享同一个全局内存预算，但单个会话最多占 max_bytes；
+某个用户“重新上传”只清掉自己命名空间里的条目（cache.clear_namespace）。
+"""
+
+import hashlib
+import json
+import sys
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+# openpyxl 可编辑模式下每个单元格约占的字节数（月重卡实测约 370），用于估算预解析工作簿的内存
+WORKBOOK_CELL_BYTES = 400
+
+
+def file_digest(f):
+    """返回上传文件（UploadedFile / BytesIO / bytes）内容的 sha256 摘要。"""
+    if isinstance(f, (bytes, bytearray, memoryview)):
+        data = f
+    elif hasattr(f, "getvalue"):
+        data = f.getvalue()
+    else:
+        pos = f.tell()
+        f.seek(0)
+        data = f.read()
+        f.seek(pos)
+    return hashlib.sha256(data).hexdigest()
+
+
+def config_digest(obj):
+    """映射配置等普通 Python 对象的稳定摘要（字典键排序后再哈希）。"""
+    payload = json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def array_nbytes(values):
+    """ndarray / ExtensionArray 占用的字节数；object 数组连同其中的 Python 对象（字符串等）一起计算。"""
+    if values.dtype == object:
+        return int(pd.Series(values, copy=False).memory_usage(index=False, deep=True))
+    return int(values.nbytes)
+
+
+def estimate_size(obj):
+    """
+    粗略估算缓存对象占用的字节数，用于内存预算。
+    自定义的缓存对象（如 RefIndex）提供 nbytes 属性，给出其中数组与表的总大小；
+    openpyxl 工作簿按单元格数估算。
+    """
+    if obj is None:
+        return 0
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    if isinstance(obj, pd.Series):
+        return int(obj.memory_usage(index=True, deep=True))
+    if isinstance(obj, pd.Index):
+        return int(obj.memory_usage(deep=True))
+    if isinstance(obj, (np.ndarray, pd.api.extensions.ExtensionArray)):
+        return array_nbytes(obj)
+    if isinstance(obj, BytesIO):
+        return obj.getbuffer().nbytes
+    if isinstance(obj, (bytes, bytearray)):
+        return len(obj)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(estimate_size(k) + estimate_size(v) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return sys.getsizeof(obj) + sum(estimate_size(v) for v in obj)
+    if hasattr(obj, "nbytes"):
+        return int(obj.nbytes)
+    if hasattr(obj, "worksheets"):
+        return sum(ws.max_row * ws.max_column for ws in obj.worksheets) * WORKBOOK_CELL_BYTES
+    return sys.getsizeof(obj)
+
+
+class LRUCache:
+    """
+    线程安全的 LRU 缓存，同时受「条目数」和「估算字节数」两个预算约束。
+    超出任一预算时，从最久未使用的条目开始淘汰。
+    """
+
+    def __init__(self, max_bytes=1024 ** 3, max_entries=128):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._data = OrderedDict()  # key -> (value, size, namespace)
+        self._bytes = 0
+        self._ns_bytes = {}  # 命名空间 -> 估算字节数
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._data
+
+    def __len__(self):
+        with self._lock:
+            return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key][0]
+
+    def put(self, key, value, namespace=None, namespace_max_bytes=None):
+        """
+        写入一个条目。namespace 给出时条目记在该命名空间下；
+        namespace_max_bytes 给出时先淘汰该命名空间自己最久未用的条目，使其不超过这个配额。
+        """
+        size = estimate_size(value)
+        limit = self.max_bytes if namespace_max_bytes is None else min(self.max_bytes, namespace_max_bytes)
+        with self._lock:
+            if key in self._data:
+                self._drop(key)
+            # 单个条目本身就超过预算时不缓存，避免把其它条目全部挤掉
+            if size > limit:
+                return value
+            self._data[key] = (value, size, namespace)
+            self._bytes += size
+            self._ns_bytes[namespace] = self._ns_bytes.get(namespace, 0) + size
+            if namespace_max_bytes is not None:
+                self._evict_namespace(namespace, namespace_max_bytes)
+            self._evict()
+        return value
+
+    def pop(self, key, default=None):
+        """取出并删除一个条目（只能取用一次的结果，如预解析的工作簿）。"""
+        with self._lock:
+            if key not in self._data:
+                return default
+            value = self._data[key][0]
+            self._drop(key)
+            return value
+
+    def get_or_compute(self, key, compute):
+        """命中则直接返回，否则调用 compute() 计算并写入缓存。"""
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = self.put(key, compute())
+        return value
+
+    def _drop(self, key):
+        _, size, namespace = self._data.pop(key)
+        self._bytes -= size
+        self._ns_bytes[namespace] -= size
+        if not self._ns_bytes[namespace] and namespace is not None:
+            del self._ns_bytes[namespace]
+
+    def _evict(self):
+        while self._data and (len(self._data) > self.max_entries or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._data)))
+
+    def _evict_namespace(self, namespace, max_bytes):
+        if self._ns_bytes.get(namespace, 0) <= max_bytes:
+            return
+        for key in [k for k, entry in self._data.items() if entry[2] == namespace]:
+            if self._ns_bytes.get(namespace, 0) <= max_bytes:
+                break
+            self._drop(key)
+
+    def namespace(self, name, max_bytes=None):
+        """返回命名空间 name 的视图（CacheNamespace），接口与 LRUCache 相同，可直接传给审核引擎。"""
+        return CacheNamespace(self, name, max_bytes)
+
+    def clear_namespace(self, name):
+        """只删除命名空间 name 下的条目，其他会话的缓存不受影响。"""
+        with self._lock:
+            for key in [k for k, entry in self._data.items() if entry[2] == name]:
+                self._drop(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._bytes = 0
+            self._ns_bytes.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._data),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "namespaces": {ns: b for ns, b in self._ns_bytes.items() if ns is not None},
+            }
+
+
+class CacheNamespace:
+    """
+    LRUCache 中一个命名空间（通常是一个 Streamlit 会话）的视图。
+    键自动加上命名空间前缀，不同会话即使上传同样的文件也互不可见；
+    淘汰仍由底层缓存统一进行，max_bytes 是本命名空间的配额。
+    """
+
+    def __init__(self, cache, name, max_bytes=None):
+        self.cache = cache
+        self.name = name
+        self.max_bytes = max_bytes
+
+    def _key(self, key):
+        return ("ns", self.name, key)
+
+    def __contains__(self, key):
+        return self._key(key) in self.cache
+
+    def get(self, key, default=None):
+        return self.cache.get(self._key(key), default)
+
+    def put(self, key, value):
+        return self.cache.put(self._key(key), value, namespace=self.name, namespace_max_bytes=self.max_bytes)
+
+    def pop(self, key, default=None):
+        return self.cache.pop(self._key(key), default)
+
+    def get_or_compute(self, key, compute):
+        sentinel = object()
+        value = self.get(key, sentinel)
+        if value is sentinel:
+            value = self.put(key, compute())
+        return value
+
+    def clear(self):
+        self.cache.clear_namespace(self.name)
+
+    def stats(self):
+        return {"bytes": self.cache.stats()["namespaces"].get(self.name, 0)}
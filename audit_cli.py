@@ -0,0 +1,212 @@
+# =====================================
+# 🖥️ 命令行批量审核：不经浏览器处理多套月末文件
+# =====================================
+"""
+用法：
+    python audit_cli.py 2024-10/ 2024-11/ -o 审核结果 -j 4
+
+每个输入目录本身若包含 月重卡 / 放款明细 / 字段 / 二次明细 四个 xlsx，即视为一套文件；
+否则依次查看它的直接子目录，每个齐全的子目录算一套。
+各套文件并行审核（-j），结果写到 <输出目录>/<套名>/ 下，汇总写到 <输出目录>/审核汇总.json。
+
+    python audit_cli.py 2024-10/ 2024-11/ --incremental
+
+--incremental 时各套按发现的顺序（子目录按名称排序）依次审核，共用一个指纹库：
+每套只重新比较与上一套相比有变化的行，适合逐月运行。
+
+--ref-store 时参考文件（放款明细 / 字段 / 二次明细）按内容摘要存入列式存储，
+内容没变的参考文件在之后的运行中不再解析 Excel；也可以先单独入库：
+    python ref_store.py 放款明细.xlsx 字段.xlsx 二次明细.xlsx
+
+--stream [ROWS] 时月重卡按块读取、比对并逐行写出报告，峰值内存由块大小决定而不是行数，
+适合几十万行的月重卡（标注版只保留值与标色，不保留原格式）。
+
+--rules FILE 使用另一份比对规则（默认 audit_rules.json，格式见 audit_rules.py）。
+
+--ledger parquet|jsonl 时另写“审核错误明细”：每处比对错误、每个漏填合同一条记录（字段见 error_ledger.py），
+下游对账程序直接读取，不必解析标色的工作簿；只需要明细时加 --no-workbooks，不生成 xlsx 报告：
+    python audit_cli.py 2024-10/ --ledger parquet --no-workbooks
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+
+from audit_engine import FILE_KEYWORDS, Reporter, run_full_audit
+from error_ledger import LEDGER_FORMATS
+from output_store import CHUNK, OutputHandle
+
+
+class ConsoleReporter(Reporter):
+    """日志逐行打印到终端，前面加上套名，便于区分并行输出；逐列进度不打印。"""
+
+    def __init__(self, label):
+        self.label = label
+
+    def log(self, level, text):
+        stream = sys.stderr if level in ("warning", "error") else sys.stdout
+        print(f"[{self.label}] {text}", file=stream, flush=True)
+
+
+def list_xlsx(folder):
+    """目录下的 xlsx 文件（忽略 Excel 打开时产生的 ~$ 临时文件）。"""
+    return sorted(
+        os.path.join(folder, name) for name in os.listdir(folder)
+        if name.lower().endswith(".xlsx") and not name.startswith("~$")
+    )
+
+
+def is_complete_set(folder):
+    """目录中四类文件是否齐全（与 find_file 相同，按文件名关键词判断）。"""
+    names = [os.path.basename(p) for p in list_xlsx(folder)]
+    return all(any(kw in n for n in names) for kw in FILE_KEYWORDS)
+
+
+def discover_sets(inputs):
+    """把命令行给出的目录展开为 [(套名, 目录)]，套名重复时追加序号。"""
+    sets = []
+    for root in inputs:
+        if not os.path.isdir(root):
+            print(f"⚠️ 不是目录，跳过: {root}", file=sys.stderr)
+            continue
+        if is_complete_set(root):
+            sets.append(root)
+            continue
+        subdirs = sorted(os.path.join(root, d) for d in os.listdir(root) if os.path.isdir(os.path.join(root, d)))
+        found = [d for d in subdirs if is_complete_set(d)]
+        if not found:
+            print(f"⚠️ 目录中没有找到完整的一套文件（{'、'.join(FILE_KEYWORDS)}）: {root}", file=sys.stderr)
+        sets.extend(found)
+
+    named, used = [], {}
+    for folder in sets:
+        name = os.path.basename(os.path.normpath(os.path.abspath(folder)))
+        used[name] = used.get(name, 0) + 1
+        if used[name] > 1:
+            name = f"{name}_{used[name]}"
+        named.append((name, folder))
+    return named
+
+
+def audit_one_set(name, folder, out_dir, workers, executor, leaky_formats, profile=False, incremental=None,
+                  ref_store=None, stream_rows=None, rules=None, ledger=None, workbooks=True):
+    """
+    审核一套文件并把结果写到 out_dir，返回该套的汇总（失败时带 error 字段）。
+    运行指标（各阶段耗时/行数/内存、逐列比对统计，profile 时含 cProfile 热点）写到 out_dir/审核运行指标.json。
+    stream_rows 给出时使用流式模式，报告先落到输出目录（OutputStore 默认目录）再逐块拷贝到 out_dir。
+    rules 为比对规则文件路径，None 时使用默认规则。
+    ledger 给出时另写错误明细（"parquet" / "jsonl"）；workbooks=False 时不生成 xlsx 报告。
+    """
+    reporter = ConsoleReporter(name)
+    start = time.time()
+    summary = {"name": name, "input": os.path.abspath(folder), "output": os.path.abspath(out_dir)}
+    try:
+        with ExitStack() as stack:
+            files = [stack.enter_context(open(p, "rb")) for p in list_xlsx(folder)]
+            all_files, stats = run_full_audit(
+                files, reporter=reporter, workers=workers, executor=executor, leaky_formats=leaky_formats,
+                profile=profile, incremental=incremental, ref_store=ref_store,
+                stream_rows=stream_rows, output_store=True if stream_rows else None, rules=rules,
+                ledger=ledger, workbooks=workbooks,
+            )
+        os.makedirs(out_dir, exist_ok=True)
+        written = []
+        for filename, data in all_files:
+            if filename and data is not None:
+                with open(os.path.join(out_dir, filename), "wb") as fh:
+                    if isinstance(data, OutputHandle):
+                        with data.open() as src:
+                            shutil.copyfileobj(src, fh, CHUNK)
+                    else:
+                        fh.write(data.getvalue())
+                written.append(filename)
+        with open(os.path.join(out_dir, "审核运行指标.json"), "w", encoding="utf-8") as fh:
+            json.dump(stats["metrics"], fh, ensure_ascii=False, indent=2, default=str)
+        summary.update(
+            total_errors=int(stats["total_all"]),
+            missing_contracts=int(stats["漏填合同数"]),
+            near_matches=int(stats["近似匹配数"]),
+            ledger_records=stats["明细条数"],
+            files=written,
+            peak_rss_mb=stats["metrics"]["peak_rss_mb"],
+        )
+        reporter.log("success", f"🎯 完成：{stats['total_all']} 处错误，漏填 {stats['漏填合同数']} 个，结果写入 {out_dir}")
+    except Exception as e:
+        summary["error"] = f"{type(e).__name__}: {e}"
+        reporter.log("error", f"❌ 审核失败: {e}")
+    summary["elapsed"] = round(time.time() - start, 2)
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="批量审核 月重卡 / 放款明细 / 字段 / 二次明细 文件组")
+    parser.add_argument("inputs", nargs="+", help="一套文件所在的目录，或包含多套文件子目录的目录")
+    parser.add_argument("-o", "--output", default="审核结果", help="输出目录（默认 ./审核结果）")
+    parser.add_argument("-j", "--jobs", type=int, default=max(1, os.cpu_count() or 1),
+                        help="同时审核的文件组数（默认 CPU 核数）")
+    parser.add_argument("--sheet-workers", type=int, default=1,
+                        help="每套文件内部并行检查的 sheet 数（默认 1，批量时通常按套并行即可）")
+    parser.add_argument("--executor", choices=["process", "thread"], default="process",
+                        help="sheet 级并行方式（--sheet-workers > 1 时生效）")
+    parser.add_argument("--formats", default="", help="漏填报告额外导出的格式，如 csv,parquet")
+    parser.add_argument("--profile", action="store_true", help="用 cProfile 剖析每套文件的审核，热点写入 审核运行指标.json")
+    parser.add_argument("--incremental", nargs="?", const=True, default=None, metavar="DB",
+                        help="增量模式：只重新比较与上次审核相比有变化的行；可指定指纹库路径（默认 ~/.cache/contract_audit/）")
+    parser.add_argument("--ref-store", nargs="?", const=True, default=None, metavar="DIR",
+                        help="参考文件按内容摘要存入列式存储，未变化的不再解析；可指定目录（默认 ~/.cache/contract_audit/ref_store）")
+    parser.add_argument("--stream", nargs="?", type=int, const=20000, default=None, metavar="ROWS",
+                        help="流式模式：主表按块读取比对、报告逐行写出，内存不随行数增长（默认每块 20000 行），"
+                             "适合几十万行的月重卡；标注版不保留原格式")
+    parser.add_argument("--rules", default=None, metavar="FILE",
+                        help="比对规则文件（默认 audit_rules.json，也可用环境变量 AUDIT_RULES 指定）")
+    parser.add_argument("--ledger", choices=LEDGER_FORMATS, default=None,
+                        help="另写一份错误明细（每处错误、每个漏填合同一条记录），供下游程序直接读取")
+    parser.add_argument("--no-workbooks", dest="workbooks", action="store_false",
+                        help="不生成标注版等 xlsx 报告，只出错误明细与汇总（需配合 --ledger）")
+    args = parser.parse_args(argv)
+    if not args.workbooks and not args.ledger:
+        parser.error("--no-workbooks 需要配合 --ledger 使用")
+
+    sets = discover_sets(args.inputs)
+    if not sets:
+        print("❌ 没有可审核的文件组。", file=sys.stderr)
+        return 2
+
+    leaky_formats = tuple(f.strip() for f in args.formats.split(",") if f.strip())
+    jobs = max(1, min(args.jobs, len(sets)))
+    if args.incremental and jobs > 1:
+        # 各套共用指纹库，必须按顺序审核，后一套才能沿用前一套的结论
+        print("ℹ️ 增量模式下按顺序逐套审核。")
+        jobs = 1
+    print(f"ℹ️ 共 {len(sets)} 套文件，并行 {jobs} 套。")
+    tasks = [
+        (name, folder, os.path.join(args.output, name), args.sheet_workers, args.executor, leaky_formats, args.profile,
+         args.incremental, args.ref_store, args.stream, args.rules, args.ledger, args.workbooks)
+        for name, folder in sets
+    ]
+
+    start = time.time()
+    if jobs == 1:
+        summaries = [audit_one_set(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            summaries = list(pool.map(audit_one_set, *zip(*tasks)))
+
+    os.makedirs(args.output, exist_ok=True)
+    with open(os.path.join(args.output, "审核汇总.json"), "w", encoding="utf-8") as fh:
+        json.dump(summaries, fh, ensure_ascii=False, indent=2)
+
+    failed = [s for s in summaries if "error" in s]
+    print(f"✅ 全部完成：{len(summaries) - len(failed)} 套成功，{len(failed)} 套失败，用时 {time.time() - start:.2f} 秒。")
+    for s in failed:
+        print(f"❌ {s['name']}: {s['error']}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,1365 @@
+# =====================================
+# ⚙️ 审核引擎：与 Streamlit 无关的比对逻辑
+# =====================================
+"""
+工具函数、逐列比对、单 sheet 检查、漏填检查与整套审核流程 run_full_audit。
+不调用任何 st.* 接口，日志与进度交给可替换的 Reporter，
+因此 Streamlit 页面（app2.py）和命令行批处理（audit_cli.py）共用同一套引擎。
+"""
+
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+try:
+    import pyarrow  # noqa: F401  (合同键的 Arrow 字符串存储为可选功能)
+    KEY_DTYPE = "string[pyarrow]"
+except ImportError:
+    KEY_DTYPE = object
+
+from annotator import RED_FILL, YELLOW_FILL, MAIN_SHEET_FIRST_DATA_ROW, fill_cells, save_single_sheet
+from audit_cache import LRUCache, file_digest, config_digest
+from audit_metrics import RunMetrics, profiling
+from audit_rules import RULES, load_rules, match_column, normalize_colname
+from compare_kernel import compare_block
+from date_kernel import date_format_candidates, date_format_from_candidates
+from error_ledger import LedgerWriter, ledger_filename, ledger_format, missing_records, mismatch_records
+from incremental import FingerprintStore, IncrementalPlan
+from key_interner import KeyInterner, normalize_contract_key  # noqa: F401  (normalize_contract_key 沿用旧的导入位置)
+from near_match import NearMatchIndex
+from numeric_kernel import numeric_row_flags
+from output_store import OutputHandle, OutputStore
+from ref_index import RefIndex
+from ref_store import RefStore
+from report_writer import StreamingXlsxWriter, iter_frame_rows, export_extra_formats
+from workbook_loader import SheetChunkReader, load_workbook_sheets, required_sheet_df, resolve_workbook_sheets
+
+
+def _noop(*args, **kwargs):
+    pass
+
+
+NO_CONTRACTS = np.array([], dtype=np.int64)  # 跳过的 sheet 没有出现任何合同（驻留 id 数组）
+
+
+class Reporter:
+    """
+    审核过程的日志/进度接收者，默认静默。前端按需继承：
+    log(level, text)         - level 为 "info" / "warning" / "error" / "success" / "caption"
+    progress(fraction, text) - fraction 为 0~1 的整体进度
+    sheet_progress(sheet, fraction, text) - 单个 sheet 的进度（逐比对列更新；并行模式下同样实时上报）
+    """
+
+    def log(self, level, text):
+        pass
+
+    def progress(self, fraction, text):
+        pass
+
+    def sheet_progress(self, sheet, fraction, text):
+        pass
+
+
+# =====================================
+# 🗺️ 审核配置：文件、sheet 与比对列映射
+# =====================================
+# 比对列、容差、参考列预处理等规则见 audit_rules.json（audit_rules.RULES）；
+# 下面三个字典由规则导出，保留给按旧名字读取配置的调用方
+FILE_KEYWORDS = ["月重卡", "放款明细", "字段", "二次明细"]
+SHEET_KEYWORDS = ["二次", "部分担保", "随州", "驻店客户"]
+REF_SHEET_KEYWORDS = {prefix: source.sheet for prefix, source in RULES.sources.items()}
+REF_FILE_KEYWORDS = {prefix: source.file for prefix, source in RULES.sources.items()}
+MAPPINGS = {prefix: source.mapping for prefix, source in RULES.sources.items()}
+
+
+# =====================================
+# 🧰 工具函数区 (不变)
+# =====================================
+
+def find_file(files_list, keyword):
+    """
+    按文件名关键词定位文件（只看文件名本身，不看所在目录）。
+    找不到返回 None，由调用方统一报错。
+    """
+    for f in files_list:
+        if keyword in os.path.basename(f.name):
+            return f
+    return None 
+
+def find_col(df, keyword, exact=False):
+    pos = match_column([normalize_colname(col) for col in df.columns], keyword, exact)
+    return None if pos is None else df.columns[pos]
+
+
+def normalize_num(val):
+    if pd.isna(val): return None
+    s = str(val).replace(",", "").strip()
+    if s in ["", "-", "nan"]: return None
+    try:
+        if "%" in s: return float(s.replace("%", "")) / 100
+        return float(s)
+    except ValueError:
+        return s
+
+
+def compare_series_vec(s_main, s_ref, rule, context=None):
+    """
+    按比对规则 rule（audit_rules.Rule）逐行比较主表列与对齐后的参考列，返回出错行的布尔 Series。
+    context - 只比较部分行时传入整列的上下文（见 incremental.column_context），保证结果与整列比较一致
+    参考表中找不到合同键的行不计错误；这些键的近似候选由 run_near_match 单独报告
+    一次比较多列用 compare_kernel.compare_block（check_one_sheet 即如此），这里是单列的情形
+    """
+    errors = compare_block([s_main], [s_ref], [rule], [context])
+    return pd.Series(errors[:, 0], index=s_main.index)
+
+
+# =====================================
+# 📚 参考表预处理
+# =====================================
+def prepare_ref_df(ref_df, source, log=None, keys=None):
+    """
+    按参考来源 source（audit_rules.Source）的规则把参考表整理成 __KEY__ + 各 ref 列。
+    keys - 本次审核的驻留表（KeyInterner），合同键经它规范化，与月重卡共用记忆化；默认临时新建
+    """
+    log = log or _noop
+    keys = keys if keys is not None else KeyInterner()
+    prefix = source.prefix
+    resolved = source.resolve(ref_df.columns)
+    if not resolved.contract:
+        log("warning", f"⚠️ 在 {prefix} 参考表中未找到'合同'列，跳过此数据源。")
+        return pd.DataFrame(columns=['__KEY__'])
+        
+    std_df = pd.DataFrame()
+    std_df['__KEY__'] = keys.normalize(ref_df[resolved.contract])
+    
+    for rule, ref_col_name in resolved.columns:
+        if ref_col_name is not None:
+            std_df[rule.ref_col] = rule.prepare_ref(ref_df[ref_col_name])
+        else:
+            log("warning", f"⚠️ 在 {prefix} 参考表中未找到列 (main: '{rule.main}', ref: '{rule.ref}')")
+
+    std_df = std_df.drop_duplicates(subset=['__KEY__'], keep='first')
+    return compact_ref_df(std_df)
+
+
+CATEGORY_MAX_RATIO = 0.5  # 不同取值数 / 行数 不超过该比例的文本列转为 category
+
+
+def compact_ref_df(std_df):
+    """
+    标准化参考表的紧凑存储（取值不变，只换底层类型）：
+    合同键为 Arrow 字符串（未安装 pyarrow 时保持 object）；
+    取值很少的纯文本列（授信方、项目提报人、所属省区、城市经理 …）转为 category。数值、日期列不动。
+    """
+    out = std_df.copy(deep=False)
+    for col in out.columns:
+        s = out[col]
+        if col == '__KEY__':
+            if KEY_DTYPE is not object:
+                out[col] = s.astype(KEY_DTYPE)
+            continue
+        if s.dtype != object or len(s) == 0:
+            continue
+        values = s.dropna()
+        if values.nunique() <= len(s) * CATEGORY_MAX_RATIO and values.map(type).eq(str).all():
+            out[col] = s.astype("category")
+    return out
+
+
+def ref_columns(source):
+    """
+    prepare_ref_df 实际用到的参考列（合同列 + 各规则的参考列，与 prepare_ref_df 共用同一份解析结果），
+    返回供 load_workbook_sheets(columns=...) 按列投影读取的选择函数。
+    """
+    def select(names):
+        resolved = source.resolve(names)
+        found = [resolved.contract] + [ref_col for _, ref_col in resolved.columns]
+        return [c for c in found if c is not None]
+    return select
+
+
+def frame_mb(df):
+    """DataFrame 实际占用的内存（MB，含 object 列中的字符串）。"""
+    return round(df.memory_usage(index=True, deep=True).sum() / 1024 / 1024, 2)
+
+
+# =====================================
+# 🗃️ 参考数据持久化（RefStore）：版本号与读取/入库
+# =====================================
+def std_version(source, digest):
+    """标准化参考表的版本：源文件摘要 + 参考来源的 sheet 关键词与规则定义。"""
+    return f"{digest[:32]}_{source.digest}"
+
+
+def raw_version(source, digest):
+    """原始参考 sheet（漏填检查用的字段表）的版本：源文件摘要 + sheet 关键词。"""
+    return f"{digest[:32]}_{config_digest([source.sheet])}"
+
+
+def ref_std_key(source, digest):
+    """标准化参考表在审核缓存（LRUCache）中的键：参考来源 + 文件摘要 + 规则定义。"""
+    return ("ref_std", source.prefix, digest, source.digest)
+
+
+def read_book(role, f, rules=None, cancel=None, editable=True):
+    """
+    按角色解析一个上传文件：'main' 为月重卡（可编辑模式，供标注；editable=False 时只读解析，不保留工作簿），
+    其余为参考来源前缀。
+    放款明细 / 二次明细 只按列投影读取 prepare_ref_df 用到的列；字段表还要整表导出漏填报告，读取全部列。
+    审核与上传后的预解析（audit_prefetch）共用，两边解析结果完全相同。
+    """
+    if role == 'main':
+        return load_workbook_sheets(f, SHEET_KEYWORDS, header=1, keep_workbook=editable, cancel=cancel)
+    source = (rules or RULES).sources[role]
+    columns = None if role == 'zd' else ref_columns(source)
+    return load_workbook_sheets(f, [source.sheet], columns=columns, cancel=cancel)
+
+
+def stored_frame(ref_store, name, version, compute, columns=None):
+    """
+    返回 (DataFrame, 来源)：ref_store 中已有该版本时直接读取（只读 columns 列），来源为 "store"；
+    否则 compute() 计算后入库，来源为 "computed"。ref_store 为 None 时总是计算。
+    """
+    if ref_store is not None:
+        df = ref_store.load(name, version, columns=columns)
+        if df is not None:
+            return df, "store"
+    df = compute()
+    if ref_store is not None:
+        ref_store.save(name, version, df)
+    return df, "computed"
+
+
+def load_reference_frames(files, ref_store, log=None, rules=None):
+    """
+    把 files 中的参考文件（放款明细 / 字段 / 二次明细，缺少的跳过）预先入库，
+    返回 {前缀: "store" 已是最新 / "computed" 本次解析入库}。只有内容变了的文件才会被解析。
+    rules 为比对规则（audit_rules.RuleSet），默认 audit_rules.RULES。
+    """
+    log = log or _noop
+    rules = rules or RULES
+    sources = {}
+    for prefix, source in rules.sources.items():
+        f = find_file(files, source.file)
+        if f is None:
+            continue
+        digest = file_digest(f)
+        raw = {}
+
+        def read_raw(prefix=prefix, f=f, raw=raw, source=source):
+            if "df" not in raw:
+                # 字段表整表读取（漏填检查要导出全部列），其余参考表只读用到的列
+                columns = None if prefix == 'zd' else ref_columns(source)
+                raw["df"] = required_sheet_df(load_workbook_sheets(f, [source.sheet], columns=columns), source.sheet)
+            return raw["df"]
+
+        _, sources[prefix] = stored_frame(
+            ref_store, f"ref_std_{prefix}", std_version(source, digest),
+            lambda: prepare_ref_df(read_raw(), source, log=log),
+        )
+        if prefix == 'zd':
+            stored_frame(ref_store, "raw_zd", raw_version(source, digest), read_raw)
+        log("info", f"🗃️ {getattr(f, 'name', source.file)}：{'已是最新版本' if sources[prefix] == 'store' else '已解析入库'}")
+    return sources
+
+
+# =====================================
+# 💾 输出文件落盘（OutputStore）
+# =====================================
+def spill_files(output_store, files_dict):
+    """把 files_dict 中的 BytesIO 写入 output_store，换成 OutputHandle；output_store 为 None 时原样返回。"""
+    if output_store is None:
+        return files_dict
+    return {
+        key: (name, output_store.put(name, data) if name is not None and isinstance(data, BytesIO) else data)
+        for key, (name, data) in files_dict.items()
+    }
+
+
+def files_alive(files_dict):
+    """files_dict 中的磁盘文件是否都还在（输出目录可能已按 TTL / 容量淘汰）。"""
+    return all(data.exists() for _, data in files_dict.values() if isinstance(data, OutputHandle))
+
+
+# =====================================
+# 🧮 (修改) 单sheet检查函数 - 现在返回文件
+# =====================================
+def plan_for(columns, ref_index, mappings_all):
+    """主表表头的执行计划：只含参考表非空、且参考索引中有对应列的规则（按表头缓存，见 RuleSet.plan）。"""
+    available = [
+        rule.ref_col for source, std_df in mappings_all.values() if not std_df.empty
+        for rule in source.rules if rule.ref_col in ref_index
+    ]
+    rules = next(iter(mappings_all.values()))[0].ruleset if mappings_all else RULES
+    return rules.plan(columns, available)
+
+
+BLANK_REF_STRINGS = ["", "-", "nan", "none", "null"]
+
+
+def blank_ref_mask(rule, s_ref):
+    """skip_blank_ref 规则中参考值为空、不参与比较的行。"""
+    if not rule.skip_blank_ref:
+        return pd.Series(False, index=s_ref.index)
+    return pd.isna(s_ref) | s_ref.astype(str).str.strip().isin(BLANK_REF_STRINGS)
+
+
+def check_one_sheet(sheet_keyword, sheet_entry, wb, ref_index, mappings_all, log=None, on_progress=None, wb_lock=None,
+                    store=None, output_store=None, ledger=None, workbooks=True):
+    """
+    (已修改)
+    1. 移除 st.download_button
+    2. 返回 (stats, files_dict)
+    3. 不再自行读取文件：sheet_entry 来自 load_workbook_sheets 的单次解析结果
+    4. 标注直接写在原工作簿 wb 上（保留原格式），不再 DataFrame → BytesIO → load_workbook 往返
+    5. 参考值通过 run_full_audit 中预先构建的 ref_index 按位置对齐，不再逐 sheet merge；
+       ref_index 须已绑定到本次审核的驻留表（RefIndex.bind），合同键经 ref_index.interner 驻留
+    6. 不依赖 Streamlit：提示信息交给 log(level, text)，进度交给 on_progress(fraction, text)，
+       因此可以在线程/进程池中运行；wb_lock 用于线程模式下串行化对共享工作簿的标注与保存
+    7. “仅错误行”文件用 write-only 模式流式写出，标红在写行时完成
+    8. stats 的最后一项为本 sheet 的指标：行数、各阶段耗时（align/compare/ledger/annotate/save/error_report）
+       以及逐列的比对耗时、比对行数与错误数
+    9. store（FingerprintStore）不为空时启用增量比对，结果与全量比对完全一致
+    10. output_store（OutputStore）不为空时生成的文件直接落盘，files_dict 中为 OutputHandle
+    11. ledger（"parquet" / "jsonl"）给出时另写一份错误明细（见 error_ledger），files_dict["ledger"]；
+        workbooks=False 时不标注、不生成两份 xlsx（wb 可以为 None），只出统计与明细
+    """
+    log = log or _noop
+    on_progress = on_progress or _noop
+    start_time = time.time()
+    target_sheet = sheet_entry["sheet"]
+
+    if target_sheet is None:
+        log("warning", f"⚠️ 未找到包含「{sheet_keyword}」的sheet，跳过。")
+        return (0, None, 0, NO_CONTRACTS, {}), {} # 返回 (stats, files_dict)
+
+    if sheet_entry["error"] is not None:
+        log("error", f"❌ 读取「{sheet_keyword}」时出错: {sheet_entry['error']}")
+        return (0, None, 0, NO_CONTRACTS, {}), {}
+
+    main_df = sheet_entry["df"]
+
+    if main_df.empty:
+        log("warning", f"⚠️ 「{sheet_keyword}」为空，跳过。")
+        return (0, None, 0, NO_CONTRACTS, {}), {}
+
+    # 表头 → 执行计划（合同列 + 参与比对的规则及其列），同样的表头只解析一次
+    sheet_plan = plan_for(main_df.columns, ref_index, mappings_all)
+    contract_col_main = sheet_plan.contract
+    if not contract_col_main:
+        log("error", f"❌ 在「{sheet_keyword}」中未找到合同列。")
+        return (0, None, 0, NO_CONTRACTS, {}), {}
+
+    keys = ref_index.interner  # 本次审核的驻留表
+    key_ids = keys.intern(main_df[contract_col_main])
+    contracts_seen = np.unique(key_ids)  # 本 sheet 出现过的合同（驻留 id）
+
+    # 分阶段耗时与逐列比对统计，随结果返回，由 run_full_audit 汇总到 RunMetrics
+    sheet_metrics = {"rows": len(main_df), "phases": {"align": 0.0, "compare": 0.0}, "columns": {}}
+    phases = sheet_metrics["phases"]
+
+    # 一次查找得到每行在参考索引中的整数 id，之后各列按位置 take，不再 merge/复制主表
+    phase_start = time.time()
+    main_ids = ref_index.lookup_ids(key_ids)
+    phases["align"] += time.time() - phase_start
+    
+    # 按执行计划对齐参考值
+    rules = []  # [(规则名, 规则, 主表列名, 对齐后的参考列)]
+    for step in sheet_plan.steps:
+        phase_start = time.time()
+        s_ref = ref_index.take(step.rule.ref_col, main_ids, index=main_df.index)
+        phases["align"] += time.time() - phase_start
+        rules.append((step.rule.label, step.rule, step.column, s_ref))
+    excel_cols = np.array([step.position + 1 for step in sheet_plan.steps], dtype=np.int64)  # 每条规则标红的 Excel 列号
+
+    # 增量模式：指纹没变的行沿用上次结论，只重新比较新增/改动的行
+    plan = None
+    if store is not None:
+        phase_start = time.time()
+        plan = IncrementalPlan(
+            store, sheet_keyword, keys.keys[key_ids],
+            [(label, rule, main_df[main_col], s_ref) for label, rule, main_col, s_ref in rules],
+        )
+        phases["fingerprint"] = time.time() - phase_start
+
+    # 全部规则一次比对，得到 行 × 规则 的错误矩阵（增量模式逐规则沿用/重算，结果填入同一个矩阵）
+    on_progress(0.0, f"检查「{sheet_keyword}」: 比对 {len(rules)} 列...")
+    skip = np.zeros((len(main_df), len(rules)), dtype=bool, order="F")
+    for i, (_, rule, _, s_ref) in enumerate(rules):
+        skip[:, i] = blank_ref_mask(rule, s_ref)
+    col_seconds = np.zeros(len(rules))
+    phase_start = time.time()
+    if plan is not None:
+        errors = np.zeros_like(skip)
+        for i, (label, _, _, _) in enumerate(rules):
+            col_start = time.time()
+            errors[:, i] = plan.compare(i, compare_series_vec).to_numpy(dtype=bool)
+            col_seconds[i] = time.time() - col_start
+            on_progress((i + 1) / len(rules), f"检查「{sheet_keyword}」: {label}...")
+    else:
+        errors = compare_block(
+            [main_df[main_col] for _, _, main_col, _ in rules], [s_ref for _, _, _, s_ref in rules],
+            [rule for _, rule, _, _ in rules], seconds=col_seconds,
+        )
+    errors &= ~skip
+    phases["compare"] += time.time() - phase_start
+
+    skipped, found = skip.sum(axis=0), errors.sum(axis=0)
+    for i, (label, _, _, _) in enumerate(rules):
+        if plan is not None:
+            plan.record(i, errors[:, i])
+        sheet_metrics["columns"][label] = {
+            "seconds": float(col_seconds[i]),
+            "rows": int(len(main_df) - skipped[i]),
+            "errors": int(found[i]),
+        }
+    skip_blank_ref = int(skipped.sum())
+    # 出错单元格的坐标：行位置 × 规则序号
+    err_rows, err_rules = np.nonzero(errors)
+    total_errors = len(err_rows)
+    row_has_error = errors.any(axis=1)
+
+    if plan is not None:
+        phase_start = time.time()
+        plan.commit()
+        phases["fingerprint"] += time.time() - phase_start
+        sheet_metrics["incremental"] = plan.summary()
+        log("info", f"🔁 {sheet_keyword} 增量比对：沿用 {plan.reused.sum()} 行上次结论，重新比较 {len(plan.changed)} 行。")
+
+    on_progress(1.0, f"「{sheet_keyword}」比对完成，正在生成标注文件...")
+
+    col_name_to_idx = {name: i + 1 for i, name in enumerate(main_df.columns)}
+    row_labels = main_df.index.to_numpy()
+
+    first_row = MAIN_SHEET_FIRST_DATA_ROW
+    files_to_save = {"error_report": (None, None)}
+
+    # --- 错误明细：每处错误一条记录（只与错误数成正比，不依赖工作簿）---
+    if ledger:
+        phase_start = time.time()
+        files_to_save["ledger"] = (None, None)
+        if total_errors:
+            writer = LedgerWriter(ledger)
+            writer.write(mismatch_records(
+                sheet_keyword, [(rule, main_col, main_df[main_col], s_ref) for _, rule, main_col, s_ref in rules],
+                err_rows, err_rules, row_labels[err_rows] + first_row, keys.keys[key_ids[err_rows]],
+            ))
+            files_to_save["ledger"] = (f"月重卡_{sheet_keyword}_错误明细.{writer.fmt}", writer.close())
+        phases["ledger"] = time.time() - phase_start
+
+    # --- 直接在原工作簿的目标 sheet 上标注（只触及出错单元格）---
+    # (线程模式下多个 sheet 共享同一个 wb，标注与保存需串行)
+    if workbooks:
+        with wb_lock or nullcontext():
+            phase_start = time.time()
+            ws = wb[target_sheet]
+            fill_cells(ws, zip((row_labels[err_rows] + first_row).tolist(), excel_cols[err_rules].tolist()), RED_FILL)
+
+            if contract_col_main in col_name_to_idx:
+                contract_col_excel_idx = col_name_to_idx[contract_col_main]
+                error_row_indices = row_labels[row_has_error]
+                fill_cells(
+                    ws, ((row_idx + first_row, contract_col_excel_idx) for row_idx in error_row_indices), YELLOW_FILL
+                )
+
+            phases["annotate"] = time.time() - phase_start
+
+            # --- (10. 修改为 return 文件) ---
+            phase_start = time.time()
+            output = save_single_sheet(wb, target_sheet)
+            phases["save"] = time.time() - phase_start
+            files_to_save["full_report"] = (f"月重卡_{sheet_keyword}_审核标注版.xlsx", output)
+
+    output_errors_only = None
+
+    # --- (11. 修改为 return 文件) ---
+    if workbooks and row_has_error.any():
+        phase_start = time.time()
+        try:
+            # 每个出错行（行位置）需要标红的列位置，写行时直接带上 fill
+            row_fills = {}
+            for row, col in zip(err_rows.tolist(), (excel_cols[err_rules] - 1).tolist()):
+                row_fills.setdefault(row, {})[col] = RED_FILL
+
+            df_errors_only = main_df[row_has_error]
+            writer = StreamingXlsxWriter()
+            rows = iter_frame_rows(df_errors_only)
+            writer.append(next(rows))
+            for pos, r in zip(np.flatnonzero(row_has_error), rows):
+                writer.append(r, row_fills.get(pos))
+            output_errors_only = writer.close()
+            
+            files_to_save["error_report"] = (f"月重卡_{sheet_keyword}_仅错误行_标红.xlsx", output_errors_only)
+            
+        except Exception as e:
+            log("error", f"❌ 生成“仅错误行”文件时出错: {e}")
+        phases["error_report"] = time.time() - phase_start
+            
+    elapsed = time.time() - start_time
+    log("success", f"✅ {sheet_keyword} 检查完成，共 {total_errors} 处错误，用时 {elapsed:.2f} 秒。")
+    
+    stats = (total_errors, elapsed, skip_blank_ref, contracts_seen, sheet_metrics)
+    return stats, spill_files(output_store, files_to_save)
+
+
+# =====================================
+# 🌊 流式单 sheet 检查：超大 sheet 按行块读取、比对、写出
+# =====================================
+def _close_writer(writer, filename, output_store):
+    """写出 StreamingXlsxWriter：有 output_store 时直接写到输出目录（不经过内存），否则返回 BytesIO。"""
+    if output_store is None:
+        return writer.close()
+    return output_store.put_path(filename, writer.close(output_store.temp_path()))
+
+
+def _open_ledger(fmt, output_store):
+    """错误明细的 LedgerWriter：有 output_store 时直接写到输出目录的临时文件，否则写到内存。"""
+    return LedgerWriter(fmt, output_store.temp_path() if output_store is not None else None)
+
+
+def _close_ledger(writer, filename, output_store):
+    """写出 _open_ledger 打开的 LedgerWriter，返回 BytesIO 或 OutputHandle。"""
+    data = writer.close()
+    return data if output_store is None else output_store.put_path(filename, data)
+
+
+def check_one_sheet_streaming(sheet_keyword, main_file, sheet_name, ref_index, mappings_all, chunk_rows=20000,
+                              log=None, on_progress=None, output_store=None, ledger=None, workbooks=True):
+    """
+    check_one_sheet 的流式版本，返回值相同，用于几十万行、整表放不进内存的月重卡 sheet。
+
+    不加载可编辑的工作簿，也不构建整表 DataFrame：
+    1. SheetChunkReader 以 read-only 模式读一遍 sheet，按 chunk_rows 行一块暂存到磁盘
+    2. 第一遍遍历各块：对齐参考值，累计每条规则的整列上下文（数值规则的 float64 判定、日期列的文本格式）
+    3. 第二遍遍历各块：带着整列上下文比对（结果与整表比对逐行一致），
+       标注版与“仅错误行”报告都用 write-only 模式逐行写出，出错单元格写入时即上色
+    峰值内存由块大小决定（另有全部合同键的集合，供漏填检查使用）。
+    ledger / workbooks 同 check_one_sheet：错误明细逐块追加写出；workbooks=False 时不写两份 xlsx。
+    与 check_one_sheet 的差别：标注版只保留单元格的值与标色，不保留原 sheet 的列宽、字体、数字格式等样式。
+    """
+    log = log or _noop
+    on_progress = on_progress or _noop
+    start_time = time.time()
+    empty = (0, None, 0, NO_CONTRACTS, {}), {}
+
+    if sheet_name is None:
+        log("warning", f"⚠️ 未找到包含「{sheet_keyword}」的sheet，跳过。")
+        return empty
+
+    sheet_metrics = {"rows": 0, "phases": {"read": 0.0, "align": 0.0, "compare": 0.0, "save": 0.0}, "columns": {}}
+    phases = sheet_metrics["phases"]
+    phase_start = time.time()
+    try:
+        reader = SheetChunkReader(main_file, sheet_name, header=1, chunk_rows=chunk_rows)
+    except Exception as e:
+        log("error", f"❌ 读取「{sheet_keyword}」时出错: {e}")
+        return empty
+    phases["read"] = time.time() - phase_start
+
+    try:
+        if not reader.rows:
+            log("warning", f"⚠️ 「{sheet_keyword}」为空，跳过。")
+            return empty
+        sheet_metrics["rows"] = reader.rows
+        # 列名与整表解析相同，执行计划与 check_one_sheet 共用同一份缓存
+        sheet_plan = plan_for(reader.columns, ref_index, mappings_all)
+        contract_col_main = sheet_plan.contract
+        if not contract_col_main:
+            log("error", f"❌ 在「{sheet_keyword}」中未找到合同列。")
+            return empty
+
+        rules = [(step.rule.label, step.rule, step.column, step.rule.ref_col) for step in sheet_plan.steps]
+        for label, _, _, _ in rules:
+            sheet_metrics["columns"][label] = {"seconds": 0.0, "rows": 0, "errors": 0}
+
+        keys = ref_index.interner  # 本次审核的驻留表
+
+        def aligned(df, missing=False):
+            phase_start = time.time()
+            key_ids = keys.intern(df[contract_col_main])
+            ids = ref_index.lookup_ids(key_ids)
+            refs = [ref_index.take(ref_col, ids, index=df.index, missing=missing) for _, _, _, ref_col in rules]
+            phases["align"] += time.time() - phase_start
+            return key_ids, ids, refs
+
+        # --- 第一遍：整列上下文 ---
+        # 数值规则：[主表有剩余字符串, 主表有数字, 参考有剩余字符串, 参考有数字]；日期规则：两列的格式识别候选
+        numeric_seen = {label: [False] * 4 for label, _, _, _ in rules}
+        date_seen = {label: ([], []) for label, _, _, _ in rules}
+        unmatched = False  # 整表是否有参考表中找不到的合同：有则各块参考列都按有缺失值的 dtype 对齐
+        for _, df in reader:
+            _, ids, refs = aligned(df)
+            unmatched = unmatched or bool((ids < 0).any())
+            for (label, rule, main_col, _), s_ref in zip(rules, refs):
+                if rule.is_date:
+                    for seen, s in zip(date_seen[label], (df[main_col], s_ref)):
+                        if len(seen) < 200:
+                            seen.extend(date_format_candidates(s, 200 - len(seen)))
+                else:
+                    flags = numeric_seen[label]
+                    for k, s in ((0, df[main_col]), (2, s_ref)):
+                        has_str, is_float = numeric_row_flags(s)
+                        flags[k] = flags[k] or bool(has_str.any())
+                        flags[k + 1] = flags[k + 1] or bool(is_float.any())
+        contexts = {}
+        for label, rule, _, _ in rules:
+            if rule.is_date:
+                contexts[label] = tuple(date_format_from_candidates(seen) for seen in date_seen[label])
+            else:
+                flags = numeric_seen[label]
+                contexts[label] = (not flags[0] and flags[1], not flags[2] and flags[3])
+
+        # --- 第二遍：比对 + 逐行写出 ---
+        columns = list(reader.columns)
+        col_name_to_idx = {name: i for i, name in enumerate(columns)}
+        contract_pos = col_name_to_idx.get(contract_col_main)
+        rule_cols = np.array([col_name_to_idx[main_col] for _, _, main_col, _ in rules], dtype=np.int64)
+        full_writer = StreamingXlsxWriter(title=sheet_name) if workbooks else None
+        for row in reader.head_rows if workbooks else ():
+            full_writer.append(row)
+        error_writer = ledger_writer = None
+        total_errors = skip_blank_ref = 0
+        seen_parts = []
+        chunks = -(-reader.rows // reader.chunk_rows)
+
+        for n, (raw_rows, df) in enumerate(reader):
+            key_ids, _, refs = aligned(df, missing=unmatched)
+            seen_parts.append(np.unique(key_ids))
+            # 本块全部规则一次比对：行 × 规则 的错误矩阵
+            skip = np.zeros((len(df), len(rules)), dtype=bool, order="F")
+            for i, ((_, rule, _, _), s_ref) in enumerate(zip(rules, refs)):
+                skip[:, i] = blank_ref_mask(rule, s_ref)
+            col_seconds = np.zeros(len(rules))
+            phase_start = time.time()
+            errors = compare_block(
+                [df[main_col] for _, _, main_col, _ in rules], refs, [rule for _, rule, _, _ in rules],
+                contexts=[contexts[label] for label, _, _, _ in rules], seconds=col_seconds,
+            )
+            errors &= ~skip
+            phases["compare"] += time.time() - phase_start
+            skipped, found = skip.sum(axis=0), errors.sum(axis=0)
+            for i, (label, _, _, _) in enumerate(rules):
+                column = sheet_metrics["columns"][label]
+                column["seconds"] += float(col_seconds[i])
+                column["rows"] += int(len(df) - skipped[i])
+                column["errors"] += int(found[i])
+            skip_blank_ref += int(skipped.sum())
+
+            err_rows, err_rules = np.nonzero(errors)
+            total_errors += len(err_rows)
+            row_has_error = errors.any(axis=1)
+            row_fills = {}  # 块内行位置 -> {列位置: 红色}
+            for pos, col in zip(err_rows.tolist(), rule_cols[err_rules].tolist()):
+                row_fills.setdefault(pos, {})[col] = RED_FILL
+            on_progress((n + 1) / chunks, f"检查「{sheet_keyword}」: 第 {n + 1}/{chunks} 块已比对...")
+
+            if ledger and len(err_rows):
+                phase_start = time.time()
+                if ledger_writer is None:
+                    ledger_writer = _open_ledger(ledger, output_store)
+                steps = [(rule, main_col, df[main_col], s_ref) for (_, rule, main_col, _), s_ref in zip(rules, refs)]
+                ledger_writer.write(mismatch_records(
+                    sheet_keyword, steps, err_rows, err_rules,
+                    df.index.to_numpy()[err_rows] + MAIN_SHEET_FIRST_DATA_ROW, keys.keys[key_ids[err_rows]],
+                ))
+                phases["ledger"] = phases.get("ledger", 0.0) + time.time() - phase_start
+
+            if not workbooks:
+                continue
+            phase_start = time.time()
+            for pos, raw in enumerate(raw_rows):
+                fills = row_fills.get(pos)
+                if row_has_error[pos] and contract_pos is not None:
+                    fills = {**fills, contract_pos: YELLOW_FILL}
+                if fills and max(fills) >= len(raw):
+                    raw = raw + [None] * (max(fills) + 1 - len(raw))
+                full_writer.append(raw, fills)
+            phases["save"] += time.time() - phase_start
+
+            if row_has_error.any():
+                phase_start = time.time()
+                rows = iter_frame_rows(df.loc[row_has_error, columns])
+                header = next(rows)
+                if error_writer is None:
+                    error_writer = StreamingXlsxWriter()
+                    error_writer.append(header)
+                for pos, r in zip(np.flatnonzero(row_has_error), rows):
+                    error_writer.append(r, row_fills.get(pos))
+                phases["error_report"] = phases.get("error_report", 0.0) + time.time() - phase_start
+
+        on_progress(1.0, f"「{sheet_keyword}」比对完成，正在写出标注文件...")
+        phase_start = time.time()
+        files_to_save = {"error_report": (None, None)}
+        if full_writer is not None:
+            name = f"月重卡_{sheet_keyword}_审核标注版.xlsx"
+            files_to_save["full_report"] = (name, _close_writer(full_writer, name, output_store))
+        phases["save"] += time.time() - phase_start
+        if ledger:
+            files_to_save["ledger"] = (None, None)
+        if ledger_writer is not None:
+            phase_start = time.time()
+            name = f"月重卡_{sheet_keyword}_错误明细.{ledger_writer.fmt}"
+            files_to_save["ledger"] = (name, _close_ledger(ledger_writer, name, output_store))
+            phases["ledger"] += time.time() - phase_start
+        if error_writer is not None:
+            phase_start = time.time()
+            name = f"月重卡_{sheet_keyword}_仅错误行_标红.xlsx"
+            files_to_save["error_report"] = (name, _close_writer(error_writer, name, output_store))
+            phases["error_report"] += time.time() - phase_start
+    finally:
+        reader.close()
+
+    contracts_seen = np.unique(np.concatenate(seen_parts))
+    elapsed = time.time() - start_time
+    log("success", f"✅ {sheet_keyword} 检查完成（流式，{reader.rows} 行），共 {total_errors} 处错误，用时 {elapsed:.2f} 秒。")
+    stats = (total_errors, elapsed, skip_blank_ref, contracts_seen, sheet_metrics)
+    return stats, files_to_save
+
+
+# =====================================
+# 🧵 多 sheet 并行执行
+# =====================================
+# 进程模式下，每次审核的只读共享数据（参考索引、映射、已加载的主工作簿）作为进程池的 initargs
+# 交给自己的子进程：fork 时直接继承，不需要逐个 sheet 序列化传输；_SHARED 只在子进程中填充，
+# 同时进行的两次审核各用各的进程池，互不覆盖。
+_SHARED = {}
+
+
+def _init_worker(shared):
+    """
+    进程池子进程的初始化：记下本次审核的共享数据，并换掉从主进程继承来的锁。
+    fork 时主进程的其他线程（如另一个会话的审核）可能正持有某把锁，子进程里它永远不会被释放，
+    因此子进程会用到的锁（驻留表、规则计划缓存、输出目录）一律重新创建。
+    """
+    _SHARED.update(shared)
+    shared["ref_index"].interner._lock = threading.Lock()
+    for source, _ in shared["mappings_all"].values():
+        source._lock = threading.Lock()
+        if source.ruleset is not None:
+            source.ruleset._lock = threading.Lock()
+    if shared["output_store"] is not None:
+        shared["output_store"]._lock = threading.Lock()
+
+
+def _check_sheet_worker(sheet_keyword):
+    """
+    进程池中的单 sheet 任务：日志先收集起来，随结果一起返回给主进程回放；
+    逐列进度经 _SHARED["events"] 队列实时发回主进程。
+    """
+    messages = []
+    main_book = _SHARED["main_book"]
+    events = _SHARED["events"]
+    result = check_one_sheet(
+        sheet_keyword, main_book["sheets"][sheet_keyword], main_book["workbook"],
+        _SHARED["ref_index"], _SHARED["mappings_all"], store=_SHARED["store"], output_store=_SHARED["output_store"],
+        ledger=_SHARED["ledger"], workbooks=_SHARED["workbooks"],
+        log=lambda level, text: messages.append((level, text)),
+        on_progress=lambda frac, text: events.put((sheet_keyword, frac, text)),
+    )
+    return result, messages
+
+
+def _drain_progress(futures, events, fractions, on_progress, on_sheet):
+    """
+    等待 futures（{future: sheet 关键词}）全部完成，期间把各 sheet 上报的进度事件
+    转给 on_sheet(关键词, 进度, 文本)，整体进度取各 sheet 进度的平均值。
+    """
+    finished = set()
+
+    def publish(kw, frac, text):
+        if kw in finished:  # 子进程的队列有延迟，sheet 完成后到达的旧事件丢弃
+            return
+        fractions[kw] = frac
+        on_sheet(kw, frac, text)
+        on_progress(sum(fractions.values()) / len(fractions), text)
+
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=0.2, return_when=FIRST_COMPLETED)
+        while True:
+            try:
+                publish(*events.get_nowait())
+            except queue.Empty:
+                break
+        for future in done:
+            if future.exception() is None:
+                publish(futures[future], 1.0, f"「{futures[future]}」检查完成")
+                finished.add(futures[future])
+    return {kw: future.result() for future, kw in futures.items()}
+
+
+def run_sheet_checks(sheet_keywords, main_book, ref_index, mappings_all,
+                     workers=1, executor="process", log=None, on_progress=None, store=None, output_store=None,
+                     on_sheet=None, ledger=None, workbooks=True):
+    """
+    对 sheet_keywords 中的每个 sheet 执行 check_one_sheet，返回 {关键词: (stats, files_dict)}。
+
+    workers  - 并行度；<= 1 或只有一个 sheet 时串行执行
+    executor - "process"（fork 子进程，真正多核）或 "thread"
+               不支持 fork 的平台上 "process" 自动退化为 "thread"
+    store    - 增量模式的 FingerprintStore（可选），各 sheet 分别读写自己的状态
+    output_store - OutputStore（可选）；进程模式下由子进程直接落盘，只把句柄传回主进程
+    on_progress  - on_progress(整体进度, 文本)
+    on_sheet     - on_sheet(关键词, 该 sheet 进度, 文本)，每比对完一列更新一次
+    ledger / workbooks - 错误明细格式与是否生成 xlsx，见 check_one_sheet
+    无论哪种模式，进度都实时上报；日志按 sheet_keywords 的顺序回放，结果与串行执行完全一致。
+    """
+    log = log or _noop
+    on_progress = on_progress or _noop
+    on_sheet = on_sheet or _noop
+    results = {}
+
+    if workers <= 1 or len(sheet_keywords) <= 1:
+        for i, kw in enumerate(sheet_keywords):
+
+            def sheet_progress(frac, text, i=i, kw=kw):
+                on_sheet(kw, frac, text)
+                on_progress((i + frac) / len(sheet_keywords), text)
+
+            results[kw] = check_one_sheet(
+                kw, main_book["sheets"][kw], main_book["workbook"], ref_index, mappings_all,
+                log=log, on_progress=sheet_progress, store=store, output_store=output_store,
+                ledger=ledger, workbooks=workbooks,
+            )
+            on_sheet(kw, 1.0, f"「{kw}」检查完成")
+        return results
+
+    workers = min(workers, len(sheet_keywords))
+    fractions = dict.fromkeys(sheet_keywords, 0.0)
+    # 先在主进程驻留各 sheet 的合同列：子进程继承驻留表后只做查找，返回的合同 id 与主进程一致
+    for kw in sheet_keywords:
+        df = main_book["sheets"][kw]["df"]
+        contract_col = find_col(df, "合同") if df is not None else None
+        if contract_col:
+            ref_index.interner.intern(df[contract_col])
+    if executor == "process" and "fork" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("fork")
+        events = context.Queue()
+        shared = dict(main_book=main_book, ref_index=ref_index, mappings_all=mappings_all, store=store,
+                      output_store=output_store, ledger=ledger, workbooks=workbooks, events=events)
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                     initializer=_init_worker, initargs=(shared,)) as pool:
+                futures = {pool.submit(_check_sheet_worker, kw): kw for kw in sheet_keywords}
+                outcomes = _drain_progress(futures, events, fractions, on_progress, on_sheet)
+        finally:
+            events.close()
+    else:
+        wb_lock = threading.Lock()
+        events = queue.Queue()
+
+        def thread_task(kw):
+            messages = []
+            result = check_one_sheet(
+                kw, main_book["sheets"][kw], main_book["workbook"], ref_index, mappings_all,
+                log=lambda level, text: messages.append((level, text)),
+                on_progress=lambda frac, text: events.put((kw, frac, text)),
+                wb_lock=wb_lock, store=store, output_store=output_store, ledger=ledger, workbooks=workbooks,
+            )
+            return result, messages
+
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(thread_task, kw): kw for kw in sheet_keywords}
+            outcomes = _drain_progress(futures, events, fractions, on_progress, on_sheet)
+
+    # 按固定顺序回放日志、汇总结果，保证与串行运行一致
+    for kw in sheet_keywords:
+        result, messages = outcomes[kw]
+        for level, text in messages:
+            log(level, text)
+        results[kw] = result
+    return results
+
+
+def run_streaming_checks(sheet_keywords, main_file, ref_index, mappings_all, chunk_rows,
+                         log=None, on_progress=None, output_store=None, on_sheet=None, ledger=None, workbooks=True):
+    """
+    流式模式下的 run_sheet_checks：逐个 sheet 调用 check_one_sheet_streaming，返回 {关键词: (stats, files_dict)}。
+    不加载主工作簿；各 sheet 串行执行，保证任意时刻内存中只有一个块。
+    """
+    on_progress = on_progress or _noop
+    on_sheet = on_sheet or _noop
+    sheet_names = resolve_workbook_sheets(main_file, sheet_keywords)
+    results = {}
+    for i, kw in enumerate(sheet_keywords):
+
+        def sheet_progress(frac, text, i=i, kw=kw):
+            on_sheet(kw, frac, text)
+            on_progress((i + frac) / len(sheet_keywords), text)
+
+        results[kw] = check_one_sheet_streaming(
+            kw, main_file, sheet_names[kw], ref_index, mappings_all, chunk_rows,
+            log=log, on_progress=sheet_progress, output_store=output_store, ledger=ledger, workbooks=workbooks,
+        )
+        on_sheet(kw, 1.0, f"「{kw}」检查完成")
+    return results
+
+
+def default_workers():
+    """默认并行度：环境变量 AUDIT_WORKERS，否则取 CPU 核数（最多 4 个，对应 4 个 sheet）。"""
+    env = os.environ.get("AUDIT_WORKERS")
+    if env:
+        return max(1, int(env))
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+# =====================================
+# 🕵️ (新) 漏填检查函数
+# =====================================
+def leaky_missing_mask(zd_df, contract_col_zd, contracts_seen_all_sheets, keys):
+    """
+    字段表中判为漏填的行（在月重卡各 sheet 中都没出现，且不是车管家、联合租赁、驻店）。
+    contracts_seen_all_sheets 为本次审核驻留表 keys 中的 id 数组；字段表合同键经同一个驻留表规范化。
+    """
+    field_contracts = zd_df[contract_col_zd].dropna()
+    field_ids = keys.intern(field_contracts)
+    seen = np.zeros(len(keys), dtype=bool)
+    seen[contracts_seen_all_sheets] = True
+    col_car_manager = find_col(zd_df, "是否车管家", exact=True)
+    col_bonus_type = find_col(zd_df, "提成类型", exact=True)
+
+    missing_contracts_mask = pd.Series(~seen[field_ids], index=field_contracts.index)
+
+    if col_car_manager:
+        missing_contracts_mask &= ~(zd_df[col_car_manager].astype(str).str.strip().str.lower() == "是")
+    if col_bonus_type:
+        missing_contracts_mask &= ~(
+            zd_df[col_bonus_type].astype(str).str.strip().isin(["联合租赁", "驻店"])
+        )
+    return missing_contracts_mask
+
+
+def run_leaky_check(zd_df, contract_col_zd, contracts_seen_all_sheets, keys, log=None, extra_formats=(),
+                    output_store=None, ledger=None, workbooks=True):
+    """
+    执行漏填检查并返回 BytesIO 文件（给出 output_store 时落盘并返回 OutputHandle）。
+    keys          - 本次审核的驻留表，contracts_seen_all_sheets 为其中的 id
+    extra_formats - 除 xlsx 外额外导出的格式，如 ("csv", "parquet")
+    ledger        - 错误明细格式（"parquet" / "jsonl"）：漏填合同另写成明细记录，files_dict["leaky_ledger"]
+    workbooks     - False 时不写两份漏填 xlsx
+    """
+    log = log or _noop
+    log("info", "ℹ️ 正在执行漏填检查...")
+    files_to_save = {}
+    missing_contracts_mask = leaky_missing_mask(zd_df, contract_col_zd, contracts_seen_all_sheets, keys)
+
+    # 不复制整张字段表：只生成“漏填检查”这一列，写出时逐行追加在行尾
+    check_col = pd.Series("", index=zd_df.index, dtype=object)
+    check_col.loc[missing_contracts_mask] = "❗ 漏填"
+    is_missing = check_col.eq("❗ 漏填")
+    漏填合同数 = is_missing.sum()
+    log("warning", f"⚠️ 共发现 {漏填合同数} 个合同在记录表中未出现（已排除车管家、联合租赁、驻店）")
+
+    # 漏填明细：每个漏填合同一条记录，行号为字段表中的 Excel 行号（表头在第 1 行）
+    if ledger:
+        files_to_save["leaky_ledger"] = (None, None)
+        if 漏填合同数 > 0:
+            positions = np.flatnonzero(is_missing.to_numpy())
+            raw_contracts = zd_df[contract_col_zd].iloc[positions]
+            writer = LedgerWriter(ledger)
+            writer.write(missing_records(contract_col_zd, positions + 2, keys.normalize(raw_contracts), raw_contracts))
+            files_to_save["leaky_ledger"] = (f"字段表_漏填明细.{writer.fmt}", writer.close())
+
+    # --- 导出文件逻辑 ---
+    # 字段表只遍历一遍，同时写出两个文件（write-only 流式写出，内存不随行数增长）：
+    # 文件1：全字段表；文件2：仅漏填（有漏填时才生成）
+    files_to_save["leaky_full"] = files_to_save["leaky_only"] = (None, None)
+    if workbooks:
+        writer_all = StreamingXlsxWriter()
+        writer_only = StreamingXlsxWriter() if 漏填合同数 > 0 else None
+        check_col_pos = len(zd_df.columns)
+        leaky_fill = {check_col_pos: YELLOW_FILL}
+
+        rows = iter_frame_rows(zd_df)
+        header = list(next(rows)) + ["漏填检查"]
+        writer_all.append(header)
+        if writer_only:
+            writer_only.append(header)
+        for r, flag, missing in zip(rows, check_col.to_numpy(), is_missing.to_numpy()):
+            r = list(r) + [flag]
+            writer_all.append(r, leaky_fill if missing else None)
+            if missing:
+                writer_only.append(r, leaky_fill)
+
+        files_to_save["leaky_full"] = ("字段表_漏填标注版.xlsx", writer_all.close())
+        if writer_only:
+            files_to_save["leaky_only"] = ("字段表_仅漏填.xlsx", writer_only.close())
+
+    # 字段表很大时可额外导出 CSV / Parquet
+    if extra_formats:
+        extra_files, notes = export_extra_formats(
+            zd_df.assign(**{"漏填检查": check_col}), "字段表_漏填标注版", extra_formats
+        )
+        for note in notes:
+            log("warning", note)
+        for i, (name, data) in enumerate(extra_files):
+            files_to_save[f"leaky_extra_{i}"] = (name, data)
+
+    return 漏填合同数, spill_files(output_store, files_to_save)
+
+
+# =====================================
+# 🔎 近似匹配：找不到的合同键 → 最接近的已知合同键
+# =====================================
+# normalize_contract_key 把空值变成的字符串，不是真正的合同键
+NA_KEYS = {"", "NAN", "NONE", "NAT", "<NA>"}
+
+
+def run_near_match(sheet_unmatched, ref_keys, leaky_missing, seen_keys, log=None, output_store=None):
+    """
+    为两类找不到的合同键推荐最接近的已知键（见 near_match.NearMatchIndex），写出“合同键近似匹配候选”报告。
+    sheet_unmatched - {sheet 关键词: 月重卡中在三张参考表里都找不到的合同键}（比对时这些行被静默跳过）
+    ref_keys        - 参考表合同键的并集（ref_index.keys）
+    leaky_missing   - 被判为漏填的字段表合同键
+    seen_keys       - 月重卡各 sheet 出现过的合同键
+    返回 (有候选的键数, {"near_match": (文件名, 文件) 或 (None, None)})
+    """
+    log = log or _noop
+    found = []
+    queries = {kw: [k for k in keys if k not in NA_KEYS] for kw, keys in sheet_unmatched.items()}
+    if any(queries.values()):
+        index = NearMatchIndex([k for k in ref_keys if k not in NA_KEYS])
+        for kw, keys in queries.items():
+            found.append(index.match(keys).assign(检查项=f"月重卡「{kw}」→ 参考表"))
+    if len(leaky_missing):
+        index = NearMatchIndex([k for k in seen_keys if k not in NA_KEYS])
+        found.append(index.match(leaky_missing).assign(检查项="字段表漏填 → 月重卡"))
+    found = [df for df in found if not df.empty]
+    count = sum(len(df) for df in found)
+    if not count:
+        return 0, {"near_match": (None, None)}
+
+    report = pd.concat(found, ignore_index=True).sort_values(["检查项", "skeleton_distance", "distance", "key"])
+    report = report.rename(columns={
+        "key": "合同键", "candidate": "最接近的已知合同键", "distance": "编辑距离",
+        "skeleton_distance": "忽略大小写与分隔符后的距离", "ties": "同样接近的候选数",
+    })[["检查项", "合同键", "最接近的已知合同键", "编辑距离", "忽略大小写与分隔符后的距离", "同样接近的候选数"]]
+    log("info", f"🔎 {count} 个找不到的合同键有近似的已知合同键（可能是录入错误），见“合同键近似匹配候选”报告。")
+
+    writer = StreamingXlsxWriter()
+    for row in iter_frame_rows(report):
+        writer.append(row)
+    files_to_save = {"near_match": ("合同键近似匹配候选.xlsx", writer.close())}
+    return count, spill_files(output_store, files_to_save)
+
+
+# =====================================
+# 🚀 整套审核流程（Streamlit / 命令行共用）
+# =====================================
+def run_full_audit(files, reporter=None, cache=None, workers=1, executor="process", leaky_formats=(),
+                   metrics=None, profile=False, incremental=None, ref_store=None, output_store=None,
+                   stream_rows=None, rules=None, prefetched=None, ledger=None, workbooks=True):
+    """
+    执行所有文件读取、预处理和检查，并返回 (所有生成文件, 统计摘要)。
+    所有生成文件为 [(文件名, BytesIO 或 OutputHandle)]，两者都支持 getvalue()。
+
+    files         - 一组带 .name 的文件对象（Streamlit UploadedFile、open(path, "rb") 等），
+                    按文件名关键词（月重卡、放款明细、字段、二次明细）定位
+    reporter      - Reporter 实例，接收日志与进度；默认静默
+    cache         - LRUCache；缓存键 = 文件内容摘要 + 映射配置摘要，
+                    相同文件直接命中，换了文件则一定重新计算。默认每次新建（不跨调用复用）
+    workers / executor - 单 sheet 检查的并行度与方式，见 run_sheet_checks
+    leaky_formats - 漏填报告除 xlsx 外额外导出的格式
+    metrics       - RunMetrics，记录各阶段耗时/行数/内存与逐列比对统计；默认新建，
+                    结果同时放在返回的统计摘要 ["metrics"] 中
+    profile       - True 时用 cProfile 剖析本次运行（sheet 检查改为串行，以便采到比对热点）
+    incremental   - 增量模式：FingerprintStore 或 SQLite 文件路径（True 表示默认路径）；
+                    只重新比较与上次运行相比有变化的行，输出与全量比对完全一致
+    ref_store     - 参考数据列式存储：RefStore 或目录路径（True 表示默认目录）；
+                    已入库的参考文件不再解析 Excel、不再预处理，直接按列读取（数值列内存映射）
+    output_store  - 输出落盘：OutputStore 或目录路径（True 表示默认目录）；
+                    生成的报告写到磁盘，返回值与缓存中只保留 OutputHandle，不再常驻内存
+    stream_rows   - 流式模式的块行数（None 表示关闭）：主表不整表加载，各 sheet 按块读取、比对并逐行写出报告，
+                    用于几十万行的超大月重卡（见 check_one_sheet_streaming）；错误与标色与常规模式一致，
+                    标注版不保留原格式。流式模式串行执行，忽略 workers 与 incremental
+    rules         - 比对规则：audit_rules.RuleSet 或规则文件路径；默认 audit_rules.RULES（audit_rules.json）
+    prefetched    - 上传后已在后台预解析的工作簿（audit_prefetch.PrefetchSession）：
+                    需要解析某个文件时先按 (角色, 内容摘要, 规则) 取预解析结果（仍在解析则等它完成），取不到才自己解析
+    ledger        - 错误明细格式："parquet" 或 "jsonl"（None 表示不生成）。每处比对错误、每个漏填合同一条记录，
+                    汇总为“审核错误明细.parquet / .jsonl”，字段见 error_ledger；未安装 pyarrow 时 parquet 改为 jsonl
+    workbooks     - False 时不生成标注版、仅错误行与漏填 xlsx（也不以可编辑模式加载月重卡），只出统计与明细
+    """
+    reporter = reporter or Reporter()
+    if cache is None:
+        cache = LRUCache()
+    metrics = (metrics or RunMetrics()).start()
+    store = incremental
+    if incremental is True or isinstance(incremental, str):
+        store = FingerprintStore(None if incremental is True else incremental)
+    if ref_store is True or isinstance(ref_store, str):
+        ref_store = RefStore(None if ref_store is True else ref_store)
+    if output_store is True or isinstance(output_store, str):
+        output_store = OutputStore(None if output_store is True else output_store)
+    if rules is None or isinstance(rules, str):
+        rules = load_rules(rules) if rules else RULES
+    if profile:
+        workers = 1
+    try:
+        with profiling(metrics, profile):
+            all_generated_files, stats_summary = _run_full_audit(
+                files, reporter, cache, workers, executor, leaky_formats, metrics, store, ref_store, output_store,
+                stream_rows, rules, prefetched, ledger, workbooks,
+            )
+    finally:
+        metrics.finish()
+    stats_summary["elapsed_total"] = metrics.total_seconds
+    stats_summary["metrics"] = metrics.to_dict()
+    return all_generated_files, stats_summary
+
+
+def _with_contracts(result, contracts):
+    """
+    换掉单 sheet 结果 (stats, files_dict) 中“出现过的合同”一项。
+    审核内用驻留 id；驻留表随审核结束丢弃，放进缓存时改存规范化后的键，命中时再驻留回当次审核。
+    """
+    (count, used, skipped, _, sheet_metrics), files_dict = result
+    return (count, used, skipped, contracts, sheet_metrics), files_dict
+
+
+def _run_full_audit(files, reporter, cache, workers, executor, leaky_formats, metrics, store, ref_store,
+                    output_store, stream_rows=None, rules=RULES, prefetched=None, ledger=None, workbooks=True):
+    log = reporter.log
+    sources = rules.sources
+    if ledger:
+        if ledger_format(ledger) != ledger:
+            log("warning", f"⚠️ 未安装 pyarrow，错误明细改为 {ledger_format(ledger)} 格式。")
+        ledger = ledger_format(ledger)
+
+
+    # --- 1. 📖 文件定位 ---
+    main_file = find_file(files, "月重卡")
+    ref_files = {prefix: find_file(files, source.file) for prefix, source in sources.items()}
+    
+    if main_file is None or None in ref_files.values():
+        raise FileNotFoundError(
+            f"未能找到所有必需的文件（{'、'.join(['月重卡'] + [source.file for source in sources.values()])}）。"
+        )
+
+    with metrics.stage("digest"):
+        main_digest = file_digest(main_file)
+        ref_digests = {prefix: file_digest(f) for prefix, f in ref_files.items()}
+
+    # 本次审核的合同键驻留表：参考表、各 sheet、漏填检查共用，审核结束即丢弃
+    keys = KeyInterner()
+
+    # --- 2. 🗺️ 比对规则 ---
+    # 参考数据版本：参考文件内容 + 比对规则定义，任一变化都会使单 sheet 结果失效
+    ref_version = config_digest([ref_digests, rules.digest])
+
+    # --- 3. 📖 工作簿加载（惰性：只有缓存未命中时才真正解析，且每个文件只解析一次）---
+    sheet_keywords = SHEET_KEYWORDS
+    book_files = {'main': main_file, **ref_files}
+    book_digests = {'main': main_digest, **ref_digests}
+    loaded_books = {}
+
+    def load_book(which):
+        if which not in loaded_books:
+            with metrics.stage(f"read:{which}") as info:
+                # 上传后已在后台预解析过的直接取用（月重卡工作簿会被标注修改，只能取用一次）
+                loaded = prefetched.take(which, book_digests[which], rules) if prefetched is not None else None
+                info["prefetched"] = loaded is not None
+                if loaded is None:
+                    loaded = read_book(which, book_files[which], rules, editable=workbooks)
+                frames = [e["df"] for e in loaded["sheets"].values() if e["df"] is not None]
+                info["rows"] = sum(len(df) for df in frames)
+                info["frame_mb"] = sum(frame_mb(df) for df in frames)
+            if info["prefetched"]:
+                log("caption", f"📖 {loaded['name']} 已在上传后预解析（用时 {loaded['elapsed']:.2f} 秒）")
+            else:
+                log("caption", f"📖 {loaded['name']} 解析用时 {loaded['elapsed']:.2f} 秒")
+            loaded_books[which] = loaded
+        return loaded_books[which]
+
+    def read_raw(prefix):
+        return required_sheet_df(load_book(prefix), sources[prefix].sheet)
+
+    prepared = {}
+
+    def prepare_refs():
+        # --- 🚀 预处理 + 参考索引（按参考文件摘要缓存，整个审核只构建一次）---
+        if not prepared:
+            log("info", "ℹ️ 正在读取并预处理参考文件...")
+            mappings_all = {}
+            for prefix, source in sources.items():
+                key = ref_std_key(source, ref_digests[prefix])
+                with metrics.stage(f"prepare:{prefix}") as info:
+                    std_df = cache.get(key)
+                    info["cached"] = std_df is not None
+                    info["source"] = "cache"
+                    if std_df is None:
+                        # 进程内缓存未命中：先查参考数据存储，仍没有才解析 Excel 并预处理（随后入库）
+                        std_df, info["source"] = stored_frame(
+                            ref_store, f"ref_std_{prefix}", std_version(source, ref_digests[prefix]),
+                            lambda: prepare_ref_df(read_raw(prefix), source, log=log, keys=keys),
+                            columns=['__KEY__'] + [rule.ref_col for rule in source.rules],
+                        )
+                        cache.put(key, std_df)
+                    info["rows"] = len(std_df)
+                    info["frame_mb"] = frame_mb(std_df)
+                mappings_all[prefix] = (source, std_df)
+            with metrics.stage("ref_index") as info:
+                info["cached"] = ("ref_index", ref_version) in cache
+                ref_index = cache.get_or_compute(
+                    ("ref_index", ref_version),
+                    lambda: RefIndex({prefix: std_df for prefix, (_, std_df) in mappings_all.items()})
+                ).bind(keys)
+                info["rows"] = len(ref_index)
+            prepared.update(mappings_all=mappings_all, ref_index=ref_index)
+            log("success", "✅ 参考数据预处理完成。")
+        return prepared["mappings_all"], prepared["ref_index"]
+
+    # --- 4. 🧾 多sheet循环 ---
+    total_all = elapsed_all = skip_total = 0
+    seen_parts = []
+    
+    all_generated_files = [] # 存储所有 (文件名, BytesIO / OutputHandle) 元组
+
+    sheet_results = {}
+    pending = []
+    # 流式模式的标注版不保留原格式，与常规模式的结果分开缓存；生成的文件种类（明细、xlsx）不同也分开缓存
+    mode = ("stream",) if stream_rows else ()
+    mode += (("ledger", ledger),) if ledger else ()
+    mode += () if workbooks else ("no_workbooks",)
+    for kw in sheet_keywords:
+        cached = cache.get(("sheet", main_digest, kw, ref_version) + mode)
+        # 落盘的报告可能已被输出目录淘汰，此时缓存的句柄失效，需要重新检查
+        if cached is not None and files_alive(cached[1]):
+            sheet_results[kw] = _with_contracts(cached, keys.intern_normalized(cached[0][3]))
+        else:
+            pending.append(kw)
+
+    if pending and stream_rows:
+        # 流式模式：不加载主工作簿，各 sheet 按块读取、比对、写出
+        mappings_all, ref_index = prepare_refs()
+        log("info", f"ℹ️ 流式模式：月重卡按每块 {stream_rows} 行读取比对，标注版不保留原格式。")
+        if store is not None:
+            log("info", "ℹ️ 流式模式不使用增量比对，本次全量比较。")
+        with metrics.stage("sheet_checks") as info:
+            fresh = run_streaming_checks(
+                pending, main_file, ref_index, mappings_all, stream_rows,
+                log=log, on_progress=reporter.progress, output_store=output_store, on_sheet=reporter.sheet_progress,
+                ledger=ledger, workbooks=workbooks,
+            )
+            info["rows"] = sum(stats[4].get("rows", 0) for stats, _ in fresh.values())
+        for kw, result in fresh.items():
+            sheet_results[kw] = result
+            cache.put(("sheet", main_digest, kw, ref_version) + mode, _with_contracts(result, keys.keys[result[0][3]]))
+    elif pending:
+        # 未命中缓存的 sheet 分发到线程/进程池并行检查（共享同一份参考索引与主工作簿）
+        mappings_all, ref_index = prepare_refs()
+        main_book = load_book('main')
+        with metrics.stage("sheet_checks") as info:
+            fresh = run_sheet_checks(
+                pending, main_book, ref_index, mappings_all,
+                workers=workers, executor=executor, log=log, on_progress=reporter.progress, store=store,
+                output_store=output_store, on_sheet=reporter.sheet_progress, ledger=ledger, workbooks=workbooks,
+            )
+            info["rows"] = sum(len(main_book["sheets"][kw]["df"]) for kw in pending if main_book["sheets"][kw]["df"] is not None)
+        for kw, result in fresh.items():
+            sheet_results[kw] = result
+            cache.put(("sheet", main_digest, kw, ref_version) + mode, _with_contracts(result, keys.keys[result[0][3]]))
+
+    for kw in sheet_keywords:
+        stats, files_dict = sheet_results[kw]
+        if kw not in pending:
+            log("success", f"✅ {kw} 命中缓存，共 {stats[0]} 处错误。")
+            reporter.sheet_progress(kw, 1.0, f"「{kw}」命中缓存")
+        (count, used, skipped, seen, sheet_metrics) = stats
+        metrics.add_sheet(kw, sheet_metrics, seconds=used, cached=kw not in pending)
+        
+        if "full_report" in files_dict:
+            all_generated_files.append(files_dict["full_report"])
+        if files_dict.get("error_report", (None, None))[0] is not None:
+            all_generated_files.append(files_dict["error_report"])
+        
+        total_all += count
+        elapsed_all += used or 0
+        skip_total += skipped
+        seen_parts.append(seen)
+    # 各 sheet 出现过的合同（驻留 id，已去重）
+    contracts_seen_all_sheets = np.unique(np.concatenate(seen_parts)).astype(np.int64)
+
+    # --- 5. 🕵️ 漏填检查 ---
+    leaky_key = ("leaky", ref_digests['zd'], main_digest, tuple(leaky_formats), ledger, workbooks)
+    zd_df = None
+    leaky_cached = cache.get(leaky_key)
+    if leaky_cached is None or not files_alive(leaky_cached[1]):
+        leaky_cached = None
+        zd_df, _ = stored_frame(ref_store, "raw_zd", raw_version(sources['zd'], ref_digests['zd']), lambda: read_raw('zd'))
+
+    def leaky():
+        contract_col_zd = find_col(zd_df, "合同") # 仅为漏填检查
+        return run_leaky_check(zd_df, contract_col_zd, contracts_seen_all_sheets, keys, log=log, extra_formats=leaky_formats,
+                               output_store=output_store, ledger=ledger, workbooks=workbooks)
+
+    with metrics.stage("leaky", rows=None if zd_df is None else len(zd_df)) as info:
+        info["cached"] = leaky_cached is not None
+        漏填合同数, leaky_files_dict = leaky_cached or cache.put(leaky_key, leaky())
+    
+    if leaky_files_dict["leaky_full"][0] is not None:
+        all_generated_files.append(leaky_files_dict["leaky_full"])
+    if leaky_files_dict["leaky_only"][0] is not None:
+        all_generated_files.append(leaky_files_dict["leaky_only"])
+    all_generated_files.extend(v for k, v in leaky_files_dict.items() if k.startswith("leaky_extra_"))
+
+    # --- 6. 🧾 错误明细：各 sheet 与漏填的明细按顺序拷贝进一个文件 ---
+    明细条数 = None
+    if ledger:
+        with metrics.stage("ledger") as info:
+            parts = [sheet_results[kw][1].get("ledger", (None, None))[1] for kw in sheet_keywords]
+            parts.append(leaky_files_dict.get("leaky_ledger", (None, None))[1])
+            name = ledger_filename(ledger)
+            writer = _open_ledger(ledger, output_store)
+            for part in parts:
+                if part is not None:
+                    writer.append(part)
+            all_generated_files.append((name, _close_ledger(writer, name, output_store)))
+            明细条数 = info["rows"] = writer.rows_written
+        log("info", f"🧾 错误明细共 {明细条数} 条记录，见「{name}」。")
+
+    # --- 7. 🔎 近似匹配：找不到的合同键推荐最接近的已知键 ---
+    near_key = ("near_match", main_digest, ref_version)
+    near_cached = cache.get(near_key)
+    if near_cached is not None and not files_alive(near_cached[1]):
+        near_cached = None
+    with metrics.stage("near_match") as info:
+        info["cached"] = near_cached is not None
+        if near_cached is None:
+            _, ref_index = prepare_refs()
+            sheet_unmatched = {}
+            for kw in sheet_keywords:
+                seen = sheet_results[kw][0][3]
+                sheet_unmatched[kw] = keys.keys[seen[ref_index.lookup_ids(seen) < 0]]
+            if zd_df is None:
+                zd_df, _ = stored_frame(ref_store, "raw_zd", raw_version(sources['zd'], ref_digests['zd']), lambda: read_raw('zd'))
+            contract_col_zd = find_col(zd_df, "合同")
+            missing = leaky_missing_mask(zd_df, contract_col_zd, contracts_seen_all_sheets, keys)
+            leaky_missing = keys.normalize(zd_df.loc[missing[missing].index, contract_col_zd])
+            info["rows"] = sum(map(len, sheet_unmatched.values())) + len(leaky_missing)
+            near_cached = cache.put(near_key, run_near_match(
+                sheet_unmatched, ref_index.keys, leaky_missing, keys.keys[contracts_seen_all_sheets], log=log,
+                output_store=output_store,
+            ))
+    近似匹配数, near_files_dict = near_cached
+    if near_files_dict["near_match"][0] is not None:
+        all_generated_files.append(near_files_dict["near_match"])
+
+    # --- 8. 返回所有结果 ---
+    stats_summary = {
+        "total_all": total_all,
+        "elapsed_all": elapsed_all,
+        "column_timings": {label: c["seconds"] for label, c in metrics.columns.items()},
+        "漏填合同数": 漏填合同数,
+        "近似匹配数": 近似匹配数,
+        "明细条数": 明细条数,
+    }
+    
+    return all_generated_files, stats_summary
@@ -0,0 +1,175 @@
+# =====================================
+# 🧵 后台审核任务：提交后在后台线程运行，页面按任务 id 轮询进度、随时重新连接
+# =====================================
+"""
+Streamlit 每次交互或刷新都会重跑整个脚本，审核如果在脚本里同步执行，
+一刷新就被打断重来，进度条也随之消失。JobManager 把审核放到后台线程：
+
+    jobs = JobManager(gate=AdmissionGate(2))
+    job = jobs.submit(lambda reporter: audit_engine.run_full_audit(files, reporter=reporter, ...),
+                      key=本次输入的摘要, owner=会话 id)
+    job.id              # 放进 URL（?job=...），刷新页面后凭它重新连接
+    jobs.get(job_id)    # 任意一次脚本运行中都能取到同一个任务
+    job.snapshot()      # 状态、整体进度、各 sheet 进度、日志，供页面轮询展示
+
+任务的状态：queued（排队等名额）→ running → done / failed。
+结果（报告句柄 + 统计摘要）留在任务上，刷新后直接展示，不会重新计算。
+已结束的任务保留 keep_seconds 秒（与报告输出目录的保留时间一致），超出 max_jobs 个时先删最旧的。
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import nullcontext
+from io import BytesIO
+
+from audit_engine import Reporter
+
+FINISHED = ("done", "failed")
+
+
+def detach_files(files):
+    """
+    把上传文件复制成独立的内存文件（保留 .name）。后台任务可能比本次脚本运行活得久，
+    不能继续引用 Streamlit 的 UploadedFile。
+    """
+    copies = []
+    for f in files:
+        copy = BytesIO(f.getvalue())
+        copy.name = f.name
+        copies.append(copy)
+    return copies
+
+
+class Job:
+    """一个后台审核任务。字段由工作线程更新，页面通过 snapshot() 读取一致的快照。"""
+
+    def __init__(self, key=None, owner=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.owner = owner
+        self.status = "queued"
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.queue_position = None
+        self.queued_seconds = 0.0
+        self.progress = 0.0
+        self.text = ""
+        self.sheets = OrderedDict()  # sheet 关键词 -> (进度, 文本)
+        self.logs = []               # [(level, text)]
+        self.result = None
+        self.error = None
+        self._lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.status in FINISHED
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "id": self.id,
+                "status": self.status,
+                "queue_position": self.queue_position,
+                "progress": self.progress,
+                "text": self.text,
+                "sheets": dict(self.sheets),
+                "logs": list(self.logs),
+                "elapsed": (self.finished or time.time()) - (self.started or self.submitted),
+            }
+
+
+class JobReporter(Reporter):
+    """把审核引擎的日志与进度记到 Job 上（工作线程写，页面线程读）。"""
+
+    def __init__(self, job):
+        self.job = job
+
+    def log(self, level, text):
+        with self.job._lock:
+            self.job.logs.append((level, text))
+
+    def progress(self, fraction, text):
+        with self.job._lock:
+            self.job.progress = min(max(fraction, self.job.progress), 1.0)
+            self.job.text = text
+
+    def sheet_progress(self, sheet, fraction, text):
+        with self.job._lock:
+            self.job.sheets[sheet] = (min(fraction, 1.0), text)
+
+
+class JobManager:
+    """
+    进程内的后台任务表。线程安全；gate 为 AdmissionGate（可选），
+    提交的任务先排队取得运行名额再执行，排队位置写到 job.queue_position。
+    """
+
+    def __init__(self, gate=None, max_jobs=100, keep_seconds=6 * 3600):
+        self.gate = gate
+        self.max_jobs = max_jobs
+        self.keep_seconds = keep_seconds
+        self._jobs = OrderedDict()  # id -> Job，按提交顺序
+        self._lock = threading.Lock()
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def find(self, key, owner=None):
+        """同一提交者、同一输入的最近一个任务（没有则为 None）。"""
+        with self._lock:
+            for job in reversed(self._jobs.values()):
+                if job.key == key and job.owner == owner:
+                    return job
+        return None
+
+    def submit(self, fn, key=None, owner=None):
+        """
+        在后台线程中执行 fn(reporter)，返回 Job。fn 的返回值存入 job.result，异常存入 job.error。
+        同一 owner 提交同一 key 且任务尚未结束时直接返回那个任务（重复点击不会重复运行）。
+        """
+        running = self.find(key, owner) if key is not None else None
+        if running is not None and not running.done:
+            return running
+        job = Job(key=key, owner=owner)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        threading.Thread(target=self._run, args=(job, fn), name=f"audit-job-{job.id}", daemon=True).start()
+        return job
+
+    def _run(self, job, fn):
+        def on_wait(position, waited):
+            with job._lock:
+                job.queue_position = position
+
+        try:
+            slot = self.gate.slot(on_wait=on_wait) if self.gate is not None else nullcontext(0.0)
+            with slot as queued:
+                with job._lock:
+                    job.status = "running"
+                    job.queue_position = None
+                    job.queued_seconds = queued
+                    job.started = time.time()
+                result = fn(JobReporter(job))
+            with job._lock:
+                job.result = result
+                job.progress = 1.0
+                job.status = "done"
+                job.finished = time.time()
+        except Exception as e:
+            with job._lock:
+                job.error = e
+                job.status = "failed"
+                job.finished = time.time()
+
+    def _prune(self):
+        now = time.time()
+        for job_id, job in list(self._jobs.items()):
+            expired = job.done and job.finished and now - job.finished > self.keep_seconds
+            if expired or (len(self._jobs) > self.max_jobs and job.done):
+                del self._jobs[job_id]
+
@@ -0,0 +1,182 @@
+# =====================================
+# 📈 审核运行指标：分阶段耗时 / 行数 / 内存 + 可选 cProfile
+# =====================================
+"""
+run_full_audit 为每次运行创建一个 RunMetrics：
+
+    with metrics.stage("read:main", rows=...):   # 记录墙钟时间、处理行数、阶段内内存峰值
+        ...
+    metrics.add_sheet("二次", sheet_metrics)       # 合并单 sheet 的分阶段与逐列比对统计
+
+结果通过 to_dict() / to_json() 导出，Streamlit 页面展示为可折叠的明细表，命令行写到 JSON 文件。
+内存取本进程的常驻内存（RSS）：后台线程每 50ms 采样一次当前值，
+因此进程池模式下子进程的内存不计入（需要时用 workers=1 运行）。
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+MB = 1024 * 1024
+SAMPLE_INTERVAL = 0.05
+
+
+def current_rss_bytes():
+    """当前进程的常驻内存（字节）。Linux 读 /proc；其他平台退化为历史峰值；都不可用时为 None。"""
+    try:
+        with open("/proc/self/statm") as fh:
+            return int(fh.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
+
+
+class RunMetrics:
+    """一次审核运行的结构化指标。线程安全；stage 可以嵌套，也可以在多个线程中交错使用。"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.total_seconds = None
+        self.stages = []    # [{"name", "seconds", "rows", "peak_rss_mb", "cached"}]
+        self.columns = {}   # "fk - 租赁本金" -> {"seconds", "rows", "errors"}
+        self.sheets = {}    # sheet 关键词 -> {"rows", "seconds", "phases", "cached"}
+        self.profile = None  # {"top": [...], "text": "..."}，仅在开启剖析时存在
+        self._lock = threading.Lock()
+        self._open_peaks = []  # 正在进行中的各阶段内存峰值（列表里是可变的 [peak]）
+        self._stop = threading.Event()
+        self._sampler = None
+        self.peak_rss_mb = None
+
+    # --- 内存采样 ---
+    def _sample(self):
+        rss = current_rss_bytes()
+        if rss is None:
+            return
+        with self._lock:
+            if self.peak_rss_mb is None or rss / MB > self.peak_rss_mb:
+                self.peak_rss_mb = rss / MB
+            for peak in self._open_peaks:
+                if rss > peak[0]:
+                    peak[0] = rss
+
+    def _sample_loop(self):
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            self._sample()
+
+    def start(self):
+        if self._sampler is None and current_rss_bytes() is not None:
+            self._sampler = threading.Thread(target=self._sample_loop, name="audit-metrics-rss", daemon=True)
+            self._sampler.start()
+        return self
+
+    def finish(self):
+        self._stop.set()
+        if self._sampler is not None:
+            self._sampler.join()
+            self._sampler = None
+        self._sample()
+        self.total_seconds = time.time() - self.started
+        return self
+
+    # --- 记录 ---
+    @contextmanager
+    def stage(self, name, rows=None):
+        """
+        计时一个阶段。yield 出的 dict 可在阶段内补充信息，例如
+        info["rows"] = len(df) 或 info["cached"] = True。
+        """
+        info = {"name": name, "rows": rows, "cached": False, "seconds": None, "peak_rss_mb": None}
+        peak = [current_rss_bytes() or 0]
+        with self._lock:
+            self._open_peaks.append(peak)
+            self.stages.append(info)  # 按开始顺序排列
+        start = time.time()
+        try:
+            yield info
+        finally:
+            self._sample()
+            with self._lock:
+                # 按对象身份移除：嵌套阶段的峰值可能相等，list.remove 会误删外层的
+                self._open_peaks = [p for p in self._open_peaks if p is not peak]
+                info["seconds"] = round(time.time() - start, 4)
+                info["peak_rss_mb"] = round(peak[0] / MB, 1) if peak[0] else None
+
+    def add_sheet(self, name, sheet_metrics, seconds=None, cached=False):
+        """
+        记录 check_one_sheet 返回的单 sheet 指标（rows / phases / columns），
+        逐列统计按列累加到 self.columns。cached=True 表示结果来自缓存，数字是当初计算时的耗时。
+        """
+        if not sheet_metrics:
+            return
+        with self._lock:
+            self.sheets[name] = {
+                "rows": int(sheet_metrics.get("rows", 0)),
+                "seconds": None if seconds is None else round(seconds, 4),
+                "phases": {k: round(v, 4) for k, v in sheet_metrics.get("phases", {}).items()},
+                "cached": cached,
+            }
+            if sheet_metrics.get("incremental"):
+                self.sheets[name]["incremental"] = sheet_metrics["incremental"]
+            for label, c in sheet_metrics.get("columns", {}).items():
+                agg = self.columns.setdefault(label, {"seconds": 0.0, "rows": 0, "errors": 0})
+                agg["seconds"] += c["seconds"]
+                agg["rows"] += c["rows"]
+                agg["errors"] += c["errors"]
+
+    # --- 导出 ---
+    def to_dict(self):
+        return {
+            "total_seconds": None if self.total_seconds is None else round(self.total_seconds, 4),
+            "peak_rss_mb": None if self.peak_rss_mb is None else round(self.peak_rss_mb, 1),
+            "stages": [dict(s) for s in self.stages],
+            "sheets": self.sheets,
+            "columns": {
+                label: {**c, "seconds": round(c["seconds"], 4), "rows": int(c["rows"]), "errors": int(c["errors"])}
+                for label, c in self.columns.items()
+            },
+            "profile": self.profile,
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), ensure_ascii=False, indent=2, default=str)
+
+
+@contextmanager
+def profiling(metrics, enabled, top=30):
+    """enabled 时用 cProfile 剖析整个代码块，按累计耗时取前 top 个函数写入 metrics.profile。"""
+    if not enabled:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        text = io.StringIO()
+        stats = pstats.Stats(profiler, stream=text).sort_stats("cumulative")
+        stats.print_stats(top)
+        rows = []
+        for (filename, line, func), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{os.path.basename(filename)}:{line}({func})",
+                "calls": ncalls,
+                "tottime": round(tottime, 4),
+                "cumtime": round(cumtime, 4),
+            })
+        rows.sort(key=lambda r: -r["cumtime"])
+        metrics.profile = {"top": rows[:top], "text": text.getvalue()}
@@ -0,0 +1,245 @@
+# =====================================
+# ⏩ 上传即预解析：文件一到就在后台解析、标准化，点“开始审核”时直接取用
+# =====================================
+"""
+上传框里的文件往往在点击“开始审核”之前几十秒甚至几分钟就已经到了，
+而解析四个工作簿（尤其是可编辑模式加载月重卡）是一次审核里最慢的部分之一。
+Prefetcher 在文件上传后立即按角色（月重卡 / 各参考来源）在后台解析：
+
+    prefetcher = Prefetcher(workers=1)
+    prefetcher.update(owner, uploaded_files, cache=会话缓存)   # 每次脚本运行调用：新文件开始解析，换掉/移除的文件取消
+    run_full_audit(files, prefetched=prefetcher.session(owner), ...)
+    prefetcher.discard(owner)                                   # “重新上传”时取消并丢弃该会话的全部预解析
+
+每个任务以 (会话, 角色) 登记、以文件内容摘要识别：
+- 月重卡：read_book('main') 解析出的工作簿与各 sheet，交给审核取用一次（标注会修改工作簿，不能复用）
+- 参考表：解析后立即 prepare_ref_df 标准化，结果按 ref_std_key 放进会话缓存，审核时直接命中；
+  字段表的原表还要做漏填检查，同样交给审核取用一次
+审核需要某个文件时（PrefetchSession.take）：预解析已完成直接取用；正在解析就等它完成，不重复解析；
+还在排队、没开始的任务撤销，由审核自己解析（不必排在别人的预解析后面）。
+留给审核取用的结果（月重卡工作簿、字段表原表）同样放在会话缓存里，占用计入该会话的缓存预算，
+超出预算时按 LRU 淘汰（审核时自己解析）；登记后 keep_seconds 内没被取用的任务由后台定时清理。
+
+取消：文件被移除或换成另一份内容时任务被取消。排队中的任务直接撤销；正在运行的任务在
+打开工作簿后、每个 sheet 解析前、标准化前后检查取消标记，中止并丢弃结果
+（openpyxl 打开工作簿这一步本身无法中途打断）。
+预解析不占审核准入名额（AdmissionGate），并行度由 workers 限制；workers=0 时不预解析。
+"""
+
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+from audit_cache import file_digest
+from audit_engine import find_file, prepare_ref_df, read_book, ref_std_key
+from audit_jobs import detach_files
+from audit_rules import RULES
+from workbook_loader import LoadCancelled, required_sheet_df
+
+MAIN_KEYWORD = "月重卡"
+
+
+class PrefetchCancelled(Exception):
+    """预解析任务已被取消。"""
+
+
+class PrefetchTask:
+    """一个文件的预解析任务。state: queued → running → done / failed / cancelled。"""
+
+    def __init__(self, role, digest, rules):
+        self.role = role
+        self.digest = digest
+        self.rules = rules
+        self.state = "queued"
+        self.created = time.time()
+        self.elapsed = None
+        self.result = None    # 交给审核取用的解析结果（没有会话缓存时留在任务上）
+        self.cache = None     # 会话缓存：有的话结果放在那里，键为 result_key
+        self.result_key = ("prefetched", role, digest)
+        self.taken = False    # 已被审核取用（或撤销后由审核自己解析），不再重新预解析
+        self.future = None
+        self.cancel = threading.Event()
+
+    def stop(self):
+        self.cancel.set()
+        if self.future is not None and self.future.cancel():
+            self.state = "cancelled"
+        self.release()
+
+    def keep(self, result):
+        """保存交给审核取用的结果：有会话缓存时放进缓存（计入该会话的预算，可能被淘汰），否则留在任务上。"""
+        if result is not None and self.cache is not None:
+            self.cache.put(self.result_key, result)
+        else:
+            self.result = result
+
+    def release(self):
+        """取出并删除保存的结果；已被缓存淘汰时为 None。"""
+        result, self.result = self.result, None
+        if self.cache is not None:
+            cached = self.cache.pop(self.result_key)
+            result = cached if result is None else result
+        return result
+
+    def check(self):
+        if self.cancel.is_set():
+            raise PrefetchCancelled(self.role)
+
+
+def prefetch_book(task, f, cache=None):
+    """后台任务本体：解析工作簿；参考表再标准化，按 ref_std_key 放入审核缓存。"""
+    start = time.time()
+    task.state = "running"
+    try:
+        task.check()
+        loaded = read_book(task.role, f, task.rules, cancel=task.cancel)
+        if task.role != 'main':
+            source = task.rules.sources[task.role]
+            key = ref_std_key(source, task.digest)
+            if cache is not None and key not in cache:
+                std_df = prepare_ref_df(required_sheet_df(loaded, source.sheet), source)
+                task.check()
+                cache.put(key, std_df)
+            if task.role != 'zd':
+                loaded = None  # 放款明细 / 二次明细 审核只用标准化结果；字段表原表还要做漏填检查
+        task.check()
+        task.keep(loaded)
+        task.state = "done"
+    except (PrefetchCancelled, LoadCancelled):
+        task.state = "cancelled"
+    except Exception:
+        # 预解析失败不报错：审核时取不到结果，会自己解析并给出正常的错误提示
+        task.state = "failed"
+    finally:
+        task.elapsed = time.time() - start
+        if task.cancel.is_set():
+            task.release()
+
+
+class Prefetcher:
+    """
+    进程内共享的预解析任务表。线程安全。
+    workers      - 同时预解析的文件数（后台线程池大小），0 表示不预解析
+    keep_seconds - 登记后超过这么久仍未被审核取用的任务丢弃（释放解析结果占用的内存）
+    prune_interval - 后台定时清理过期任务的间隔（秒）：没有新的上传时过期结果也会按时释放
+    """
+
+    def __init__(self, workers=1, keep_seconds=600, prune_interval=60):
+        self.workers = workers
+        self.keep_seconds = keep_seconds
+        self.prune_interval = prune_interval
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="audit-prefetch") if workers > 0 else None
+        self._tasks = {}  # (owner, 角色) -> PrefetchTask
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if self._pool is not None:
+            threading.Thread(target=self._prune_loop, name="audit-prefetch-prune", daemon=True).start()
+
+    def update(self, owner, files, cache=None, rules=None, skip=(), digest=file_digest):
+        """
+        按 owner 当前上传的文件同步预解析任务：
+        新出现的文件开始解析；被移除或内容变了的文件取消原任务（内容变了的重新解析）。
+        cache 为该会话的审核缓存（参考表标准化结果放在这里）；skip 为不预解析的角色（如流式模式的 'main'）。
+        digest 为求文件内容摘要的函数（默认 file_digest，页面可传入按上传文件记忆的版本）。
+        """
+        rules = rules or RULES
+        keywords = {'main': MAIN_KEYWORD, **{prefix: source.file for prefix, source in rules.sources.items()}}
+        wanted = {}
+        for role, keyword in keywords.items():
+            f = find_file(files, keyword) if role not in skip else None
+            if f is not None:
+                wanted[role] = (f, digest(f))
+
+        with self._lock:
+            self._prune()
+            for (task_owner, role), task in list(self._tasks.items()):
+                if task_owner != owner:
+                    continue
+                if role not in wanted or wanted[role][1] != task.digest or task.rules is not rules:
+                    task.stop()
+                    del self._tasks[(owner, role)]
+            if self._pool is None:
+                return
+            for role, (f, file_hash) in wanted.items():
+                if (owner, role) not in self._tasks:
+                    task = PrefetchTask(role, file_hash, rules)
+                    task.cache = cache
+                    # 复制一份：上传的文件对象可能在任务完成前就被 Streamlit 回收
+                    task.future = self._pool.submit(prefetch_book, task, detach_files([f])[0], cache)
+                    self._tasks[(owner, role)] = task
+
+    def take(self, owner, role, digest, rules=None):
+        """
+        取走 owner 的 role 文件（内容摘要为 digest）的预解析结果，只能取一次；取不到返回 None。
+        正在解析时等待完成；还在排队的任务撤销（返回 None，由调用方自己解析）。
+        参考表的解析按规则投影列，rules 与预解析时不同则不取用。
+        """
+        with self._lock:
+            task = self._tasks.get((owner, role))
+            if task is None or task.taken or task.digest != digest:
+                return None
+            if role != 'main' and task.rules is not (rules or RULES):
+                return None
+            if task.future.cancel():
+                task.state = "cancelled"
+                task.taken = True
+                return None
+        try:
+            task.future.result()
+        except CancelledError:
+            return None
+        with self._lock:
+            if task.taken:
+                return None
+            task.taken = True
+            return task.release()
+
+    def discard(self, owner):
+        """取消并丢弃 owner 的全部预解析任务。"""
+        with self._lock:
+            for key in [key for key in self._tasks if key[0] == owner]:
+                self._tasks.pop(key).stop()
+
+    def status(self, owner):
+        """{角色: (状态, 解析用时或 None)}，供页面展示。"""
+        with self._lock:
+            return {
+                role: ("taken" if task.taken else task.state, task.elapsed)
+                for (task_owner, role), task in self._tasks.items() if task_owner == owner
+            }
+
+    def session(self, owner):
+        """owner 的视图（PrefetchSession），可直接传给 run_full_audit(prefetched=...)。"""
+        return PrefetchSession(self, owner)
+
+    def close(self):
+        """停止定时清理，取消并丢弃全部任务。"""
+        self._stop.set()
+        with self._lock:
+            for task in self._tasks.values():
+                task.stop()
+            self._tasks.clear()
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def _prune(self):
+        now = time.time()
+        for key, task in list(self._tasks.items()):
+            if now - task.created > self.keep_seconds:
+                self._tasks.pop(key).stop()
+
+    def _prune_loop(self):
+        while not self._stop.wait(self.prune_interval):
+            with self._lock:
+                self._prune()
+
+
+class PrefetchSession:
+    """Prefetcher 中某个会话的视图：take(role, digest, rules) 见 Prefetcher.take。"""
+
+    def __init__(self, prefetcher, owner):
+        self.prefetcher = prefetcher
+        self.owner = owner
+
+    def take(self, role, digest, rules=None):
+        return self.prefetcher.take(self.owner, role, digest, rules)
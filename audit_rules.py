@@ -0,0 +1,233 @@
+# =====================================
+# 📐 比对规则：从配置文件加载，按表头编译成执行计划
+# =====================================
+"""
+比对哪些列、怎么比，全部写在 audit_rules.json（环境变量 AUDIT_RULES 可指定其它文件），不再散落在代码里：
+
+    RULES = load_rules()                                   # 启动时加载一次
+    plan = RULES.plan(main_df.columns, ref_index.columns)  # 同样的表头只解析一次列位置（按表头签名缓存）
+    plan.contract                                          # 合同列名
+    for step in plan.steps:                                # 本 sheet 实际参与比对的规则
+        step.rule, step.column, step.position              # 规则、主表列名、列位置
+
+每条规则的字段：
+    main            月重卡列名关键词
+    ref             参考表列名关键词
+    match           "contains"（默认，列名包含关键词，不区分大小写）或 "exact"（列名完全相同），主表与参考表相同
+    type            "number"（默认，数值/百分比比较）或 "date"（按日比较，参考列预先解析为日期）
+    tolerance       数值规则允许的差值，默认 1e-6；inclusive 为 true 时差值 ≥ tolerance 即为错误，否则 > tolerance
+    ref_transform   参考列的预处理，取 REF_TRANSFORMS 中的名字，如 "years_to_months"（年 → 月，×12）
+    skip_blank_ref  参考值为空（空白、-、nan、none、null）的行不比较，计入跳过数
+新增或修改规则只需编辑配置文件；新的预处理方式在 REF_TRANSFORMS 中登记。
+"""
+
+import json
+import os
+import threading
+
+import pandas as pd
+
+from audit_cache import config_digest
+from date_kernel import parse_date_column
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "audit_rules.json")
+
+REF_TRANSFORMS = {
+    "years_to_months": lambda s: pd.to_numeric(s, errors="coerce") * 12,
+}
+RULE_TYPES = ("number", "date")
+MATCH_MODES = ("contains", "exact")
+PLAN_CACHE_SIZE = 256  # 每份规则最多缓存的表头布局数
+
+
+def normalize_colname(c): return str(c).strip().lower()
+
+
+def match_column(names, keyword, exact=False):
+    """names 为 normalize_colname 之后的列名；返回第一个匹配列的位置，找不到为 None（规则与 find_col 相同）。"""
+    key = keyword.strip().lower()
+    for pos, name in enumerate(names):
+        if (exact and name == key) or (not exact and key in name):
+            return pos
+    return None
+
+
+def header_signature(columns):
+    """表头签名：列名连同类型（1、1.0、"1" 是不同的列名）。"""
+    return tuple((type(c).__name__, c) for c in columns)
+
+
+class Rule:
+    """一条比对规则（字段含义见模块说明）。"""
+
+    def __init__(self, prefix, main, ref, match="contains", type="number", tolerance=1e-6, inclusive=False,
+                 ref_transform=None, skip_blank_ref=False):
+        if match not in MATCH_MODES:
+            raise ValueError(f"规则「{main}」的 match 只能是 {MATCH_MODES}，而不是 {match!r}")
+        if type not in RULE_TYPES:
+            raise ValueError(f"规则「{main}」的 type 只能是 {RULE_TYPES}，而不是 {type!r}")
+        if ref_transform is not None and ref_transform not in REF_TRANSFORMS:
+            raise ValueError(f"规则「{main}」的 ref_transform {ref_transform!r} 未在 REF_TRANSFORMS 中登记")
+        self.prefix = prefix
+        self.main = main
+        self.ref = ref
+        self.match = match
+        self.type = type
+        self.tolerance = float(tolerance)
+        self.inclusive = bool(inclusive)
+        self.ref_transform = ref_transform
+        self.skip_blank_ref = bool(skip_blank_ref)
+        self.label = f"{prefix} - {main}"       # 指标、增量指纹库中的规则名
+        self.ref_col = f"ref_{prefix}_{main}"   # 标准化参考表 / 参考索引中的列名
+
+    def __repr__(self):
+        return f"Rule({self.label!r})"
+
+    def __str__(self):
+        return self.main
+
+    @property
+    def exact(self):
+        return self.match == "exact"
+
+    @property
+    def is_date(self):
+        return self.type == "date"
+
+    def spec(self):
+        """规则的完整定义（参与缓存键与参考数据版本的计算）。"""
+        return {
+            "main": self.main, "ref": self.ref, "match": self.match, "type": self.type,
+            "tolerance": self.tolerance, "inclusive": self.inclusive,
+            "ref_transform": self.ref_transform, "skip_blank_ref": self.skip_blank_ref,
+        }
+
+    def is_error(self, diff):
+        """数值规则：差值绝对值数组 → 超出容差的布尔数组。"""
+        return diff >= self.tolerance if self.inclusive else diff > self.tolerance
+
+    def prepare_ref(self, s):
+        """参考列的预处理：先按 ref_transform 转换；日期规则在这里按合同键只解析一次，四个 sheet 共用。"""
+        if self.ref_transform is not None:
+            return REF_TRANSFORMS[self.ref_transform](s)
+        if self.is_date:
+            return parse_date_column(s)
+        return s
+
+
+class PlanStep:
+    """执行计划中的一步：规则 + 主表中解析好的列。"""
+
+    __slots__ = ("rule", "column", "position")
+
+    def __init__(self, rule, column, position):
+        self.rule = rule
+        self.column = column
+        self.position = position
+
+
+class SheetPlan:
+    """一种主表表头布局的执行计划：合同列 + 按规则顺序排列的比对步骤。"""
+
+    def __init__(self, contract, steps):
+        self.contract = contract
+        self.steps = steps
+
+
+class RefPlan:
+    """一种参考表表头布局的解析结果：合同列 + [(规则, 参考列名或 None)]。"""
+
+    def __init__(self, contract, columns):
+        self.contract = contract
+        self.columns = columns
+
+
+class Source:
+    """一个参考来源：文件名关键词、sheet 关键词（None 为第一个 sheet）与该来源的规则。"""
+
+    def __init__(self, prefix, file, sheet, rules):
+        self.prefix = prefix
+        self.file = file
+        self.sheet = sheet
+        self.rules = [Rule(prefix, **spec) for spec in rules]
+        self.digest = config_digest([sheet, [rule.spec() for rule in self.rules]])
+        self.ruleset = None  # 所属的 RuleSet，由 RuleSet 设置
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    @property
+    def mapping(self):
+        """{主表列关键词: 参考列关键词}（展示用）。"""
+        return {rule.main: rule.ref for rule in self.rules}
+
+    def resolve(self, columns):
+        """参考表表头 → RefPlan（按表头签名缓存）。"""
+        signature = header_signature(columns)
+        with self._lock:
+            plan = self._plans.get(signature)
+        if plan is None:
+            names = [normalize_colname(c) for c in columns]
+            columns = list(columns)
+
+            def column_of(keyword, exact=False):
+                pos = match_column(names, keyword, exact)
+                return None if pos is None else columns[pos]
+
+            plan = RefPlan(column_of("合同"), [(rule, column_of(rule.ref, rule.exact)) for rule in self.rules])
+            with self._lock:
+                if len(self._plans) >= PLAN_CACHE_SIZE:
+                    self._plans.clear()
+                self._plans[signature] = plan
+        return plan
+
+
+class RuleSet:
+    """全部参考来源的规则，按配置中的顺序。"""
+
+    def __init__(self, sources, path=None):
+        self.path = path
+        self.sources = {
+            prefix: Source(prefix, spec.get("file"), spec.get("sheet"), spec.get("rules", []))
+            for prefix, spec in sources.items()
+        }
+        for source in self.sources.values():
+            source.ruleset = self
+        self.rules = [rule for source in self.sources.values() for rule in source.rules]
+        self.digest = config_digest([source.digest for source in self.sources.values()])
+        self._plans = {}
+        self._lock = threading.Lock()
+
+    def plan(self, columns, available):
+        """
+        主表表头 → SheetPlan（按表头签名 + 参考索引中可用的列缓存，同样的布局只解析一次）。
+        available 为参考索引中存在的 ref 列名；参考表缺列的规则不进入计划。
+        """
+        key = (header_signature(columns), frozenset(available))
+        with self._lock:
+            plan = self._plans.get(key)
+        if plan is None:
+            names = [normalize_colname(c) for c in columns]
+            columns = list(columns)
+            contract = match_column(names, "合同")
+            steps = []
+            for rule in self.rules:
+                pos = match_column(names, rule.main, rule.exact)
+                if pos is not None and rule.ref_col in key[1]:
+                    steps.append(PlanStep(rule, columns[pos], pos))
+            plan = SheetPlan(None if contract is None else columns[contract], steps)
+            with self._lock:
+                if len(self._plans) >= PLAN_CACHE_SIZE:
+                    self._plans.clear()
+                self._plans[key] = plan
+        return plan
+
+
+def load_rules(path=None):
+    """从 JSON 文件加载规则：path，否则环境变量 AUDIT_RULES，否则随程序提供的 audit_rules.json。"""
+    path = path or os.environ.get("AUDIT_RULES") or DEFAULT_RULES_PATH
+    with open(path, encoding="utf-8") as fh:
+        config = json.load(fh)
+    return RuleSet(config["sources"], path=path)
+
+
+RULES = load_rules()
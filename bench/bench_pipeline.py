@@ -0,0 +1,223 @@
+# =====================================
+# ⏱️ 基准：整套审核流程分阶段计时 + 峰值内存 + 基线对比
+# =====================================
+"""
+用法:
+    python bench/bench_pipeline.py                          # 默认 1k / 10k 行
+    python bench/bench_pipeline.py 1000 10000 100000 500000 --error-rate 0.05 --missing-rate 0.03
+    python bench/bench_pipeline.py 10000 --save bench/baseline.json
+    python bench/bench_pipeline.py 10000 --compare bench/baseline.json --tolerance 0.2
+    python bench/bench_pipeline.py 20000 --extra-cols 40     # 很宽的参考表（看按列投影读取的内存）
+
+每个规模在独立子进程中运行 audit_engine.run_full_audit（串行、不带缓存），
+峰值内存取子进程的 ru_maxrss。分阶段耗时通过临时包裹引擎里的函数得到：
+    read      load_workbook_sheets（四个文件的解析）
+    prepare   prepare_ref_df
+    index     RefIndex 构建（原逐 sheet merge）
+    align     RefIndex.lookup / take（按合同键对齐参考值）
+    compare   compare_block（整块比对，另按 “列名” 分列记录）
+    annotate  fill_cells（在原工作簿上标注）
+    save      save_single_sheet（标注版单 sheet 保存）
+    leaky     run_leaky_check（含两份漏填报告写出）
+    other     总耗时减去以上各项（“仅错误行”报告、日志等）
+测试数据由 generate_data.py 生成并按参数缓存在临时目录，重复运行不会重新生成。
+--compare 时任一阶段比基线慢超过 tolerance（且绝对差超过 0.05 秒）即以退出码 1 结束。
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+sys.path.insert(0, BENCH_DIR)
+
+PHASES = ["read", "prepare", "index", "align", "compare", "annotate", "save", "leaky", "other"]
+DATA_ROOT = os.path.join(tempfile.gettempdir(), "audit_bench_data")
+NOISE_FLOOR = 0.05  # 秒；低于此的差异视为噪声
+
+
+def dataset_dir(rows, error_rate, missing_rate, seed, extra_cols=0):
+    suffix = f"_wide{extra_cols}" if extra_cols else ""
+    return os.path.join(DATA_ROOT, f"rows{rows}_err{error_rate}_miss{missing_rate}_seed{seed}{suffix}")
+
+
+def ensure_dataset(rows, error_rate, missing_rate, seed, extra_cols=0):
+    from generate_data import generate
+
+    outdir = dataset_dir(rows, error_rate, missing_rate, seed, extra_cols)
+    marker = os.path.join(outdir, ".done")
+    if not os.path.exists(marker):
+        start = time.perf_counter()
+        generate(outdir, rows, error_rate, missing_rate, seed, extra_cols)
+        open(marker, "w").close()
+        print(f"🧪 生成 {rows} 行测试数据用时 {time.perf_counter() - start:.1f} 秒", file=sys.stderr)
+    return outdir
+
+
+def _wrap(owner, name, phase, timings, per_column=False):
+    """把 owner.name 替换为计时版本，耗时累加到 timings[phase]。"""
+    original = getattr(owner, name)
+
+    def timed(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            timings[phase] += elapsed
+            if per_column:
+                # compare_block(mains, refs, rules, ..., seconds=逐列耗时)：整块耗时按引擎记录的逐列耗时拆分
+                rules, seconds = args[2], kwargs.get("seconds")
+                for i, rule in enumerate(rules):
+                    timings[f"compare:{rule}"] += seconds[i] if seconds is not None else elapsed / len(rules)
+
+    setattr(owner, name, timed)
+
+
+def run_case(folder):
+    """在当前进程中跑一遍完整审核，返回分阶段耗时、错误数与峰值内存。"""
+    import audit_engine
+    from ref_index import RefIndex
+
+    timings = defaultdict(float)
+    _wrap(audit_engine, "load_workbook_sheets", "read", timings)
+    _wrap(audit_engine, "prepare_ref_df", "prepare", timings)
+    _wrap(RefIndex, "__init__", "index", timings)
+    _wrap(RefIndex, "lookup_ids", "align", timings)
+    _wrap(RefIndex, "take", "align", timings)
+    _wrap(audit_engine, "compare_block", "compare", timings, per_column=True)
+    _wrap(audit_engine, "fill_cells", "annotate", timings)
+    _wrap(audit_engine, "save_single_sheet", "save", timings)
+    _wrap(audit_engine, "run_leaky_check", "leaky", timings)
+
+    paths = sorted(os.path.join(folder, n) for n in os.listdir(folder) if n.endswith(".xlsx"))
+    files = [open(p, "rb") for p in paths]
+    start = time.perf_counter()
+    try:
+        _, stats = audit_engine.run_full_audit(files, workers=1)
+    finally:
+        for f in files:
+            f.close()
+    total = time.perf_counter() - start
+
+    phases = {p: round(timings[p], 4) for p in PHASES if p != "other"}
+    phases["other"] = round(max(total - sum(phases.values()), 0.0), 4)
+    columns = {k.split(":", 1)[1]: round(v, 4) for k, v in timings.items() if k.startswith("compare:")}
+    # Linux 上 ru_maxrss 单位为 KB，macOS 为字节
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_mb = peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    return {
+        "total": round(total, 4),
+        "phases": phases,
+        "compare_columns": columns,
+        "peak_rss_mb": round(peak_mb, 1),
+        "total_errors": int(stats["total_all"]),
+        "missing_contracts": int(stats["漏填合同数"]),
+    }
+
+
+def run_case_isolated(folder):
+    """在子进程中运行单个规模，保证峰值内存互不影响。"""
+    out = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-case", folder],
+        check=True, capture_output=True, text=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """返回回归列表 [(规模, 阶段, 基线秒, 本次秒)]。"""
+    regressions = []
+    base_cases = {c["rows"]: c for c in baseline["cases"]}
+    for case in results["cases"]:
+        base = base_cases.get(case["rows"])
+        if base is None:
+            continue
+        for phase in ["total"] + PHASES:
+            old = base["total"] if phase == "total" else base["phases"].get(phase, 0.0)
+            new = case["total"] if phase == "total" else case["phases"].get(phase, 0.0)
+            if new > old * (1 + tolerance) and new - old > NOISE_FLOOR:
+                regressions.append((case["rows"], phase, old, new))
+    return regressions
+
+
+def print_table(results, baseline=None):
+    base_cases = {c["rows"]: c for c in (baseline or {}).get("cases", [])}
+    header = f"{'行数':>8} " + " ".join(f"{p:>9}" for p in PHASES) + f" {'总计':>9} {'峰值MB':>8} {'错误':>6} {'漏填':>6}"
+    print(header)
+    for case in results["cases"]:
+        print(f"{case['rows']:>8} " + " ".join(f"{case['phases'][p]:>9.3f}" for p in PHASES)
+              + f" {case['total']:>9.3f} {case['peak_rss_mb']:>8.1f} {case['total_errors']:>6} {case['missing_contracts']:>6}")
+        base = base_cases.get(case["rows"])
+        if base:
+            print(f"{'基线':>8} " + " ".join(f"{base['phases'].get(p, 0.0):>9.3f}" for p in PHASES)
+                  + f" {base['total']:>9.3f} {base['peak_rss_mb']:>8.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="审核流程分阶段基准")
+    parser.add_argument("rows", nargs="*", type=int, help="字段表行数，可给多个（默认 1000 10000）")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--missing-rate", type=float, default=0.03)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--extra-cols", type=int, default=0, help="参考表追加的无关列数（默认 0）")
+    parser.add_argument("--save", help="把结果写成 JSON 基线")
+    parser.add_argument("--compare", help="与已有 JSON 基线对比，出现回归时退出码为 1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="允许的相对变慢比例（默认 0.2）")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(args.run_case)))
+        return 0
+
+    results = {
+        "meta": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "error_rate": args.error_rate,
+            "missing_rate": args.missing_rate,
+            "seed": args.seed,
+            "extra_cols": args.extra_cols,
+            "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "cases": [],
+    }
+    for rows in args.rows or [1000, 10000]:
+        folder = ensure_dataset(rows, args.error_rate, args.missing_rate, args.seed, args.extra_cols)
+        case = run_case_isolated(folder)
+        case["rows"] = rows
+        results["cases"].append(case)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            baseline = json.load(fh)
+    print_table(results, baseline)
+
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, ensure_ascii=False, indent=2)
+        print(f"💾 结果已写入 {args.save}")
+
+    if baseline is not None:
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        for rows, phase, old, new in regressions:
+            print(f"❌ {rows} 行 {phase}: {old:.3f}s → {new:.3f}s (+{(new / old - 1) * 100 if old else float('inf'):.0f}%)")
+        if regressions:
+            return 1
+        print(f"✅ 与基线相比没有超过 {args.tolerance:.0%} 的回归。")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
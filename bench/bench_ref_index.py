@@ -0,0 +1,78 @@
+# =====================================
+# ⏱️ 基准：逐 sheet 三次 pd.merge vs. 预构建 RefIndex + take
+# =====================================
+"""
+用法:  python bench/bench_ref_index.py [行数 ...]      (默认 100000 300000)
+
+模拟 4 个 sheet 对同一组参考表（fk/zd/ec）做对齐：
+    merge 方案：每个 sheet main_df.copy() 后连续三次 left merge
+    index 方案：RefIndex 只构建一次，每个 sheet 一次 lookup + 每列一次 take
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from ref_index import RefIndex  # noqa: E402
+
+N_SHEETS = 4
+
+
+def make_frames(n, seed=0):
+    rng = np.random.default_rng(seed)
+    keys = np.array([f"HT-2024-{i:07d}" for i in range(n)], dtype=object)
+
+    def std(prefix, cols, frac):
+        picked = keys[rng.random(n) < frac]
+        df = pd.DataFrame({'__KEY__': picked})
+        for c in cols:
+            df[f'ref_{prefix}_{c}'] = rng.random(len(picked)) if c != "授信方" else rng.choice(["银行A", "银行B"], len(picked))
+        return df
+
+    std_frames = {
+        'fk': std('fk', ["授信方", "租赁本金", "租赁期限", "挂车台数", "起租收益率"], 0.97),
+        'zd': std('zd', ["保证金比例", "项目提报人", "起租时间", "客户经理", "所属省区", "主车台数", "城市经理"], 1.0),
+        'ec': std('ec', ["二次时间"], 0.6),
+    }
+    main_df = pd.DataFrame({f"列{i}": rng.random(n) for i in range(15)})
+    main_df['__ROW_IDX__'] = main_df.index
+    main_df['__KEY__'] = rng.permutation(keys)
+    return main_df, std_frames
+
+
+def bench_merge(main_df, std_frames):
+    start = time.perf_counter()
+    for _ in range(N_SHEETS):
+        merged_df = main_df.copy()
+        for std_df in std_frames.values():
+            merged_df = pd.merge(merged_df, std_df, on='__KEY__', how='left')
+        aligned = {c: merged_df[c] for c in merged_df.columns if c.startswith('ref_')}
+    return time.perf_counter() - start, aligned
+
+
+def bench_index(main_df, std_frames):
+    start = time.perf_counter()
+    ref_index = RefIndex(std_frames)
+    for _ in range(N_SHEETS):
+        ids = ref_index.lookup(main_df['__KEY__'])
+        aligned = {c: ref_index.take(c, ids, index=main_df.index) for c in ref_index.columns}
+    return time.perf_counter() - start, aligned
+
+
+def main(sizes):
+    print(f"{'行数':>10} {'merge(秒)':>12} {'RefIndex(秒)':>14} {'加速比':>8}")
+    for n in sizes:
+        main_df, std_frames = make_frames(n)
+        t_merge, a = bench_merge(main_df, std_frames)
+        t_index, b = bench_index(main_df, std_frames)
+        for c in a:
+            pd.testing.assert_series_equal(a[c], b[c], check_names=False, check_dtype=False)
+        print(f"{n:>10} {t_merge:>12.3f} {t_index:>14.3f} {t_merge / t_index:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main([int(a) for a in sys.argv[1:]] or [100000, 300000])
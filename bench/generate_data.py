@@ -0,0 +1,133 @@
+# =====================================
+# 🧪 基准数据生成：模拟一套 月重卡 / 放款明细 / 字段 / 二次明细
+# =====================================
+"""
+用法:  python bench/generate_data.py 输出目录 [行数] [--error-rate 0.05] [--missing-rate 0.03] [--seed 0] [--extra-cols 0]
+
+行数 = 字段表中的合同数。生成的四个文件与线上文件结构一致：
+    2024年10月重卡.xlsx  4 个 sheet（二次业务/部分担保/随州/驻店客户），第 1 行标题、第 2 行表头
+    放款明细.xlsx        「威田放款」sheet（租赁期限以年计，审核时 ×12）
+    字段.xlsx            「重卡」sheet（保证金比例为百分比文本，含 是否车管家 / 提成类型）
+    二次明细.xlsx        第一个 sheet
+error_rate   - 月重卡中被改错的行比例（每行改错一列）
+missing_rate - 放款明细 / 二次明细中缺失的合同比例
+extra_cols   - 三个参考表各追加的无关列数（文本 / 数字交替），模拟线上很宽的参考表
+另外固定混入约 1% 去掉连字符的合同号、1% 空本金、表尾空行与文本数字行，覆盖清洗分支。
+用 write-only 模式写出，50 万行也不会占满内存。
+"""
+
+import argparse
+import datetime
+import os
+import random
+
+from openpyxl import Workbook
+
+MAIN_FILE = "2024年10月重卡.xlsx"
+MAIN_SHEETS = ["二次业务", "部分担保", "随州", "驻店客户"]
+MAIN_COLUMNS = ["合同编号", "授信方", "租赁本金", "租赁期限", "挂车台数", "起租收益率", "保证金比例", "项目提报人", "起租时间",
+                "客户经理", "所属省区", "主车台数", "城市经理", "二次时间", "备注"]
+TERM_COL = MAIN_COLUMNS.index("租赁期限")
+PRINCIPAL_COL = MAIN_COLUMNS.index("租赁本金")
+
+
+def _write(path, sheets):
+    """sheets: [(sheet 名, 行迭代器)]，write-only 写出。"""
+    wb = Workbook(write_only=True)
+    for title, rows in sheets:
+        ws = wb.create_sheet(title)
+        for row in rows:
+            ws.append(row)
+    wb.save(path)
+
+
+def _widen(header, rows, extra_cols, seed):
+    """给参考表追加 extra_cols 个无关列；用独立的随机数，extra_cols=0 时与原数据完全相同。"""
+    if not extra_cols:
+        return [header] + rows
+    rng = random.Random(seed + 1)
+    names = [f"附加字段{j}" for j in range(extra_cols)]
+    return [header + names] + [
+        row + [f"说明{rng.randint(0, 99999)}" if j % 2 == 0 else round(rng.uniform(0, 1e4), 2) for j in range(extra_cols)]
+        for row in rows
+    ]
+
+
+def generate(outdir, rows=2000, error_rate=0.05, missing_rate=0.03, seed=0, extra_cols=0):
+    """在 outdir 下生成一套四个文件，返回 outdir。相同参数生成的内容完全相同。"""
+    rng = random.Random(seed)
+    os.makedirs(outdir, exist_ok=True)
+    keys = [f"HT-2024-{i:06d}" for i in range(rows)]
+    provinces = ["湖北", "河南", "江苏", "广东"]
+    base = datetime.datetime(2023, 1, 1)
+
+    ref, fk_rows, zd_rows, ec_rows = {}, [], [], []
+    for k in keys:
+        r = dict(授信方=rng.choice(["银行A", "银行B", "自有"]), 租赁本金=round(rng.uniform(1e5, 9e5), 2),
+                 租赁期限=rng.choice([1, 2, 3]), 挂车台数=rng.randint(0, 3), 起租收益率=round(rng.uniform(0.05, 0.12), 4),
+                 保证金比例=rng.choice([0.1, 0.15, 0.2]), 项目提报人=rng.choice(["张三", "李四", "王五"]),
+                 起租时间=base + datetime.timedelta(days=rng.randint(0, 600)), 客户经理=rng.choice(["赵", "钱", "孙"]),
+                 所属省区=rng.choice(provinces), 主车台数=rng.randint(1, 5), 城市经理=rng.choice(["周", "吴", "-", None]),
+                 二次时间=base + datetime.timedelta(days=rng.randint(0, 600)))
+        ref[k] = r
+        if rng.random() > missing_rate:
+            fk_rows.append([k, r["授信方"], r["租赁本金"], r["租赁期限"], r["挂车台数"], r["起租收益率"], "x"])
+        zd_rows.append([k, f"{r['保证金比例'] * 100:.0f}%", r["项目提报人"], r["起租时间"].strftime("%Y-%m-%d"),
+                        r["客户经理"], r["所属省区"], r["主车台数"], r["城市经理"], rng.choice(["是", "否", "否"]),
+                        rng.choice(["普通", "联合租赁", "普通", "驻店"])])
+        if rng.random() > missing_rate:
+            ec_rows.append([k, r["二次时间"]])
+
+    def main_rows(si, title):
+        yield [f"{title} 合同记录表"]
+        yield MAIN_COLUMNS
+        for i, k in enumerate(keys):
+            # 每个合同落在 1~2 个 sheet 中，其余合同用于漏填检查
+            if i % 5 != si and i % 7 != si:
+                continue
+            r = ref[k]
+            row = [k if rng.random() > 0.01 else k.replace("-", "")] + [r[c] for c in MAIN_COLUMNS[1:-1]] + ["备注"]
+            row[TERM_COL] = r["租赁期限"] * 12
+            if rng.random() < error_rate:
+                j = rng.randint(1, len(MAIN_COLUMNS) - 2)
+                v = row[j]
+                if isinstance(v, (int, float)):
+                    row[j] = v + 7
+                elif isinstance(v, datetime.datetime):
+                    row[j] = v + datetime.timedelta(days=3)
+                else:
+                    row[j] = "错误值"
+            if rng.random() < 0.01:
+                row[PRINCIPAL_COL] = None
+            yield row
+        yield [None] * len(MAIN_COLUMNS)
+        yield ["HT-1111-000001", "银行A", "1,000", "12", "-", "5%"]
+
+    _write(os.path.join(outdir, MAIN_FILE), [(t, main_rows(si, t)) for si, t in enumerate(MAIN_SHEETS)])
+    _write(os.path.join(outdir, "放款明细.xlsx"), [
+        ("威田放款", _widen(["合同号", "授信方", "租赁本金", "租赁期限", "挂车数量", "XIRR", "其他"], fk_rows, extra_cols, seed)),
+        ("其他", []),
+    ])
+    _write(os.path.join(outdir, "字段.xlsx"), [
+        ("重卡", _widen(["合同编号", "保证金比例_2", "项目提报人", "起租日_商", "客户经理_资产", "区域", "主车台数", "城市经理",
+                        "是否车管家", "提成类型"], zd_rows, extra_cols, seed)),
+    ])
+    _write(os.path.join(outdir, "二次明细.xlsx"), [("明细", _widen(["合同编号", "出本流程时间"], ec_rows, extra_cols, seed))])
+    return outdir
+
+
+def main():
+    parser = argparse.ArgumentParser(description="生成基准测试用的一套审核文件")
+    parser.add_argument("outdir")
+    parser.add_argument("rows", nargs="?", type=int, default=2000)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--missing-rate", type=float, default=0.03)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--extra-cols", type=int, default=0, help="参考表追加的无关列数")
+    args = parser.parse_args()
+    generate(args.outdir, args.rows, args.error_rate, args.missing_rate, args.seed, args.extra_cols)
+    print(f"✅ 已生成 {args.rows} 行数据到 {args.outdir}")
+
+
+if __name__ == "__main__":
+    main()
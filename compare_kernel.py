@@ -0,0 +1,132 @@
+# =====================================
+# 🧮 二维分块比对内核：一个 sheet 的全部比对规则一次算出“行 × 规则”的错误矩阵
+# =====================================
+"""
+逐条规则调用 compare_series_vec 时，每条规则都单独建一串布尔 Series、单独做一遍字符串处理。
+compare_block 把一个 sheet（或一个行块）的全部规则放在一起比较：
+
+    errors = compare_block(mains, refs, rules)   # (行数, 规则数) 的布尔矩阵
+    rows, cols = np.nonzero(errors)               # 出错单元格的坐标（行位置、规则序号）
+
+1. 逐列只做取决于该列 dtype、无法合并的部分：空值判断、数值/百分比规范化（normalize_num_vec）、日期解析
+2. 按比对方式分块，堆成二维数组整块计算：
+   - 日期块：按日归一的 datetime64（int64 视图）矩阵，两边都有效且不相等即为错误
+   - 数值块：整块求差值绝对值矩阵，再逐列按规则的容差判定（Rule.is_error，inclusive 的列用 >=）
+   - 文本单元格：数值规则中两边不都是数字的单元格跨列拼成一列，去空白、去 ".0" 与比较都只做一次
+3. “两边都为空”“参考表中找不到合同键”两个外层掩码同样整块叠加
+每一列的结果与单独调用 compare_series_vec 逐行一致。
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+from date_kernel import parse_date_column
+from numeric_kernel import na_like_mask, norm_str_repr, normalize_num_vec, numeric_flags
+
+NAT = np.iinfo(np.int64).min  # datetime64 的 NaT 在 int64 视图中的值
+
+
+def _as_day_ints(series, fmt):
+    """日期列 → 按日归一的 datetime64[ns] 的 int64 视图（NaT 为 NAT）。"""
+    return parse_date_column(series, fmt).to_numpy(dtype="datetime64[ns]").view(np.int64)
+
+
+def _clean_text(strings):
+    """与逐列比较相同的文本清理：去首尾空白、去掉末尾的 ".0"。"""
+    return pd.Series(strings, dtype=object).str.strip().str.replace(r"\.0$", "", regex=True)
+
+
+def compare_block(mains, refs, rules, contexts=None, seconds=None):
+    """
+    mains / refs - 等长的列表：主表列与对齐后的参考列（同一组行、同样的顺序，按位置比较）
+    rules        - 每列的比对规则（audit_rules.Rule）
+    contexts     - 每列的整列上下文（见 compare_series_vec 的 context），None 表示按这组行自行判定
+    seconds      - 可选的 float 数组（长度为规则数），累加每列耗时：逐列部分按实际计时，整块部分按列平均分摊
+    返回 (行数, 规则数) 的布尔矩阵（按列连续存放）。
+    """
+    k = len(rules)
+    n = len(mains[0]) if k else 0
+    contexts = contexts or [None] * k
+    seconds = np.zeros(k) if seconds is None else seconds
+    errors = np.zeros((n, k), dtype=bool, order="F")
+    if k == 0:
+        return errors
+
+    def share(columns, start):
+        seconds[columns] += (time.perf_counter() - start) / len(columns)
+
+    # --- 外层掩码：与比对方式无关 ---
+    main_na = np.empty((n, k), dtype=bool, order="F")
+    ref_na = np.empty((n, k), dtype=bool, order="F")
+    ref_missing = np.empty((n, k), dtype=bool, order="F")
+    for j in range(k):
+        start = time.perf_counter()
+        main_na[:, j] = na_like_mask(mains[j])
+        ref_na[:, j] = na_like_mask(refs[j])
+        ref_missing[:, j] = pd.isna(refs[j])
+        seconds[j] += time.perf_counter() - start
+
+    # --- 日期块 ---
+    dates = [j for j in range(k) if rules[j].is_date]
+    if dates:
+        d_main = np.empty((n, len(dates)), dtype=np.int64, order="F")
+        d_ref = np.empty((n, len(dates)), dtype=np.int64, order="F")
+        for c, j in enumerate(dates):
+            start = time.perf_counter()
+            # 参考列通常已在 prepare_ref_df 中解析好（datetime64），此时不会重复解析
+            fmt_main, fmt_ref = contexts[j] or (None, None)
+            d_main[:, c] = _as_day_ints(mains[j], fmt_main)
+            d_ref[:, c] = _as_day_ints(refs[j], fmt_ref)
+            seconds[j] += time.perf_counter() - start
+        start = time.perf_counter()
+        errors[:, dates] = (d_main != NAT) & (d_ref != NAT) & (d_main != d_ref)
+        share(dates, start)
+
+    # --- 数值块 + 文本单元格 ---
+    numbers = [j for j in range(k) if not rules[j].is_date]
+    if numbers:
+        m = len(numbers)
+        v_main = np.empty((n, m), order="F")
+        v_ref = np.empty((n, m), order="F")
+        both_num = np.empty((n, m), dtype=bool, order="F")
+        both_na = np.empty((n, m), dtype=bool, order="F")
+        text_rows, text_cols, text_main, text_ref = [], [], [], []
+        for c, j in enumerate(numbers):
+            start = time.perf_counter()
+            as_float = contexts[j] or (None, None)
+            main, ref = normalize_num_vec(mains[j]), normalize_num_vec(refs[j])
+            main_is_num, main_is_na, main_float = numeric_flags(main, as_float[0])
+            ref_is_num, ref_is_na, ref_float = numeric_flags(ref, as_float[1])
+            both_num[:, c] = main_is_num & ref_is_num
+            both_na[:, c] = main_is_na & ref_is_na
+            v_main[:, c] = main.values
+            v_ref[:, c] = ref.values
+            idx = np.flatnonzero(~both_num[:, c])
+            if len(idx):
+                text_rows.append(idx)
+                text_cols.append(np.full(len(idx), c))
+                text_main.append(norm_str_repr(main, idx, main_float))
+                text_ref.append(norm_str_repr(ref, idx, ref_float))
+            seconds[j] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        # 与 fillna(0) 一致：空值按 0 参与比较；容差判定按列交给规则（Rule.is_error）
+        with np.errstate(invalid="ignore"):
+            diff = np.abs(np.where(np.isnan(v_main), 0.0, v_main) - np.where(np.isnan(v_ref), 0.0, v_ref))
+            block = np.empty((n, m), dtype=bool, order="F")
+            for c, j in enumerate(numbers):
+                block[:, c] = rules[j].is_error(diff[:, c])
+        block &= both_num
+        if text_rows:
+            rows, cols = np.concatenate(text_rows), np.concatenate(text_cols)
+            differs = _clean_text(np.concatenate(text_main)) != _clean_text(np.concatenate(text_ref))
+            block[rows, cols] = differs.to_numpy()
+        errors[:, numbers] = block & ~both_na
+        share(numbers, start)
+
+    # 两边都为空的不算错；参考表中找不到合同键（参考值缺失而主表有值）的行不计错误
+    errors &= ~(main_na & ref_na)
+    errors &= ~(ref_missing & ~main_na)
+    return errors
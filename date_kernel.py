@@ -0,0 +1,175 @@
+# =====================================
+# 📅 日期列解析：按列识别格式 + Excel 序列号直转
+# =====================================
+"""
+pd.to_datetime(..., errors='coerce') 不带 format 时会逐个元素推断格式。
+这里每列只识别一次格式，datetime 对象直接使用，数字按 Excel 序列号换算，
+只有不符合识别出的格式的少数字符串才交给 pandas 逐个推断。
+结果统一归一到“日”（.dt.normalize()），可直接用 != 比较日期。
+"""
+
+import datetime
+
+import numpy as np
+import pandas as pd
+
+# 常见的日期文本格式，按优先级尝试
+DATE_FORMATS = [
+    "%Y-%m-%d",
+    "%Y/%m/%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y.%m.%d",
+    "%Y年%m月%d日",
+    "%Y%m%d",
+    # 斜杠分隔、年份在后：按整列判断日/月顺序。全列都能按“月/日”解析时取月在前（与 pandas 默认一致），
+    # 出现日 > 12 的值时整列按“日/月”解析，不再逐个推断得到前后不一致的结果
+    "%m/%d/%Y",
+    "%d/%m/%Y",
+]
+
+EXCEL_EPOCH = pd.Timestamp("1899-12-30")
+# Excel 序列号的有效范围：1900-01-01 ~ 9999-12-31
+EXCEL_SERIAL_MIN, EXCEL_SERIAL_MAX = 1, 2958465
+
+
+def detect_date_format(strings, sample_size=200):
+    """取前 sample_size 个非空字符串，返回第一个能解析全部样本的格式；都不行时返回 None。"""
+    sample = strings[:sample_size]
+    # 空白单元格不参与识别：一个空串不应让整列退回逐个推断
+    sample = sample[sample != ""]
+    if len(sample) == 0:
+        return None
+    for fmt in DATE_FORMATS:
+        parsed = pd.to_datetime(sample, format=fmt, errors="coerce")
+        if parsed.notna().all():
+            return fmt
+    return None
+
+
+def _value_kind(t):
+    if issubclass(t, (bool, np.bool_)):
+        return "other"
+    if issubclass(t, (datetime.date, np.datetime64)):
+        return "datetime"
+    if issubclass(t, (int, float, np.integer, np.floating)):
+        return "number"
+    return "other"
+
+
+def _parse_strings(strings, fmt):
+    """
+    按给定/识别出的格式整列解析字符串（空值原样得到 NaT），
+    不符合格式的少数先去空白重试，再交给 pandas 逐个推断。
+    """
+    fmt = fmt or detect_date_format(strings.dropna().head(200).str.strip())
+    if fmt is None or fmt == "mixed":
+        return pd.to_datetime(strings.str.strip(), format="mixed", errors="coerce").to_numpy(dtype="datetime64[ns]")
+    parsed = pd.to_datetime(strings, format=fmt, errors="coerce")
+    rest = parsed.isna() & strings.notna()
+    if rest.any():
+        retry = strings[rest].str.strip()
+        reparsed = pd.to_datetime(retry, format=fmt, errors="coerce")
+        still = reparsed.isna() & retry.ne("")
+        if still.any():
+            reparsed[still] = pd.to_datetime(retry[still], format="mixed", errors="coerce")
+        parsed[rest] = reparsed
+    return parsed.to_numpy(dtype="datetime64[ns]")
+
+
+def _parse_serials(serial):
+    """Excel 序列号（天数，1899-12-30 起算）→ datetime64；超出有效范围的为 NaT。"""
+    serial = np.asarray(serial, dtype=np.float64)
+    in_range = (serial >= EXCEL_SERIAL_MIN) & (serial <= EXCEL_SERIAL_MAX)
+    days = np.where(in_range, serial, np.nan)
+    return (EXCEL_EPOCH + pd.to_timedelta(days, unit="D")).to_numpy(dtype="datetime64[ns]")
+
+
+def _kinds(values):
+    """object 数组中每个非空元素的类别（datetime / number / other），空值为 ""。"""
+    notna = ~pd.isna(values)
+    # 混合列：类型判断只对出现过的几种类型各做一次
+    kinds = pd.Series(values[notna]).map(type)
+    type_kind = {t: _value_kind(t) for t in kinds.unique()}
+    kind = np.full(len(values), "", dtype=object)
+    kind[notna] = kinds.map(type_kind).to_numpy(dtype=object)
+    return kind
+
+
+def column_date_format(series):
+    """
+    parse_date_column(series) 会为这一列的字符串识别出的格式：
+    没有需要按文本解析的值时为 None，识别失败时为 "mixed"（逐个推断）。
+    只解析部分行时把它作为 fmt 传入，结果与整列解析逐行一致。
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return None
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return None
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    if inferred == "string":
+        strings = series
+    elif inferred in ("datetime", "datetime64", "date", "empty"):
+        return None
+    else:
+        values = series.to_numpy(dtype=object)
+        strings = pd.Series(values[_kinds(values) == "other"]).astype(str)
+        if strings.empty:
+            return None
+    return detect_date_format(strings.dropna().head(200).str.strip()) or "mixed"
+
+
+def date_format_candidates(series, limit=200):
+    """
+    column_date_format 识别格式时用到的字符串（按行顺序、去掉首尾空白，最多 limit 个）。
+    逐元素判断，与整列的 dtype 无关，因此可以按行块分别收集、拼接后再识别：
+        date_format_from_candidates(块1候选 + 块2候选 + ...) == column_date_format(整列)
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return []
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return []
+    values = series.to_numpy(dtype=object)
+    others = values[_kinds(values) == "other"][:limit]
+    return pd.Series(others, dtype=object).astype(str).str.strip().tolist()
+
+
+def date_format_from_candidates(strings):
+    """由 date_format_candidates 收集的字符串得到列的文本格式（与 column_date_format 的返回值相同）。"""
+    if not strings:
+        return None
+    return detect_date_format(pd.Series(strings[:200], dtype=object)) or "mixed"
+
+
+def parse_date_column(series, fmt=None):
+    """
+    把一列原始值解析为按日归一的 datetime64 Series（索引不变），无法解析的为 NaT。
+    fmt 为 None 时自动识别字符串的格式（每列只识别一次）；"mixed" 表示逐个推断。
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return series.dt.normalize()
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype):
+        return pd.Series(_parse_serials(series.to_numpy(dtype=np.float64, na_value=np.nan)), index=series.index).dt.normalize()
+
+    inferred = pd.api.types.infer_dtype(series, skipna=True)
+    # 整列同一种类型（最常见）时不必逐元素判断类型
+    if inferred == "string":
+        return pd.Series(_parse_strings(series, fmt), index=series.index).dt.normalize()
+    if inferred in ("datetime", "datetime64", "date"):
+        return pd.to_datetime(series, errors="coerce").dt.normalize()
+
+    out = np.full(len(series), np.datetime64("NaT"), dtype="datetime64[ns]")
+    if inferred == "empty":
+        return pd.Series(out, index=series.index)
+
+    values = series.to_numpy(dtype=object)
+    kind = _kinds(values)
+    is_dt, is_num, is_other = kind == "datetime", kind == "number", kind == "other"
+    if is_dt.any():
+        out[is_dt] = pd.to_datetime(values[is_dt], errors="coerce").to_numpy(dtype="datetime64[ns]")
+    if is_num.any():
+        out[is_num] = _parse_serials(values[is_num].astype(np.float64))
+    if is_other.any():
+        out[is_other] = _parse_strings(pd.Series(values[is_other]).astype(str), fmt)
+
+    return pd.Series(out, index=series.index).dt.normalize()
@@ -0,0 +1,158 @@
+# =====================================
+# 🧾 错误明细：每处错误一条记录，Parquet / JSON Lines 流式写出
+# =====================================
+"""
+标红的 xlsx 适合人看；下游对账程序要用审核结论，却只能重新解析大工作簿、读单元格颜色。
+错误明细把同样的结论写成一条条列式记录，不需要 Excel 就能查询（pandas / DuckDB / pyarrow 直接读）：
+
+    writer = LedgerWriter("parquet")                     # 或 "jsonl"
+    writer.write(mismatch_records(...))                   # 每批记录写成一个 row group（JSON Lines 为若干行）
+    data = writer.close()                                 # BytesIO；给出 target 时直接写到文件
+
+每条记录的字段（LEDGER_COLUMNS）：
+    kind        "mismatch"（比对不一致）或 "missing"（字段表漏填）
+    sheet       月重卡的 sheet 关键词（漏填记录为空）
+    row         Excel 行号：比对错误为月重卡 sheet 中标红单元格所在行，漏填为字段表中该合同所在行
+    contract    规范化后的合同键（与参考索引、近似匹配报告相同）
+    column      月重卡中的列名（漏填记录为字段表的合同列名）
+    source      参考来源前缀：fk / zd / ec（漏填记录为 zd）
+    rule        规则名，如 "fk - 租赁本金"（漏填记录为 "漏填"）
+    main_value  月重卡中的值（文本）
+    ref_value   对齐后的参考值（文本，已按规则预处理，如年 → 月）；漏填记录为字段表中的合同号原文
+明细只含出错的单元格，生成代价与错误数成正比，不需要标注工作簿。
+每个 sheet 的检查各自写出一份明细（随单 sheet 结果缓存），run_full_audit 再用 LedgerWriter.append
+把各 sheet 与漏填的明细依次拷贝进一个文件，不在内存里拼整张表。
+Parquet 依赖 pyarrow，未安装时改写 JSON Lines（见 ledger_format）。
+"""
+
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+
+from report_writer import HAS_PARQUET
+
+if HAS_PARQUET:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+LEDGER_FORMATS = ("parquet", "jsonl")
+LEDGER_NAME = "审核错误明细"
+LEDGER_COLUMNS = ["kind", "sheet", "row", "contract", "column", "source", "rule", "main_value", "ref_value"]
+CHUNK = 1024 * 1024
+
+if HAS_PARQUET:
+    LEDGER_SCHEMA = pa.schema([
+        (name, pa.int64() if name == "row" else pa.string()) for name in LEDGER_COLUMNS
+    ])
+
+
+def ledger_format(fmt):
+    """实际使用的格式：fmt 须为 LEDGER_FORMATS 之一；未安装 pyarrow 时 parquet 改为 jsonl。"""
+    if fmt not in LEDGER_FORMATS:
+        raise ValueError(f"错误明细的格式只能是 {LEDGER_FORMATS}，而不是 {fmt!r}")
+    return "jsonl" if fmt == "parquet" and not HAS_PARQUET else fmt
+
+
+def ledger_filename(fmt, stem=LEDGER_NAME):
+    return f"{stem}.{ledger_format(fmt)}"
+
+
+def _text(values):
+    """任意值 → 文本，空值（None / NaN / NaT）为 None。"""
+    values = np.asarray(values, dtype=object)
+    return [None if missing else str(v) for v, missing in zip(values, pd.isna(values))]
+
+
+def _records(kind, sheet, rows, contracts, columns, source, rule, main_values, ref_values):
+    return pd.DataFrame({
+        "kind": kind, "sheet": sheet, "row": np.asarray(rows, dtype=np.int64), "contract": _text(contracts),
+        "column": columns, "source": source, "rule": rule, "main_value": main_values, "ref_value": ref_values,
+    }, columns=LEDGER_COLUMNS)
+
+
+def mismatch_records(sheet, steps, err_rows, err_rules, row_numbers, contracts):
+    """
+    一个 sheet（或一个行块）的比对错误 → 明细记录（DataFrame，列为 LEDGER_COLUMNS）。
+    steps               - 按规则序号排列的 (规则, 主表列名, 主表列, 对齐后的参考列)
+    err_rows, err_rules - np.nonzero(errors) 给出的出错坐标（行位置、规则序号）
+    row_numbers         - 每处错误的 Excel 行号；contracts - 每处错误的合同键（均与 err_rows 等长）
+    """
+    main_values = np.empty(len(err_rows), dtype=object)
+    ref_values = np.empty(len(err_rows), dtype=object)
+    for j in np.unique(err_rules):
+        at = err_rules == j
+        _, _, s_main, s_ref = steps[j]
+        main_values[at] = _text(s_main.iloc[err_rows[at]].to_numpy(dtype=object))
+        ref_values[at] = _text(s_ref.iloc[err_rows[at]].to_numpy(dtype=object))
+    columns = np.array([str(column) for _, column, _, _ in steps], dtype=object)
+    sources = np.array([rule.prefix for rule, _, _, _ in steps], dtype=object)
+    labels = np.array([rule.label for rule, _, _, _ in steps], dtype=object)
+    return _records(
+        "mismatch", sheet, row_numbers, contracts, columns[err_rules], sources[err_rules], labels[err_rules],
+        main_values, ref_values,
+    )
+
+
+def missing_records(contract_col, rows, contracts, raw_contracts):
+    """
+    字段表漏填 → 明细记录。
+    contract_col - 字段表的合同列名；rows - 漏填合同所在的 Excel 行号
+    contracts    - 规范化后的合同键；raw_contracts - 字段表中的合同号原文
+    """
+    return _records("missing", None, rows, contracts, str(contract_col), "zd", "漏填", None, _text(raw_contracts))
+
+
+def _open_part(data):
+    """明细文件（BytesIO 或 OutputHandle）→ 可读的二进制文件对象。"""
+    if hasattr(data, "open"):
+        return data.open()
+    return BytesIO(data.getvalue())
+
+
+class LedgerWriter:
+    """
+    错误明细的流式写入器：write() 追加的记录立即写出（Parquet 每批一个 row group），
+    close() 返回 BytesIO；给出 target（文件路径）时直接写到那里并返回 target。
+    """
+
+    def __init__(self, fmt, target=None):
+        self.fmt = ledger_format(fmt)
+        self.target = target
+        self.rows_written = 0
+        self._sink = open(target, "wb") if target is not None else BytesIO()
+        self._parquet = pq.ParquetWriter(self._sink, LEDGER_SCHEMA) if self.fmt == "parquet" else None
+
+    def write(self, records):
+        """追加一批记录（mismatch_records / missing_records 的结果）。"""
+        if records.empty:
+            return
+        if self._parquet is not None:
+            self._parquet.write_table(pa.Table.from_pandas(records, schema=LEDGER_SCHEMA, preserve_index=False))
+        else:
+            text = records.to_json(orient="records", lines=True, force_ascii=False)
+            self._sink.write(text.encode("utf-8") if text.endswith("\n") else (text + "\n").encode("utf-8"))
+        self.rows_written += len(records)
+
+    def append(self, data):
+        """把另一份同格式的明细文件（BytesIO 或 OutputHandle）整份拷贝进来（Parquet 逐个 row group），不转成 DataFrame。"""
+        with _open_part(data) as fh:
+            if self._parquet is not None:
+                part = pq.ParquetFile(fh)
+                for i in range(part.num_row_groups):
+                    self._parquet.write_table(part.read_row_group(i))
+                self.rows_written += part.metadata.num_rows
+            else:
+                for block in iter(lambda: fh.read(CHUNK), b""):
+                    self._sink.write(block)
+                    self.rows_written += block.count(b"\n")
+
+    def close(self):
+        if self._parquet is not None:
+            self._parquet.close()
+        if self.target is not None:
+            self._sink.close()
+            return self.target
+        self._sink.seek(0)
+        return self._sink
+
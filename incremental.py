@@ -0,0 +1,280 @@
+# =====================================
+# 🔁 增量审核：按合同持久化行指纹与上次结论（SQLite）
+# =====================================
+"""
+每月的月重卡大部分合同与上月相同。增量模式下，每个 sheet 在本地 SQLite 中保存：
+    - 每个合同行（合同键 + 同键序号）的指纹：所有比对列的主表值 + 对齐后的参考值（含类型）
+    - 该行在每条比对规则下的结论（每条规则一位，按行打包成字节串，规则数不受整数位宽限制）
+    - 决定“整列上下文”的逐行标记（数值规则：是否为剩余字符串 / 是否为数字；每条规则四位，同样打包）
+    - 每条规则的整列上下文（数值规则：主表/参考列是否按 float64 处理；日期规则：识别出的文本格式）
+下次运行时，指纹没变的行直接沿用上次结论，只有新增或改动的行重新比较；
+若某条规则的整列上下文变了（例如新行让整列多了一个文本值），该规则整列重算，
+因此得到的错误位置、标注文件与全量比较完全一致。
+"""
+
+import datetime
+import json
+import os
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from date_kernel import column_date_format
+from numeric_kernel import numeric_row_flags
+
+SCHEMA_VERSION = 2  # 2: errors / flags 由 int64 位掩码改为打包的字节串
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def default_store_path():
+    """默认数据库位置：环境变量 AUDIT_INCREMENTAL_DB，否则 ~/.cache/contract_audit/fingerprints.sqlite。"""
+    return os.environ.get("AUDIT_INCREMENTAL_DB") or os.path.join(
+        os.path.expanduser("~"), ".cache", "contract_audit", "fingerprints.sqlite"
+    )
+
+
+def _pack_bits(bits):
+    """行 × 位 的布尔矩阵 → 每行一段字节串（np.packbits），存入 SQLite。"""
+    return [row.tobytes() for row in np.packbits(bits, axis=1)]
+
+
+def _unpack_bits(blobs, width):
+    """_pack_bits 的逆运算：每行一段字节串 → 行 × width 的布尔矩阵。"""
+    if width == 0 or not len(blobs):
+        return np.zeros((len(blobs), width), dtype=bool)
+    packed = np.frombuffer(b"".join(blobs), dtype=np.uint8).reshape(len(blobs), -1)
+    return np.unpackbits(packed, axis=1, count=width).astype(bool)
+
+
+def _type_tag(t):
+    """
+    指纹里记录的元素类型。比对时结论相同的类型归为一类：
+    int / float（含 numpy 数值）统一为 number，Timestamp 与 datetime 统一为 datetime。
+    """
+    if issubclass(t, (bool, np.bool_)):
+        return "bool"
+    if issubclass(t, (int, float, np.integer, np.floating)):
+        return "number"
+    if issubclass(t, datetime.datetime):
+        return "datetime"
+    return t.__qualname__
+
+
+def _hash_column(s):
+    """
+    一列值的逐行 64 位哈希，计入元素类型（1 与 "1" 视为不同的值）。
+    一律按 object 元素计算，与列的 dtype 无关：某一行的改动使整列 dtype 变化
+    （如 int → object、datetime64 → object）时，其余行的哈希不变。
+    """
+    values = pd.Series(s.to_numpy(dtype=object), dtype=object)  # 显式 object，避免重新推断 dtype
+    types = values.map(type)
+    tags = types.map({t: _type_tag(t) for t in types.unique()}).to_numpy(dtype=object)
+    texts = values.astype(str).to_numpy(dtype=object)
+    is_na = values.isna().to_numpy()
+    tags[is_na] = "na"  # None / NaN / NaT 一律视为空值
+    texts[is_na] = ""
+    is_num = tags == "number"
+    if is_num.any():
+        # 3 与 3.0 比对结论相同，统一按浮点数的文本计算
+        texts[is_num] = values.to_numpy()[is_num].astype(np.float64).astype(str)
+    return pd.util.hash_array(texts) ^ (pd.util.hash_array(tags) * _MIX)
+
+
+def row_fingerprints(columns, n):
+    """把若干列（主表值、参考值）组合成逐行指纹（int64，便于存入 SQLite）。"""
+    h = np.zeros(n, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for s in columns:
+            h = (h * _MIX) ^ _hash_column(s)
+    return h.view(np.int64)
+
+
+def column_context(rule, main_flags, ref_flags, s_main=None, s_ref=None):
+    """
+    规则的整列上下文（JSON 可序列化）：
+    数值规则 - [主表列是否按 float64 处理, 参考列是否按 float64 处理]，由逐行标记推出
+    日期规则 - [主表列文本格式, 参考列文本格式]
+    """
+    if rule.is_date:
+        return [column_date_format(s_main), column_date_format(s_ref)]
+
+    def as_float(flags):
+        has_str, is_float = flags
+        return bool((not has_str.any()) and is_float.any())
+
+    return [as_float(main_flags), as_float(ref_flags)]
+
+
+class FingerprintStore:
+    """
+    SQLite 指纹库。只保存路径，每次读写各自打开连接，因此可以在线程/进程池中使用。
+    scope 通常是 sheet 关键词（“二次”“随州”……），每次运行覆盖该 scope 的上次状态。
+    """
+
+    def __init__(self, path=None):
+        self.path = path or default_store_path()
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=60)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS sheet_state ("
+            " scope TEXT PRIMARY KEY, schema INTEGER, rules TEXT, contexts TEXT, updated REAL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS row_state ("
+            " scope TEXT, contract TEXT, dup INTEGER, fp INTEGER, errors BLOB, flags BLOB,"
+            " PRIMARY KEY (scope, contract, dup))"
+        )
+        return conn
+
+    def load(self, scope, rules):
+        """
+        读取 scope 的上次状态；比对规则列表不同（或从未保存过）时返回 None。
+        返回 {"contexts": {规则: 上下文}, "rows": DataFrame(contract, dup, fp, errors, flags)}
+        """
+        conn = self._connect()
+        try:
+            head = conn.execute(
+                "SELECT schema, rules, contexts FROM sheet_state WHERE scope = ?", (scope,)
+            ).fetchone()
+            if head is None or head[0] != SCHEMA_VERSION or json.loads(head[1]) != list(rules):
+                return None
+            rows = pd.DataFrame(
+                conn.execute(
+                    "SELECT contract, dup, fp, errors, flags FROM row_state WHERE scope = ?", (scope,)
+                ).fetchall(),
+                columns=["contract", "dup", "fp", "errors", "flags"],
+            )
+            return {"contexts": json.loads(head[2]), "rows": rows}
+        finally:
+            conn.close()
+
+    def save(self, scope, rules, contexts, rows):
+        """覆盖保存 scope 的状态；rows 为 DataFrame(contract, dup, fp, errors, flags)，errors / flags 为字节串。"""
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("DELETE FROM row_state WHERE scope = ?", (scope,))
+                conn.executemany(
+                    "INSERT INTO row_state (scope, contract, dup, fp, errors, flags) VALUES (?, ?, ?, ?, ?, ?)",
+                    zip([scope] * len(rows), rows["contract"].tolist(), rows["dup"].tolist(),
+                        rows["fp"].tolist(), rows["errors"].tolist(), rows["flags"].tolist()),
+                )
+                conn.execute(
+                    "INSERT OR REPLACE INTO sheet_state (scope, schema, rules, contexts, updated) VALUES (?, ?, ?, ?, ?)",
+                    (scope, SCHEMA_VERSION, json.dumps(list(rules), ensure_ascii=False),
+                     json.dumps(contexts, ensure_ascii=False), time.time()),
+                )
+        finally:
+            conn.close()
+
+
+class IncrementalPlan:
+    """
+    单个 sheet 一次运行的增量计划。用法（check_one_sheet 中）：
+        plan = IncrementalPlan(store, scope, keys, rules)     # rules: [(规则名, Rule, s_main, s_ref)]
+        errors = plan.compare(i, compare_fn)                   # 代替 compare_series_vec，逐规则调用
+        plan.record(i, final_errors_mask)                      # 记录叠加跳过掩码后的最终结论
+        plan.commit()                                          # 写回指纹库
+    """
+
+    def __init__(self, store, scope, keys, rules):
+        self.store = store
+        self.scope = scope
+        self.rules = rules
+        self.labels = [label for label, _, _, _ in rules]
+        # 规则名连同完整定义（容差、预处理……）一起比较：改了规则配置的上次结论不能沿用
+        self.signature = [[label, rule.spec()] for label, rule, _, _ in rules]
+        n = len(keys)
+        self.n = n
+
+        keys = pd.Series(np.asarray(keys, dtype=object))
+        self.keys = keys.to_numpy(dtype=object)
+        self.dups = keys.groupby(keys, sort=False).cumcount().to_numpy()
+        columns = [s for _, _, s_main, s_ref in rules for s in (s_main, s_ref)]
+        self.fps = row_fingerprints(columns, n)
+
+        # 逐行逐规则的结论与标记（数值规则 i 的标记占第 4i ~ 4i+3 列：主表、参考各两位）
+        self.errors = np.zeros((n, len(rules)), dtype=bool)
+        self.flags = np.zeros((n, 4 * len(rules)), dtype=bool)
+        self.contexts = {}
+
+        prior = store.load(scope, self.signature)
+        self.prior_contexts = prior["contexts"] if prior else {}
+        # 与上次按 (合同键, 同键序号) 对齐；指纹相同的行可以沿用上次结论
+        self.reused = np.zeros(n, dtype=bool)
+        self.prior_errors = np.zeros_like(self.errors)
+        self.prior_flags = np.zeros_like(self.flags)
+        if prior is not None and len(prior["rows"]):
+            prior_rows = prior["rows"]
+            current = pd.DataFrame({"contract": self.keys, "dup": self.dups, "fp": self.fps})
+            matched = current.merge(
+                prior_rows[["contract", "dup", "fp"]].assign(pos=np.arange(len(prior_rows))),
+                on=["contract", "dup"], how="left", suffixes=("", "_prior"),
+            )
+            self.reused = (matched["fp_prior"] == matched["fp"]).to_numpy()
+            pos = matched["pos"].to_numpy(dtype=np.float64)
+            found = ~np.isnan(pos)
+            at = pos[found].astype(np.intp)
+            self.prior_errors[found] = _unpack_bits(prior_rows["errors"].tolist(), self.errors.shape[1])[at]
+            self.prior_flags[found] = _unpack_bits(prior_rows["flags"].tolist(), self.flags.shape[1])[at]
+        self.changed = np.flatnonzero(~self.reused)
+        self.full_rules = []  # 因上下文变化而整列重算的规则
+
+    # --- 逐规则 ---
+    def _numeric_flags(self, s, col):
+        """数值规则的逐行标记（flags 的第 col、col+1 列）：沿用行取已存值，其余行现算；同时写入本次要保存的 flags。"""
+        has_str = self.prior_flags[:, col].copy()
+        is_float = self.prior_flags[:, col + 1].copy()
+        if len(self.changed):
+            part_str, part_float = numeric_row_flags(s.iloc[self.changed])
+            has_str[self.changed] = part_str
+            is_float[self.changed] = part_float
+        self.flags[:, col] = has_str
+        self.flags[:, col + 1] = is_float
+        return has_str, is_float
+
+    def compare(self, i, compare_fn):
+        """
+        第 i 条规则的比较结果（与整列 compare_fn(s_main, s_ref, rule) 相同的布尔 Series）。
+        compare_fn 需接受 context 关键字参数（见 compare_series_vec）。
+        """
+        label, rule, s_main, s_ref = self.rules[i]
+        if rule.is_date:
+            context = column_context(rule, None, None, s_main, s_ref)
+        else:
+            col = 4 * i
+            context = column_context(rule, self._numeric_flags(s_main, col), self._numeric_flags(s_ref, col + 2))
+        self.contexts[label] = context
+
+        if self.prior_contexts.get(label) != context or not self.reused.any():
+            if self.reused.any():
+                self.full_rules.append(label)
+            return compare_fn(s_main, s_ref, rule)
+
+        errors = self.prior_errors[:, i].copy()
+        if len(self.changed):
+            part = compare_fn(s_main.iloc[self.changed], s_ref.iloc[self.changed], rule, context=tuple(context))
+            errors[self.changed] = part.to_numpy(dtype=bool)
+        return pd.Series(errors, index=s_main.index)
+
+    def record(self, i, final_errors_mask):
+        self.errors[:, i] = np.asarray(final_errors_mask, dtype=bool)
+
+    def commit(self):
+        rows = pd.DataFrame({
+            "contract": self.keys, "dup": self.dups, "fp": self.fps,
+            "errors": _pack_bits(self.errors), "flags": _pack_bits(self.flags),
+        })
+        self.store.save(self.scope, self.signature, self.contexts, rows)
+
+    def summary(self):
+        return {
+            "rows": self.n,
+            "reused": int(self.reused.sum()),
+            "recompared": int(len(self.changed)),
+            "full_rules": list(self.full_rules),
+        }
@@ -0,0 +1,94 @@
+# =====================================
+# 🔑 合同键驻留：每个不同的原始键只规范化一次，之后全程使用整数 id
+# =====================================
+"""
+三张参考表、四个 sheet、漏填检查都要用到合同键。原先每处各自把整列做一遍规范化
+（五次正则/字符串处理），漏填检查还用了另一套更弱的规则（只去首尾空白）。
+每次 run_full_audit 建一个 KeyInterner，整个审核共用（参考表预处理、各 sheet、漏填检查、近似匹配）：
+
+    keys = KeyInterner()
+    ids = keys.intern(df["合同编号"])   # 每行的整数 id；同一个原始键只规范化一次（记忆化）
+    keys.keys[ids]                      # 还原为规范化后的键（object 数组）
+    keys.normalize(df["合同编号"])      # 等价于 normalize_contract_key，但每个原始键只规范化一次
+    keys.intern_normalized(keys)        # 已经规范化过的键（如参考数据存储里的 __KEY__）直接取 id
+
+规范化后相同的键 id 相同，因此参考值对齐（RefIndex.bind / lookup_ids）、各 sheet 出现过的合同、
+漏填检查的 isin 都在整数数组上完成，且所有环节使用同一套规范化规则。
+驻留表随审核结束丢弃，大小只与本次审核出现过的键数有关，不会随服务运行时间增长；
+因此放进缓存的单 sheet 结果保存规范化后的键，命中时再驻留进当次审核的驻留表。
+进程模式下子进程继承主进程的驻留表：主进程在分发前先驻留各 sheet 的合同列，子进程里只有查找，得到的 id 一致。
+"""
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+def normalize_contract_key(series: pd.Series) -> pd.Series:
+    s = series.astype(str)
+    s = s.str.replace(r"\.0$", "", regex=True)
+    s = s.str.strip()
+    s = s.str.upper()
+    s = s.str.replace('－', '-', regex=False)
+    s = s.str.replace(r'\s+', '', regex=True)
+    return s
+
+
+class KeyInterner:
+    """原始键 → 规范化键 → 整数 id 的驻留表。线程安全。"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._raw = {}    # 原始键的 str 形式 -> id
+        self._ids = {}    # 规范化后的键 -> id
+        self._keys = []   # id -> 规范化后的键
+        self._array = np.array([], dtype=object)
+
+    def __len__(self):
+        return len(self._keys)
+
+    @property
+    def keys(self):
+        """id -> 规范化后的键（object 数组，按需重建）。"""
+        with self._lock:
+            if len(self._array) != len(self._keys):
+                self._array = np.array(self._keys, dtype=object)
+            return self._array
+
+    def _id_of(self, key):
+        key_id = self._ids.get(key)
+        if key_id is None:
+            key_id = self._ids[key] = len(self._keys)
+            self._keys.append(key)
+        return key_id
+
+    def intern(self, series):
+        """一列原始合同键 → 每行的 id（int64 数组），规范化规则与 normalize_contract_key 相同。"""
+        # 先去重：同一个原始键在列中出现多少次都只查一次
+        codes, uniques = pd.factorize(pd.Series(series).astype(str))
+        uniques = np.asarray(uniques, dtype=object)
+        with self._lock:
+            ids = np.fromiter((self._raw.get(u, -1) for u in uniques), dtype=np.int64, count=len(uniques))
+            new = np.flatnonzero(ids < 0)
+            if len(new):
+                normalized = normalize_contract_key(pd.Series(uniques[new], dtype=object))
+                for pos, raw, key in zip(new, uniques[new], normalized):
+                    ids[pos] = self._raw[raw] = self._id_of(key)
+        return ids[codes]
+
+    def normalize(self, series):
+        """normalize_contract_key 的记忆化版本：返回规范化后的键（Series，索引不变）。"""
+        ids = self.intern(series)
+        return pd.Series(self.keys[ids], index=series.index, dtype=object)
+
+    def intern_normalized(self, keys):
+        """已经规范化过的键 → id（不再规范化），新键加入驻留表。"""
+        with self._lock:
+            return np.fromiter((self._id_of(k) for k in keys), dtype=np.int64, count=len(keys))
+
+    def find_normalized(self, keys):
+        """已经规范化过的键 → id，不在驻留表中的为 -1（不修改驻留表）。"""
+        with self._lock:
+            return np.fromiter((self._ids.get(k, -1) for k in keys), dtype=np.int64, count=len(keys))
+
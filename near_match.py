@@ -0,0 +1,172 @@
+# =====================================
+# 🔎 合同键近似匹配：为找不到的合同键推荐最接近的已知合同键
+# =====================================
+"""
+月重卡里的合同键在参考表中找不到时，比对静默跳过该行（见 compare_series_vec 的 lookup_failure_mask）；
+字段表里的合同在月重卡中找不到时记为漏填。其中不少是录入错误：相邻数字对调、少了连字符、多打一位。
+NearMatchIndex 为这些键找出最接近的已知键：
+
+    index = NearMatchIndex(ref_keys)      # 构建一次，O(键数 × 键长)
+    found = index.match(unmatched_keys)   # DataFrame: key / candidate / distance / skeleton_distance / ties
+
+做法（SymSpell 删除变体分块 + 有界编辑距离校验）：
+1. 键先转大写并去掉分隔符（骨架），“少了连字符 / 大小写不同”的键骨架相同
+2. 每个骨架生成“原样 + 删去任一个字符”的变体，只存变体的 64 位哈希（排序后二分查找）；
+   两个键有相同变体时才成为候选对，不做全量两两比较。
+   骨架之间增、删、改一个字符或相邻两字符对调的一定命中，两边各差一个字符的距离 2 也命中
+3. 候选对的 OSA 编辑距离（增、删、改、相邻对调各计 1）用 NumPy 成批计算：
+   先在带状区域内算骨架距离，只对骨架距离最小的候选再算原键距离，每个键取最接近者，
+   并给出同样接近的候选个数（ties > 1 时需人工判断）
+"""
+
+import numpy as np
+import pandas as pd
+
+# 骨架中去掉的分隔符：空白、各种横线、下划线、斜杠、点
+SEPARATORS = r"[\s\-_/\\.·－—–]+"
+
+
+def key_skeleton(keys):
+    """合同键的骨架：转大写、去掉分隔符。"""
+    return pd.Series(keys, dtype=object).astype(str).str.upper().str.replace(SEPARATORS, "", regex=True)
+
+
+def _codes(strings):
+    """字符串数组 → (最大长度, n) 的 Unicode 码点矩阵（按字符位置连续存放，不足处补 0）与各自长度。"""
+    arr = np.asarray(strings, dtype=str)
+    width = max(arr.dtype.itemsize // 4, 1)
+    arr = arr.astype(f"<U{width}")
+    return np.ascontiguousarray(arr.view(np.uint32).reshape(len(arr), width).T), np.char.str_len(arr)
+
+
+def osa_distance(a, b, max_distance=None):
+    """
+    两组字符串逐对的 OSA 编辑距离，返回 int 数组。
+    动态规划按 (i, j) 推进，每一步对所有字符串对同时计算，循环次数只与键长有关。
+    给出 max_distance 时只算对角线附近 |i - j| <= max_distance 的带状区域，超出上限的结果记为 max_distance + 1。
+    """
+    A, la = _codes(a)
+    B, lb = _codes(b)
+    wa, n = A.shape
+    wb = B.shape[0]
+    far = np.iinfo(np.int32).max // 2  # 带外单元格：比任何有效距离都大
+    out = lb.astype(np.int32)  # 空串对任何串的距离是其长度
+    prev2 = None
+    prev = np.repeat(np.arange(wb + 1, dtype=np.int32)[:, None], n, axis=1)
+    for i in range(1, wa + 1):
+        cur = np.full_like(prev, far)
+        cur[0] = i
+        ai = A[i - 1]
+        lo, hi = 1, wb
+        if max_distance is not None:
+            lo, hi = max(1, i - max_distance), min(wb, i + max_distance)
+        for j in range(lo, hi + 1):
+            bj = B[j - 1]
+            v = np.minimum(np.minimum(prev[j], cur[j - 1]) + 1, prev[j - 1] + (ai != bj))
+            if i > 1 and j > 1:
+                swapped = (ai == B[j - 2]) & (A[i - 2] == bj)
+                v = np.where(swapped, np.minimum(v, prev2[j - 2] + 1), v)
+            cur[j] = v
+        done = np.flatnonzero(la == i)
+        out[done] = cur[lb[done], done]
+        prev2, prev = prev, cur
+    if max_distance is not None:
+        out = np.minimum(out, max_distance + 1)
+    return out
+
+
+def _variants(skeletons, ids):
+    """骨架的删除变体：(变体哈希, 键 id)，含骨架本身。"""
+    lengths = skeletons.str.len().to_numpy()
+    hashes, owners = [], []
+    for p in range(-1, int(lengths.max(initial=0))):
+        mask = lengths > p
+        sub = skeletons[mask]
+        variants = sub if p < 0 else sub.str.slice(0, p) + sub.str.slice(p + 1)
+        hashes.append(pd.util.hash_array(variants.to_numpy(dtype=object), categorize=False))
+        owners.append(ids[mask])
+    return np.concatenate(hashes), np.concatenate(owners)
+
+
+class NearMatchIndex:
+    """
+    keys         - 已知（参考）合同键，重复与空值自动去掉
+    min_len      - 骨架短于 min_len 的键不参与（太短的键几乎和谁都像）
+    max_distance - 骨架编辑距离的上限（删除变体保证候选距离不超过 2）
+    max_bucket   - 同一变体下的已知键超过此数时不从该变体取候选，避免极常见的变体产生大量候选对
+    """
+
+    def __init__(self, keys, min_len=4, max_distance=2, max_bucket=100):
+        keys = pd.Series(pd.unique(pd.Series(keys, dtype=object).dropna().astype(str).to_numpy()), dtype=object)
+        skeletons = key_skeleton(keys)
+        usable = (skeletons.str.len() >= min_len).to_numpy()
+        self.keys = keys[usable].to_numpy()
+        self.skeletons = skeletons[usable].to_numpy()
+        self.min_len = min_len
+        self.max_distance = max_distance
+        self.max_bucket = max_bucket
+        hashes, owners = _variants(pd.Series(self.skeletons, dtype=object), np.arange(len(self.keys)))
+        # 同一键的重复变体（如 "AAB" 删去任一个 A）只留一份
+        pairs = np.unique(np.rec.fromarrays([hashes, owners]))
+        self._hashes = pairs.f0
+        self._owners = pairs.f1
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _candidates(self, skeletons):
+        """查询骨架 → 候选对 (查询位置, 已知键 id)，已去重。"""
+        q_hashes, q_ids = _variants(skeletons, np.arange(len(skeletons)))
+        lo = np.searchsorted(self._hashes, q_hashes, side="left")
+        hi = np.searchsorted(self._hashes, q_hashes, side="right")
+        counts = hi - lo
+        counts[counts > self.max_bucket] = 0
+        total = int(counts.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        # 把每个命中的区间 [lo, hi) 展开成位置（CSR 展开）
+        starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+        positions = starts + np.arange(total)
+        pair = np.unique(np.repeat(q_ids, counts).astype(np.int64) * len(self.keys) + self._owners[positions])
+        return pair // len(self.keys), pair % len(self.keys)
+
+    def match(self, keys, batch=20000):
+        """
+        为每个键找最接近的已知键（与已知键完全相同的、骨架过短的、没有候选的键不出现在结果中）。
+        返回 DataFrame：key, candidate, distance（原键 OSA 距离）, skeleton_distance, ties（同样接近的候选数）
+        """
+        columns = ["key", "candidate", "distance", "skeleton_distance", "ties"]
+        keys = pd.Series(pd.unique(pd.Series(keys, dtype=object).dropna().astype(str).to_numpy()), dtype=object)
+        skeletons = key_skeleton(keys)
+        usable = (skeletons.str.len() >= self.min_len).to_numpy()
+        usable &= ~keys.isin(self.keys).to_numpy()
+        keys, skeletons = keys[usable].reset_index(drop=True), skeletons[usable].reset_index(drop=True)
+        if not len(self.keys) or not len(keys):
+            return pd.DataFrame(columns=columns)
+
+        found = []
+        # 分批查询：候选对数与批大小成正比，内存有上限
+        for start in range(0, len(keys), batch):
+            q_keys = keys.iloc[start:start + batch].to_numpy()
+            q_skel = skeletons.iloc[start:start + batch].reset_index(drop=True)
+            q_pos, r_ids = self._candidates(q_skel)
+            if not len(q_pos):
+                continue
+            skel_dist = osa_distance(q_skel.to_numpy()[q_pos], self.skeletons[r_ids], self.max_distance)
+            # 超出上限的（包括哈希碰撞产生的）候选排除；每个键只保留骨架距离最小的候选，再比原键距离
+            keep = skel_dist <= self.max_distance
+            keep &= skel_dist == pd.Series(np.where(keep, skel_dist, self.max_distance + 1)).groupby(q_pos).transform("min").to_numpy()
+            q_pos, r_ids, skel_dist = q_pos[keep], r_ids[keep], skel_dist[keep]
+            pairs = pd.DataFrame({
+                "key": q_keys[q_pos],
+                "candidate": self.keys[r_ids],
+                "distance": osa_distance(q_keys[q_pos], self.keys[r_ids]),
+                "skeleton_distance": skel_dist,
+            })
+            pairs = pairs.sort_values(["key", "distance", "candidate"], kind="stable")
+            ties = pairs.groupby(["key", "skeleton_distance", "distance"], sort=False).size().rename("ties")
+            best = pairs.drop_duplicates("key").join(ties, on=["key", "skeleton_distance", "distance"])
+            found.append(best)
+        if not found:
+            return pd.DataFrame(columns=columns)
+        return pd.concat(found, ignore_index=True)[columns]
@@ -0,0 +1,154 @@
+# =====================================
+# 🔢 向量化数值/百分比规范化内核
+# =====================================
+"""
+normalize_num 的向量化版本，语义逐元素一致：
+    - 空值、""、"-"、"nan"（去逗号、去首尾空白后）→ 空
+    - 含 "%" → 去掉 % 后 float(...) / 100
+    - 能被 float() 解析 → 浮点数
+    - 其它 → 保留处理后的字符串
+只有“看起来像数字、却被 float() 拒绝”的极少数字符串才会逐个回退到 Python，
+其余全部是 pandas 字符串操作与 NumPy 批量转换。
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+NumNorm = namedtuple("NumNorm", ["values", "is_pct", "leftover", "is_null"])
+"""
+values   - float64 数组，非数值处为 NaN
+is_pct   - 原值是否带 "%"
+leftover - object 数组，无法解析为数字的字符串（其它位置为 None）
+is_null  - 规范化结果为空（normalize_num 返回 None）
+"""
+
+# float() 可能接受的字符串：只含（Unicode）数字、空白、. _ e E + -，或 inf/infinity/nan 字样
+_FLOAT_LIKE = r"^(?:[\d\s._eE+\-]+|\s*[+-]?(?:inf|infinity|nan)\s*)$"
+
+
+_NUMERIC_KINDS = ("floating", "integer", "mixed-integer-float")
+
+
+def is_native_numeric(series):
+    """整列（忽略空值）都是原生 int/float（不含 bool）时为 True，此时 float(str(x)) == float(x)。"""
+    if pd.api.types.is_bool_dtype(series.dtype):
+        return False
+    if pd.api.types.is_numeric_dtype(series.dtype):
+        return True
+    return pd.api.types.infer_dtype(series, skipna=True) in _NUMERIC_KINDS
+
+
+def na_like_mask(series, na_strings=("", "nan", "None")):
+    """
+    pd.isna(s) | s.astype(str).str.strip().isin(na_strings) 的快速等价写法：
+    纯数值列、纯日期列的字符串形式不可能落入 na_strings，直接用 isna。
+    """
+    if is_native_numeric(series) or pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return pd.isna(series)
+    if pd.api.types.infer_dtype(series, skipna=True) in ("datetime", "date", "empty"):
+        return pd.isna(series)
+    return pd.isna(series) | series.astype(str).str.strip().isin(list(na_strings))
+
+
+def _to_float_exact(texts):
+    """对候选字符串逐元素套用 float()；整体成功走 NumPy 的 C 循环，失败才回退。"""
+    try:
+        return texts.astype(np.float64), np.ones(len(texts), dtype=bool)
+    except (ValueError, TypeError):
+        values = np.full(len(texts), np.nan)
+        ok = np.zeros(len(texts), dtype=bool)
+        for i, t in enumerate(texts):
+            try:
+                values[i] = float(t)
+                ok[i] = True
+            except ValueError:
+                pass
+        return values, ok
+
+
+def normalize_num_vec(series):
+    """把一列原始值规范化为 NumNorm（见模块说明）。"""
+    n = len(series)
+    values = np.full(n, np.nan)
+    is_pct = np.zeros(n, dtype=bool)
+    leftover = np.full(n, None, dtype=object)
+    is_null = np.asarray(pd.isna(series), dtype=bool).copy()
+
+    if n == 0:
+        return NumNorm(values, is_pct, leftover, is_null)
+
+    if is_native_numeric(series):
+        values = series.to_numpy(dtype=np.float64, na_value=np.nan)
+        return NumNorm(values, is_pct, leftover, is_null)
+
+    pos = np.flatnonzero(~is_null)
+    if len(pos) == 0:
+        return NumNorm(values, is_pct, leftover, is_null)
+
+    # 与 normalize_num 相同，一律经过 str(val)，原生数字、bool、日期等都不例外
+    text = series.iloc[pos].astype(str).str.replace(",", "", regex=False).str.strip()
+    empty = text.isin(["", "-", "nan"]).to_numpy()
+    is_null[pos[empty]] = True
+    pos, text = pos[~empty], text[~empty]
+
+    pct = text.str.contains("%", regex=False).to_numpy()
+    body = text.str.replace("%", "", regex=False)
+    cand = body.str.match(_FLOAT_LIKE, case=False).to_numpy(dtype=bool)
+
+    parsed_ok = np.zeros(len(pos), dtype=bool)
+    if cand.any():
+        cand_values, ok = _to_float_exact(body.to_numpy(dtype=object)[cand])
+        cand_pos = np.flatnonzero(cand)
+        cand_values = np.where(pct[cand], cand_values / 100, cand_values)
+        values[pos[cand_pos[ok]]] = cand_values[ok]
+        parsed_ok[cand_pos[ok]] = True
+
+    is_pct[pos] = pct
+    text_arr = text.to_numpy(dtype=object)
+    leftover[pos[~parsed_ok]] = text_arr[~parsed_ok]
+    return NumNorm(values, is_pct, leftover, is_null)
+
+
+def norm_str_repr(norm, idx, as_float_dtype):
+    """
+    复现 s.apply(normalize_num).astype(str) 在 idx 处的字符串：
+    字符串原样；浮点数取 str()；空值在 float64 列为 "nan"，在 object 列为 "None"。
+    """
+    out = np.empty(len(idx), dtype=object)
+    is_str = pd.notna(norm.leftover[idx])
+    out[is_str] = norm.leftover[idx][is_str]
+    null = norm.is_null[idx] & ~is_str
+    out[null] = "nan" if as_float_dtype else "None"
+    rest = ~is_str & ~null
+    out[rest] = [str(float(v)) for v in norm.values[idx][rest]]
+    return out
+
+
+def numeric_row_flags(series):
+    """
+    每行规范化后的 (是否为剩余字符串, 是否为数字) 两个布尔数组。
+    整列是否会被 apply 推成 float64 只取决于这两组标记：not has_str.any() and is_float.any()，
+    因此增量模式可以由“旧行的已存标记 + 新行现算的标记”推出整列的判定。
+    """
+    norm = normalize_num_vec(series)
+    has_str = pd.notna(norm.leftover)
+    return has_str, ~has_str & ~norm.is_null
+
+
+def numeric_flags(norm, forced=None):
+    """
+    一列规范化结果的比较标记 (is_num, is_na, as_float_dtype)：
+    as_float_dtype - 整列是否按 float64 列处理（apply 的结果没有字符串且至少有一个数字时会变成 float64 列），
+                     forced 不为 None 时直接采用（只比较部分行时传入整列的判定）
+    is_num         - 按数值比较的行（float64 列中的空值即 NaN 也算“数字”）
+    is_na          - 规范化后视为空：None/NaN，或字符串本身为 "None"
+    """
+    has_str = pd.notna(norm.leftover)
+    is_float = ~has_str & ~norm.is_null
+    as_float_dtype = (not has_str.any()) and bool(is_float.any()) if forced is None else forced
+    is_num = is_float | (norm.is_null & as_float_dtype)
+    is_na = norm.is_null | (is_float & np.isnan(norm.values)) | (has_str & (norm.leftover == "None"))
+    return is_num, is_na, as_float_dtype
+
@@ -0,0 +1,189 @@
+# =====================================
+# 💾 输出文件落盘：报告写到有上限的临时目录，缓存里只留轻量句柄
+# =====================================
+"""
+每次审核生成约 10 份报告（每个 sheet 两份 + 两份漏填报告），原先都以 BytesIO 留在内存里，
+还会被缓存持有。OutputStore 把它们写到磁盘目录：
+
+    store = OutputStore()
+    handle = store.put("月重卡_二次_审核标注版.xlsx", bytes_io)   # 之后 bytes_io 可以释放
+    handle.open()      # 从磁盘按流读取
+    handle.getvalue()  # 需要 bytes 时再读入（与 BytesIO 接口一致，旧调用方不用改）
+    handle = store.put_path(name, path)   # 很大的文件先写到 store.temp_path()，再整体入库
+    store.zip(handles, "审核结果.zip")   # 逐块拷贝打成一个 ZIP，同样落盘返回句柄
+
+文件按内容摘要命名，相同内容只存一份。目录受两个上限约束：
+超过 ttl 秒未被访问的文件删除；总大小超过 max_bytes 时从最久未访问的开始删除。
+句柄失效（文件已被淘汰）时 handle.exists() 为 False，调用方应重新生成。
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+
+from audit_cache import config_digest
+
+CHUNK = 1024 * 1024
+# 已经压缩过的格式放进 ZIP 时不再压缩（省 CPU，体积几乎不变）
+STORED_SUFFIXES = (".xlsx", ".parquet", ".zip")
+
+
+def default_output_dir():
+    """默认目录：环境变量 AUDIT_OUTPUT_DIR，否则系统临时目录下的 contract_audit_outputs。"""
+    return os.environ.get("AUDIT_OUTPUT_DIR") or os.path.join(tempfile.gettempdir(), "contract_audit_outputs")
+
+
+class OutputHandle:
+    """磁盘上一份报告的句柄：可安全地放进缓存、跨进程传递（只含路径与元数据）。"""
+
+    __slots__ = ("path", "filename", "size", "digest")
+
+    def __init__(self, path, filename, size, digest):
+        self.path = path
+        self.filename = filename
+        self.size = size
+        self.digest = digest
+
+    def __repr__(self):
+        return f"OutputHandle({self.filename!r}, {self.size} bytes)"
+
+    def __bool__(self):
+        return True
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def open(self):
+        """以二进制只读方式打开，并刷新访问时间（推迟淘汰）。"""
+        fh = open(self.path, "rb")
+        try:
+            os.utime(self.path)
+        except OSError:
+            pass
+        return fh
+
+    def getvalue(self):
+        with self.open() as fh:
+            return fh.read()
+
+
+class OutputStore:
+    """
+    有上限的输出目录。线程安全；多个进程共用同一目录也没有问题
+    （写入先落临时文件再改名，淘汰时删除失败的文件直接跳过）。
+    """
+
+    def __init__(self, root=None, max_bytes=2 * 1024 ** 3, ttl=6 * 3600):
+        self.root = root or default_output_dir()
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+
+    def _path(self, digest, filename):
+        return os.path.join(self.root, digest + os.path.splitext(filename)[1])
+
+    def _commit(self, tmp_path, path):
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def put(self, filename, data):
+        """把 BytesIO / bytes 写入目录，返回句柄。内容相同的文件已存在时只刷新访问时间。"""
+        payload = data.getbuffer() if hasattr(data, "getbuffer") else memoryview(data)
+        digest = hashlib.sha256(payload).hexdigest()[:32]
+        path = self._path(digest, filename)
+        if os.path.exists(path):
+            os.utime(path)
+        else:
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=self.root)
+            with os.fdopen(fd, "wb") as fh:
+                fh.write(payload)
+            self._commit(tmp_path, path)
+        return OutputHandle(path, filename, len(payload), digest)
+
+    def temp_path(self):
+        """目录内的一个临时文件路径：大文件可以先直接写到这里，再用 put_path 入库（同一文件系统内改名）。"""
+        fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=self.root)
+        os.close(fd)
+        return tmp_path
+
+    def put_path(self, filename, tmp_path):
+        """把已经写好的文件（通常来自 temp_path）按内容摘要入库，返回句柄；tmp_path 随后不再存在。"""
+        sha = hashlib.sha256()
+        with open(tmp_path, "rb") as fh:
+            for block in iter(lambda: fh.read(CHUNK), b""):
+                sha.update(block)
+        digest = sha.hexdigest()[:32]
+        path = self._path(digest, filename)
+        size = os.path.getsize(tmp_path)
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)
+        else:
+            self._commit(tmp_path, path)
+        return OutputHandle(path, filename, size, digest)
+
+    def zip(self, handles, filename):
+        """
+        把若干句柄逐块拷贝进一个 ZIP（不在内存中拼出整个压缩包），返回 ZIP 的句柄。
+        同一组文件再次打包直接复用已有的 ZIP。
+        """
+        handles = [h for h in handles if h is not None]
+        digest = "zip_" + config_digest([(h.filename, h.digest) for h in handles])
+        path = self._path(digest, filename)
+        if not os.path.exists(path):
+            fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", dir=self.root)
+            with os.fdopen(fd, "wb") as fh, zipfile.ZipFile(fh, "w") as zf:
+                used = set()
+                for h in handles:
+                    name = h.filename
+                    if name in used:  # 同名文件追加序号，避免 ZIP 中重名
+                        stem, ext = os.path.splitext(name)
+                        name = f"{stem}_{len(used)}{ext}"
+                    used.add(name)
+                    info = zipfile.ZipInfo(name, time.localtime()[:6])
+                    if not name.lower().endswith(STORED_SUFFIXES):
+                        info.compress_type = zipfile.ZIP_DEFLATED
+                    with h.open() as src, zf.open(info, "w", force_zip64=True) as dst:
+                        shutil.copyfileobj(src, dst, CHUNK)
+            self._commit(tmp_path, path)
+        else:
+            os.utime(path)
+        return OutputHandle(path, filename, os.path.getsize(path), digest)
+
+    def usage(self):
+        """目录中报告的总字节数。"""
+        return sum(size for _, _, size in self._entries())
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.root):
+            if name.startswith(".tmp_"):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            entries.append((st.st_atime if st.st_atime > st.st_mtime else st.st_mtime, path, st.st_size))
+        return entries
+
+    def evict(self, keep=None):
+        """删除超过 ttl 的文件，再按最久未访问的顺序删到总大小不超过 max_bytes（keep 除外）。"""
+        with self._lock:
+            now = time.time()
+            entries = sorted(self._entries())
+            total = sum(size for _, _, size in entries)
+            for touched, path, size in entries:
+                if path == keep:
+                    continue
+                if now - touched > self.ttl or total > self.max_bytes:
+                    try:
+                        os.remove(path)
+                        total -= size
+                    except OSError:
+                        pass
@@ -0,0 +1,99 @@
+# =====================================
+# 🗂️ 参考数据索引：合同键 → 稠密整数 id，ref_* 列按 id 对齐存放
+# =====================================
+"""
+按参考数据版本构建一次并缓存（只含规范化后的键与对齐后的列，不依赖任何驻留表）。
+每次审核先绑定到本次审核的驻留表（key_interner.KeyInterner），之后每个 sheet 只需：
+    ref_index = RefIndex(std_frames).bind(keys)                 # 参考键驻留进 keys，建立 驻留 id → 参考 id 映射
+    ids = ref_index.lookup_ids(keys.intern(main_df[合同列]))    # 驻留 id → 参考 id，一次数组取值
+    s_ref = ref_index.take('ref_fk_租赁本金', ids)              # 一次按位置取值
+不再对每个 sheet 做三次 pd.merge，也不再复制整张主表；对齐全程是整数数组运算，不再哈希字符串。
+"""
+
+import copy
+
+import numpy as np
+import pandas as pd
+from pandas.api.extensions import take
+
+from audit_cache import array_nbytes
+
+
+def _raw_values(s):
+    """Series 的底层数组：扩展类型（category 等）保留 ExtensionArray，其余取 ndarray。"""
+    if isinstance(s.dtype, pd.api.extensions.ExtensionDtype):
+        return s.array
+    return s.to_numpy()
+
+
+class RefIndex:
+    """
+    keys     - 三个参考表合同键的并集（pd.Index，位置即整数 id）
+    columns  - {ref 列名: 与 keys 对齐的数组}，某参考表中不存在的键为缺失值
+    interner - bind() 得到的副本才有：本次审核的驻留表
+    与 left merge 一致：缺失处 int 升为 float、bool 升为 object、日期为 NaT。
+    """
+
+    interner = None
+
+    def __init__(self, std_frames):
+        frames = [df for df in std_frames.values() if not df.empty]
+        # 各参考表的 __KEY__ 已经规范化过，直接取并集
+        frame_keys = [df['__KEY__'].to_numpy(dtype=object) for df in frames]
+        self.keys = pd.Index(pd.unique(np.concatenate(frame_keys)) if frames else [], dtype=object)
+
+        self.columns = {}
+        for df, keys in zip(frames, frame_keys):
+            # 该参考表每一行在整数 id 空间中的位置 → 反查：id → 该表行号（不存在为 -1）
+            row_of_id = np.full(len(self.keys), -1, dtype=np.intp)
+            row_of_id[self.keys.get_indexer(keys)] = np.arange(len(df))
+            for col in df.columns:
+                if col == '__KEY__':
+                    continue
+                self.columns[col] = take(_raw_values(df[col]), row_of_id, allow_fill=True)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __contains__(self, col):
+        return col in self.columns
+
+    @property
+    def nbytes(self):
+        """估算占用的字节数（缓存的内存预算按它计）：合同键、id 映射与全部对齐后的参考列。"""
+        return int(self.keys.memory_usage(deep=True)) + sum(array_nbytes(values) for values in self.columns.values())
+
+    def bind(self, interner):
+        """
+        绑定到一次审核的驻留表 interner，返回共享键与参考列的浅副本（缓存中的索引本身不变）。
+        参考键在此驻留，之后新增的 id（只在月重卡中出现的键）都不在映射范围内，一律视为找不到。
+        """
+        bound = copy.copy(self)
+        bound.interner = interner
+        key_ids = interner.intern_normalized(self.keys.to_numpy(dtype=object))
+        bound._ref_id = np.full(len(interner), -1, dtype=np.intp)
+        bound._ref_id[key_ids] = np.arange(len(key_ids))
+        return bound
+
+    def lookup_ids(self, key_ids):
+        """驻留 id 数组（须来自 bind 的驻留表）→ 整数 id 数组（找不到为 -1）。"""
+        key_ids = np.asarray(key_ids, dtype=np.int64)
+        out = np.full(len(key_ids), -1, dtype=np.intp)
+        inside = (key_ids >= 0) & (key_ids < len(self._ref_id))
+        out[inside] = self._ref_id[key_ids[inside]]
+        return out
+
+    def lookup(self, keys):
+        """规范化后的合同键 → 整数 id 数组（找不到为 -1）。"""
+        return self.keys.get_indexer(np.asarray(keys, dtype=object))
+
+    def take(self, col, ids, index=None, missing=False):
+        """
+        按 lookup 得到的 id 对齐取出一列参考值；id 为 -1 处为缺失值。
+        missing=True 表示这些行所在的整表另有找不到的键：即使本块没有 -1，也按有缺失值升级 dtype
+        （int → float、bool → object），分块对齐的结果与整表对齐的 dtype 相同。
+        """
+        values = self.columns[col]
+        if missing and not (ids < 0).any():
+            return pd.Series(take(values, np.append(ids, -1), allow_fill=True)[:-1], index=index, name=col)
+        return pd.Series(take(values, ids, allow_fill=True), index=index, name=col)
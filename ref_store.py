@@ -0,0 +1,172 @@
+# =====================================
+# 🗃️ 参考数据列式存储：按源文件摘要分版本，按列落盘、按需读取
+# =====================================
+"""
+放款明细 / 字段 / 二次明细 变化很慢却很大，每次审核都从 Excel 重新解析、再跑一遍
+prepare_ref_df（合同键规范化 + 去重）。RefStore 把这些中间结果按列保存到本地目录：
+
+    <根目录>/<名称>/<版本>/manifest.json   行数、各列文件与类型
+                          labels.pkl      列名原值（列名不一定是字符串）
+                          c0000.npy ...   数值 / 布尔 / 日期列：.npy，读取时内存映射
+                          c0001.pkl ...   文本等 object 列及扩展类型：pickle
+
+名称如 "ref_std_fk"（标准化后的参考表）、"raw_zd"（漏填检查用的原始字段表），
+版本 = 源文件内容摘要 + 相关配置摘要，所以只有内容变了的文件才会重新解析入库。
+写入先落到临时目录再整体改名，读到的一定是完整的一版；每个名称只保留最近几版。
+
+    store = RefStore()
+    df = store.load("ref_std_fk", version, columns=["__KEY__", "ref_fk_租赁本金"])  # 未入库为 None
+    store.save("ref_std_fk", version, std_df)
+
+命令行预先入库（之后的审核不必再解析这几个工作簿）：
+    python ref_store.py 放款明细.xlsx 字段.xlsx 二次明细.xlsx
+"""
+
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+SCHEMA_VERSION = 2  # 2: 日期文本新增“月/日/年”“日/月/年”格式，已入库的日期参考列需重新解析
+KEEP_VERSIONS = 3  # 每个名称保留的版本数
+
+
+def default_store_dir():
+    """默认目录：环境变量 AUDIT_REF_STORE，否则 ~/.cache/contract_audit/ref_store。"""
+    return os.environ.get("AUDIT_REF_STORE") or os.path.join(
+        os.path.expanduser("~"), ".cache", "contract_audit", "ref_store"
+    )
+
+
+def _is_plain(dtype):
+    """可以直接存成 .npy 并内存映射的 dtype（数值、布尔、无时区日期）。"""
+    return not isinstance(dtype, pd.api.extensions.ExtensionDtype) and dtype.kind in "biufmM"
+
+
+def _write_column(folder, stem, s):
+    if _is_plain(s.dtype):
+        np.save(os.path.join(folder, stem + ".npy"), s.to_numpy(), allow_pickle=False)
+        return {"file": stem + ".npy", "dtype": str(s.dtype)}
+    values = s.array if isinstance(s.dtype, pd.api.extensions.ExtensionDtype) else s.to_numpy()
+    with open(os.path.join(folder, stem + ".pkl"), "wb") as fh:
+        pickle.dump(values, fh, protocol=pickle.HIGHEST_PROTOCOL)
+    return {"file": stem + ".pkl", "dtype": str(s.dtype)}
+
+
+def _read_column(folder, entry):
+    path = os.path.join(folder, entry["file"])
+    if entry["file"].endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    with open(path, "rb") as fh:
+        return pickle.load(fh)
+
+
+class RefStore:
+    """本地列式存储。只保存根目录，可以在多个线程 / 进程中同时使用。"""
+
+    def __init__(self, root=None, keep=KEEP_VERSIONS):
+        self.root = root or default_store_dir()
+        self.keep = keep
+
+    def _dir(self, name, version):
+        return os.path.join(self.root, name, version)
+
+    def has(self, name, version):
+        return os.path.exists(os.path.join(self._dir(name, version), "manifest.json"))
+
+    def load(self, name, version, columns=None):
+        """
+        读取一版 DataFrame；未入库（或格式版本不符）时返回 None。
+        columns 给出时只读取这些列（不存在的列忽略），其余列文件不会被打开。
+        """
+        folder = self._dir(name, version)
+        try:
+            with open(os.path.join(folder, "manifest.json"), encoding="utf-8") as fh:
+                manifest = json.load(fh)
+            with open(os.path.join(folder, "labels.pkl"), "rb") as fh:
+                labels = pickle.load(fh)
+        except (OSError, ValueError, pickle.UnpicklingError):
+            return None
+        if manifest.get("schema") != SCHEMA_VERSION:
+            return None
+
+        wanted = None if columns is None else set(columns)
+        data = {}
+        for label, entry in zip(labels, manifest["columns"]):
+            if wanted is None or label in wanted:
+                data[label] = _read_column(folder, entry)
+        index = _read_column(folder, manifest["index"])
+        # copy=False：.npy 列保持内存映射，只有真正用到的部分才从磁盘读入
+        return pd.DataFrame(data, index=pd.Index(index), columns=list(data), copy=False)
+
+    def save(self, name, version, df):
+        """保存一版 DataFrame（已存在则跳过），并清理该名称下多余的旧版本。"""
+        if self.has(name, version):
+            return
+        parent = os.path.join(self.root, name)
+        os.makedirs(parent, exist_ok=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp_", dir=parent)
+        try:
+            entries = [_write_column(tmp, f"c{i:04d}", df.iloc[:, i]) for i in range(df.shape[1])]
+            manifest = {
+                "schema": SCHEMA_VERSION,
+                "name": name,
+                "version": version,
+                "rows": len(df),
+                "created": time.time(),
+                "columns": [{"label": str(label), **e} for label, e in zip(df.columns, entries)],
+                "index": _write_column(tmp, "index", df.index.to_series(index=None)),
+            }
+            with open(os.path.join(tmp, "labels.pkl"), "wb") as fh:
+                pickle.dump(list(df.columns), fh, protocol=pickle.HIGHEST_PROTOCOL)
+            with open(os.path.join(tmp, "manifest.json"), "w", encoding="utf-8") as fh:
+                json.dump(manifest, fh, ensure_ascii=False, indent=2)
+            os.replace(tmp, self._dir(name, version))
+        except OSError:
+            # 并发写入同一版本时，另一方已先完成改名
+            shutil.rmtree(tmp, ignore_errors=True)
+            if not self.has(name, version):
+                raise
+        self.prune(name)
+
+    def versions(self, name):
+        """该名称下已入库的版本，按入库时间从新到旧。"""
+        parent = os.path.join(self.root, name)
+        if not os.path.isdir(parent):
+            return []
+        found = [v for v in os.listdir(parent) if not v.startswith(".") and self.has(name, v)]
+        return sorted(found, key=lambda v: os.path.getmtime(self._dir(name, v)), reverse=True)
+
+    def prune(self, name):
+        """只保留最近 keep 个版本。正在被内存映射的旧版本删除失败（Windows）时留待下次。"""
+        for version in self.versions(name)[self.keep:]:
+            shutil.rmtree(self._dir(name, version), ignore_errors=True)
+
+
+def ingest(paths, store=None, log=print):
+    """
+    把参考文件预先解析入库，返回 {前缀: "store" 已是最新 / "computed" 本次解析入库}。
+    与审核时的入库完全相同（见 audit_engine.load_reference_frames），已是最新版本的文件不会重新解析。
+    """
+    import audit_engine
+
+    store = store or RefStore()
+    files = [open(p, "rb") for p in paths]
+    try:
+        return audit_engine.load_reference_frames(files, store, log=lambda level, text: log(text))
+    finally:
+        for f in files:
+            f.close()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("用法: python ref_store.py 放款明细.xlsx 字段.xlsx 二次明细.xlsx", file=sys.stderr)
+        sys.exit(2)
+    ingest(sys.argv[1:])
@@ -0,0 +1,85 @@
+# =====================================
+# 📤 流式导出层：write-only 工作簿，写行的同时上色
+# =====================================
+"""
+“仅错误行”报告与两份漏填报告都用 openpyxl 的 write-only 模式逐行写出：
+行数据直接落到临时文件，不在内存里保留整张 Worksheet；
+需要上色的单元格在写入时就包成带 fill 的 WriteOnlyCell，不必事后回头扫描表头和行。
+字段表很大时，还可以顺带导出 CSV / Parquet。
+"""
+
+from io import BytesIO
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.utils.dataframe import dataframe_to_rows
+
+try:
+    import pyarrow  # noqa: F401  (Parquet 导出为可选功能)
+    HAS_PARQUET = True
+except ImportError:
+    HAS_PARQUET = False
+
+
+class StreamingXlsxWriter:
+    """单 sheet 的 write-only xlsx 写入器。append 的行立即写出，close() 返回 BytesIO。"""
+
+    def __init__(self, title=None):
+        self._wb = Workbook(write_only=True)
+        self._ws = self._wb.create_sheet(title)
+        self.rows_written = 0
+
+    def append(self, values, fills=None):
+        """写一行；fills 为 {列位置(0 起): PatternFill}，这些单元格写入时即带上颜色。"""
+        if fills:
+            values = list(values)
+            for col_pos, fill in fills.items():
+                cell = WriteOnlyCell(self._ws, value=values[col_pos])
+                cell.fill = fill
+                values[col_pos] = cell
+        self._ws.append(values)
+        self.rows_written += 1
+
+    def close(self, target=None):
+        """写出 xlsx。target（路径或文件对象）给出时直接写到那里并返回 target，否则返回 BytesIO。"""
+        if target is not None:
+            self._wb.save(target)
+            return target
+        output = BytesIO()
+        self._wb.save(output)
+        output.seek(0)
+        return output
+
+
+def iter_frame_rows(df):
+    """逐行产出 DataFrame 的表头与数据（与 dataframe_to_rows(index=False, header=True) 一致）。"""
+    return dataframe_to_rows(df, index=False, header=True)
+
+
+def export_extra_formats(df, basename, formats):
+    """
+    额外导出 CSV / Parquet，返回 [(文件名, BytesIO)] 与提示信息列表。
+    Parquet 依赖 pyarrow，未安装时跳过并给出提示。
+    """
+    files, notes = [], []
+    for fmt in formats:
+        if fmt == "csv":
+            output = BytesIO()
+            df.to_csv(output, index=False, encoding="utf-8-sig")
+            output.seek(0)
+            files.append((f"{basename}.csv", output))
+        elif fmt == "parquet":
+            if not HAS_PARQUET:
+                notes.append(f"⚠️ 未安装 pyarrow，跳过 {basename}.parquet 导出。")
+                continue
+            output = BytesIO()
+            # 混合类型的 object 列统一转成字符串，避免 Arrow 类型推断失败
+            safe = df.copy()
+            for col in safe.columns:
+                if safe[col].dtype == object:
+                    safe[col] = safe[col].map(lambda v: None if v is None or v != v else str(v))
+            safe.columns = [str(c) for c in safe.columns]
+            safe.to_parquet(output, index=False)
+            output.seek(0)
+            files.append((f"{basename}.parquet", output))
+    return files, notes
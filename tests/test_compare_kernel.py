@@ -0,0 +1,212 @@
+# =====================================
+# 🧪 比对内核：compare_block / compare_series_vec 与原逐行比较得到相同的错误掩码
+# =====================================
+import numpy as np
+import pandas as pd
+import pytest
+
+from audit_engine import blank_ref_mask, compare_series_vec, normalize_num
+from audit_rules import Rule
+from compare_kernel import compare_block
+from key_interner import KeyInterner
+from ref_index import RefIndex
+
+# 原实现对 object 列 fillna 会触发 pandas 的降级 FutureWarning，与被测代码无关
+pytestmark = pytest.mark.filterwarnings("ignore:Downcasting object dtype arrays:FutureWarning")
+
+# -------------------------------------
+# 原实现（app2.py 向量化改造前）的逐行比较，原样保留作为对照
+# -------------------------------------
+def baseline_compare(s_main, s_ref, main_kw):
+    merge_failed_mask = s_ref.isna()
+    main_is_na = pd.isna(s_main) | (s_main.astype(str).str.strip().isin(["", "nan", "None"]))
+    ref_is_na = pd.isna(s_ref) | (s_ref.astype(str).str.strip().isin(["", "nan", "None"]))
+    both_are_na = main_is_na & ref_is_na
+
+    s_main_norm = s_main.apply(normalize_num)
+    s_ref_norm = s_ref.apply(normalize_num)
+    main_is_na_norm = pd.isna(s_main_norm) | (s_main_norm.astype(str).str.strip().isin(["", "nan", "None"]))
+    ref_is_na_norm = pd.isna(s_ref_norm) | (s_ref_norm.astype(str).str.strip().isin(["", "nan", "None"]))
+    both_are_na_norm = main_is_na_norm & ref_is_na_norm
+    is_num_main = s_main_norm.apply(lambda x: isinstance(x, (int, float)))
+    is_num_ref = s_ref_norm.apply(lambda x: isinstance(x, (int, float)))
+    both_are_num = is_num_main & is_num_ref
+    errors = pd.Series(False, index=s_main.index)
+    if both_are_num.any():
+        num_main = s_main_norm[both_are_num].fillna(0)
+        num_ref = s_ref_norm[both_are_num].fillna(0)
+        diff = (num_main - num_ref).abs()
+        if main_kw == "保证金比例":
+            num_errors = (diff > 0.00500001)
+        elif "租赁期限" in main_kw:
+            num_errors = (diff >= 1.0)
+        else:
+            num_errors = (diff > 1e-6)
+        errors.loc[both_are_num] = num_errors
+    not_num_mask = ~both_are_num
+    if not_num_mask.any():
+        str_main = s_main_norm[not_num_mask].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+        str_ref = s_ref_norm[not_num_mask].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+        errors.loc[not_num_mask] = (str_main != str_ref)
+    errors = errors & ~both_are_na_norm
+
+    final_errors = errors & ~both_are_na
+    lookup_failure_mask = merge_failed_mask & ~main_is_na
+    return final_errors & ~lookup_failure_mask
+
+
+def baseline_skip(main_kw, s_ref):
+    """原实现只对「城市经理」跳过参考值为空的行。"""
+    if main_kw != "城市经理":
+        return pd.Series(False, index=s_ref.index)
+    return pd.isna(s_ref) | s_ref.astype(str).str.strip().isin(["", "-", "nan", "none", "null"])
+
+
+# 与 audit_rules.json 中对应规则的定义一致
+RULES = {
+    "租赁本金": Rule("fk", "租赁本金", "租赁本金"),
+    "租赁期限": Rule("fk", "租赁期限", "租赁期限", ref_transform="years_to_months", tolerance=1.0, inclusive=True),
+    "保证金比例": Rule("zd", "保证金比例", "保证金比例_2", tolerance=0.00500001),
+    "城市经理": Rule("zd", "城市经理", "城市经理", match="exact", skip_blank_ref=True),
+}
+
+VALUES = {
+    "租赁本金": [None, np.nan, "", "-", "nan", 0, 100, 100.0, "100", "1,000", "1000.0000001", 1000.000002,
+                 "12%", "待定", "HT-1", "#N/A", True, " 100 ", "１００"],
+    # 参考表里是年，主表里是月：差值恰好为 1.0 时 >= 判为错误
+    "租赁期限": [None, "", "-", 36, 36.0, "36", 35, 37, 35.5, 36.999, "3年", "nan", 24, 12.5],
+    "保证金比例": [None, "", 0.1, 0.105, 0.10500001, 0.1051, "10%", "10.5%", "10.6%", 0.095, "0.1", "待定", 0],
+    "城市经理": [None, np.nan, "", " ", "-", "nan", "None", "null", "张三", " 张三 ", "李四", 1, 1.0, "1"],
+}
+REF_VALUES = {
+    **VALUES,
+    "租赁期限": [None, "", "-", 3, 3.0, "3", 2.9, 3.1, "3年", "nan", 2, 1.04],
+}
+
+
+def _sheet(main_kw, seed, n=400, main_dtype=object, ref_dtype=object):
+    """随机生成一张主表列、参考表列与合同键：约 1/6 的主表合同在参考表中找不到。"""
+    rng = np.random.default_rng(seed)
+    main_pool, ref_pool = VALUES[main_kw], REF_VALUES[main_kw]
+    n_ref = n * 5 // 6
+    ref_keys = [f"HT-{i:04d}" for i in range(n_ref)]
+    main_keys = [f"HT-{i:04d}" for i in rng.permutation(n)]  # 编号 >= n_ref 的合同不在参考表中
+    s_main = pd.Series([main_pool[i] for i in rng.integers(0, len(main_pool), n)], dtype=main_dtype)
+    ref_raw = pd.Series([ref_pool[i] for i in rng.integers(0, len(ref_pool), n_ref)], dtype=ref_dtype)
+    return main_keys, s_main, ref_keys, ref_raw
+
+
+def _aligned_new(rule, main_keys, ref_keys, ref_raw):
+    """新路径：prepare_ref → RefIndex → 驻留 id 对齐（找不到的键 id 为 -1）。"""
+    keys = KeyInterner()
+    std_df = pd.DataFrame({"__KEY__": keys.normalize(pd.Series(ref_keys)), rule.ref_col: rule.prepare_ref(ref_raw)})
+    ref_index = RefIndex({rule.prefix: std_df}).bind(keys)
+    ids = ref_index.lookup_ids(keys.intern(pd.Series(main_keys)))
+    return ids, ref_index.take(rule.ref_col, ids)
+
+
+def _aligned_baseline(main_kw, main_keys, ref_keys, ref_raw):
+    """原路径：租赁期限 ×12 后按合同键 left merge。"""
+    if main_kw == "租赁期限":
+        ref_raw = pd.to_numeric(ref_raw, errors="coerce") * 12
+    std_df = pd.DataFrame({"__KEY__": ref_keys, "ref": ref_raw})
+    merged = pd.merge(pd.DataFrame({"__KEY__": main_keys}), std_df, on="__KEY__", how="left")
+    return merged["ref"]
+
+
+def _baseline_mask(main_kw, s_main, s_ref):
+    return (baseline_compare(s_main, s_ref, main_kw) & ~baseline_skip(main_kw, s_ref)).to_numpy(dtype=bool)
+
+
+def _new_mask(rule, s_main, s_ref):
+    return (compare_series_vec(s_main, s_ref, rule) & ~blank_ref_mask(rule, s_ref)).to_numpy(dtype=bool)
+
+
+@pytest.mark.parametrize("main_kw", sorted(RULES))
+@pytest.mark.parametrize("seed", range(3))
+def test_rule_masks_match_baseline(main_kw, seed):
+    rule = RULES[main_kw]
+    main_keys, s_main, ref_keys, ref_raw = _sheet(main_kw, seed)
+    ids, s_ref = _aligned_new(rule, main_keys, ref_keys, ref_raw)
+    s_ref_old = _aligned_baseline(main_kw, main_keys, ref_keys, ref_raw)
+    assert (ids == -1).any() and (ids >= 0).any()
+
+    expected = _baseline_mask(main_kw, s_main, s_ref_old)
+    assert expected.any() and not expected.all()
+    np.testing.assert_array_equal(_new_mask(rule, s_main, s_ref), expected)
+
+
+@pytest.mark.parametrize("main_kw", ["租赁本金", "租赁期限", "保证金比例"])
+def test_float64_columns_match_baseline(main_kw):
+    """两边都是 float64 列（数值列读入后的常见 dtype）：走纯数值快路径。"""
+    rule = RULES[main_kw]
+    rng = np.random.default_rng(7)
+    main_keys, _, ref_keys, _ = _sheet(main_kw, 7)
+    base = rng.integers(0, 5, len(main_keys)).astype(float)
+    s_main = pd.Series(base + rng.choice([0.0, 1e-7, 0.004, 0.005, 0.006, 1.0], len(base)), dtype="float64")
+    s_main[rng.integers(0, len(s_main), 30)] = np.nan
+    ref_raw = pd.Series(rng.integers(0, 5, len(ref_keys)).astype(float), dtype="float64")
+    ref_raw[rng.integers(0, len(ref_raw), 30)] = np.nan
+    if main_kw == "租赁期限":
+        s_main = s_main * 12
+
+    ids, s_ref = _aligned_new(rule, main_keys, ref_keys, ref_raw)
+    s_ref_old = _aligned_baseline(main_kw, main_keys, ref_keys, ref_raw)
+    assert s_main.dtype == np.float64 and s_ref.dtype == np.float64
+    np.testing.assert_array_equal(_new_mask(rule, s_main, s_ref), _baseline_mask(main_kw, s_main, s_ref_old))
+
+
+@pytest.mark.parametrize("main, ref, expected", [
+    (0.1, 0.105, False),         # 差 0.005，在 0.00500001 以内
+    (0.1, 0.10500002, True),     # 刚好超出
+    ("10%", 0.104, False),       # 百分比字符串按 /100 比较
+    (0.1, "10.6%", True),
+])
+def test_deposit_ratio_tolerance(main, ref, expected):
+    rule = RULES["保证金比例"]
+    s_main, s_ref = pd.Series([main], dtype=object), pd.Series([ref], dtype=object)
+    assert bool(compare_series_vec(s_main, s_ref, rule).iloc[0]) is expected
+    assert bool(baseline_compare(s_main, s_ref, "保证金比例").iloc[0]) is expected
+
+
+@pytest.mark.parametrize("main, years, expected", [
+    (36, 3, False),
+    (37, 3, True),      # 差值恰好 1.0，>= 判为错误
+    (36.5, 3, False),
+    (35, 3.1, True),    # 37.2 - 35 = 2.2
+    ("36", "3", False),
+])
+def test_lease_term_years_to_months(main, years, expected):
+    rule = RULES["租赁期限"]
+    s_main = pd.Series([main], dtype=object)
+    s_ref = rule.prepare_ref(pd.Series([years], dtype=object))
+    assert bool(compare_series_vec(s_main, s_ref, rule).iloc[0]) is expected
+    assert bool(baseline_compare(s_main, s_ref, "租赁期限").iloc[0]) is expected
+
+
+def test_lookup_failure_and_blank_ref_are_not_errors():
+    """参考表中找不到合同（id 为 -1）的行不计错误；城市经理参考值为空的行跳过。"""
+    rule = RULES["城市经理"]
+    main_keys = ["HT-1", "HT-2", "HT-3", "HT-404", "HT-405"]
+    s_main = pd.Series(["张三", "张三", "张三", "张三", None], dtype=object)
+    ids, s_ref = _aligned_new(rule, main_keys, ["HT-1", "HT-2", "HT-3"], pd.Series(["李四", "-", None], dtype=object))
+    assert list(ids[3:]) == [-1, -1] and s_ref[3:].isna().all()
+    assert list(_new_mask(rule, s_main, s_ref)) == [True, False, False, False, False]
+    assert list(blank_ref_mask(rule, s_ref)) == [False, True, True, True, True]
+
+
+def test_compare_block_columns_match_baseline():
+    """compare_block 一次比较多列，每一列（再去掉 skip_blank_ref 的行）与原实现逐列比较一致。"""
+    mains, refs, old_refs, rules = [], [], [], []
+    for seed, main_kw in enumerate(sorted(RULES)):
+        rule = RULES[main_kw]
+        main_keys, s_main, ref_keys, ref_raw = _sheet(main_kw, seed, n=300)
+        mains.append(s_main)
+        refs.append(_aligned_new(rule, main_keys, ref_keys, ref_raw)[1])
+        old_refs.append(_aligned_baseline(main_kw, main_keys, ref_keys, ref_raw))
+        rules.append(rule)
+    errors = compare_block(mains, refs, rules)
+    assert errors.shape == (300, len(rules))
+    for j, rule in enumerate(rules):
+        got = errors[:, j] & ~blank_ref_mask(rule, refs[j]).to_numpy(dtype=bool)
+        np.testing.assert_array_equal(got, _baseline_mask(rule.main, mains[j], old_refs[j]), err_msg=rule.main)
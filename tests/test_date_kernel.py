@@ -0,0 +1,144 @@
+# =====================================
+# 🧪 日期内核：Excel 序列号、按列识别格式、无法解析回退为 NaT，日期规则掩码与原实现一致
+# =====================================
+import datetime
+import warnings
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from audit_rules import Rule
+from compare_kernel import compare_block
+from date_kernel import column_date_format, detect_date_format, parse_date_column
+
+RULE = Rule("zd", "起租时间", "起租日_商", type="date")
+T = pd.Timestamp
+
+
+def _parsed(values, dtype=object):
+    return list(parse_date_column(pd.Series(values, dtype=dtype)))
+
+
+# -------------------------------------
+# Excel 序列号
+# -------------------------------------
+@pytest.mark.parametrize("dtype", ["float64", "int64", object])
+def test_serial_numbers(dtype):
+    # 45292 = 2024-01-01；1 = 1900-01-01（序列号的下限）
+    assert _parsed([45292, 45658, 1], dtype) == [T("2024-01-01"), T("2025-01-01"), T("1899-12-31")]
+
+
+def test_serial_fraction_and_out_of_range():
+    # 带时间的序列号按日归一；0、负数、超过 9999-12-31 的都不是日期
+    assert _parsed([45292.75, np.nan, 0, -5, 3e6], "float64") == [T("2024-01-01"), pd.NaT, pd.NaT, pd.NaT, pd.NaT]
+
+
+def test_serials_mixed_with_strings_and_datetimes():
+    values = [45292, "2024-01-02", 45293.5, None, T("2024-01-05 13:00"), datetime.date(2024, 1, 6), "", True]
+    assert _parsed(values) == [
+        T("2024-01-01"), T("2024-01-02"), T("2024-01-02"), pd.NaT, T("2024-01-05"), T("2024-01-06"), pd.NaT, pd.NaT,
+    ]
+    # 识别格式只看文本值，序列号与空白不参与
+    assert column_date_format(pd.Series(values[:-1], dtype=object)) == "%Y-%m-%d"
+
+
+# -------------------------------------
+# 日/月顺序不明确的文本
+# -------------------------------------
+def test_ambiguous_column_is_month_first():
+    # 每个值都能按“月/日”解析：与 pandas 默认一致，月在前
+    values = ["01/02/2024", "03/04/2024", "12/11/2024"]
+    assert detect_date_format(pd.Series(values)) == "%m/%d/%Y"
+    assert _parsed(values) == [T("2024-01-02"), T("2024-03-04"), T("2024-12-11")]
+
+
+@pytest.mark.parametrize("values, expected", [
+    (["01/02/2024", "03/04/2024", "13/04/2024"], [T("2024-02-01"), T("2024-04-03"), T("2024-04-13")]),  # 日 > 12 的值在后
+    (["13/04/2024", "01/02/2024", "03/04/2024"], [T("2024-04-13"), T("2024-02-01"), T("2024-04-03")]),  # 日 > 12 的值在前
+])
+def test_day_over_twelve_makes_whole_column_day_first(values, expected):
+    assert detect_date_format(pd.Series(values)) == "%d/%m/%Y"
+    assert _parsed(values) == expected
+
+
+def test_ambiguous_format_is_per_column():
+    month_first = pd.Series(["01/02/2024", "03/04/2024"], dtype=object)
+    day_first = pd.Series(["01/02/2024", "25/04/2024"], dtype=object)
+    assert parse_date_column(month_first).iloc[0] == T("2024-01-02")
+    assert parse_date_column(day_first).iloc[0] == T("2024-02-01")
+
+
+# -------------------------------------
+# 无法解析的值
+# -------------------------------------
+def test_unparseable_values_fall_back_to_nat():
+    values = ["2024-01-02", "待定", "abc", "2024-13-01", "2024-02-30", "#N/A", "-", " 2024-01-03 ", None]
+    assert _parsed(values) == [
+        T("2024-01-02"), pd.NaT, pd.NaT, pd.NaT, pd.NaT, pd.NaT, pd.NaT, T("2024-01-03"), pd.NaT,
+    ]
+
+
+def test_all_unparseable_column():
+    values = ["待定", "abc", "", None]
+    assert detect_date_format(pd.Series(["待定", "abc"])) is None
+    assert column_date_format(pd.Series(values, dtype=object)) == "mixed"
+    assert pd.isna(_parsed(values)).all()
+
+
+# -------------------------------------
+# 日期规则的错误掩码：与原 pd.to_datetime 逐列解析的比较一致
+# -------------------------------------
+def baseline_date_errors(s_main, s_ref):
+    """原实现（app2.py 向量化改造前）compare_series_vec 的日期分支，参考列为未经预处理的原值。"""
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)  # 无法推断格式时 pandas 的提示
+        d_main = pd.to_datetime(s_main, errors='coerce')
+        d_ref = pd.to_datetime(s_ref, errors='coerce')
+    valid_dates_mask = d_main.notna() & d_ref.notna()
+    date_diff_mask = (d_main.dt.date != d_ref.dt.date)
+    return (valid_dates_mask & date_diff_mask).to_numpy(dtype=bool)
+
+
+def _date_values(rng, days, fmt):
+    """按 fmt 写出日期（fmt 为 None 时为 Timestamp），夹杂空值、空白与无法解析的文本。"""
+    dates = T("2024-01-01") + pd.to_timedelta(days, unit="D")
+    if fmt is None:
+        values = list(dates + pd.to_timedelta(rng.integers(0, 86400, len(days)), unit="s"))
+    else:
+        values = [d.strftime(fmt) for d in dates]
+    for i in rng.integers(0, len(values), len(values) // 10):
+        values[i] = [None, "", "待定", "abc"][i % 4]
+    return pd.Series(values, dtype=object)
+
+
+@pytest.mark.parametrize("fmt", ["%Y-%m-%d", "%Y/%m/%d", "%Y-%m-%d %H:%M:%S", "%Y%m%d", None])
+def test_date_rule_masks_match_baseline(fmt):
+    rng = np.random.default_rng(0)
+    n = 500
+    days = rng.integers(0, 60, n)
+    shifted = days + rng.choice([0, 0, 0, 1, -1, 30], n)
+    s_main = _date_values(rng, days, fmt)
+    ref_raw = _date_values(rng, shifted, fmt)
+
+    expected = baseline_date_errors(s_main, ref_raw)
+    assert expected.any() and not expected.all()
+    # 参考列与审核时一样先经 Rule.prepare_ref 解析
+    got = compare_block([s_main], [RULE.prepare_ref(ref_raw)], [RULE])[:, 0]
+    np.testing.assert_array_equal(got, expected)
+
+
+def test_date_rule_datetime64_columns_and_missing_ref():
+    """两边都是 datetime64 列；参考表中找不到合同（对齐后为 NaT）的行不计错误。"""
+    s_main = pd.Series(pd.to_datetime(["2024-01-01 08:00", "2024-01-02 00:00", None, "2024-01-04 00:00", "2024-01-05 00:00"]))
+    ref_raw = pd.Series(pd.to_datetime(["2024-01-01 23:00", "2024-01-03 00:00", "2024-01-03 00:00", None, None]))
+    expected = baseline_date_errors(s_main, ref_raw)
+    assert list(expected) == [False, True, False, False, False]
+    np.testing.assert_array_equal(compare_block([s_main], [RULE.prepare_ref(ref_raw)], [RULE])[:, 0], expected)
+
+
+def test_date_rule_serial_against_text():
+    """月重卡里是序列号、参考表里是文本：按同一天比较（原实现把数字当作纳秒，总是报错）。"""
+    s_main = pd.Series([45292, 45292, 45293.25, None], dtype=object)
+    ref = RULE.prepare_ref(pd.Series(["2024-01-01", "2024-01-02", "2024-01-02", "2024-01-02"], dtype=object))
+    assert list(compare_block([s_main], [ref], [RULE])[:, 0]) == [False, True, False, False]
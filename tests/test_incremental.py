@@ -0,0 +1,58 @@
+# =====================================
+# 🧪 增量审核：规则数不受位宽限制，沿用结论与整列比较一致
+# =====================================
+import numpy as np
+import pandas as pd
+
+from audit_engine import compare_series_vec
+from audit_rules import Rule
+from incremental import FingerprintStore, IncrementalPlan
+
+N_ROWS, N_RULES = 200, 70  # 超过 int64 位掩码能容纳的规则数（结论 64 条、逐行标记 16 条）
+KEYS = [f"HT-{i}" for i in range(N_ROWS)]
+RULES = [Rule("fk", f"列{j}", f"列{j}") for j in range(N_RULES)]
+
+
+def _columns(seed):
+    rng = np.random.default_rng(seed)
+    columns = []
+    for j in range(N_RULES):
+        s_main = pd.Series(rng.integers(0, 5, N_ROWS).astype(float), dtype=object)
+        s_ref = pd.Series(rng.integers(0, 5, N_ROWS).astype(float), dtype=object)
+        if j % 7 == 0:
+            s_main[rng.integers(0, N_ROWS)] = "待定"
+        columns.append((s_main, s_ref))
+    return columns
+
+
+def _run(store, columns):
+    plan = IncrementalPlan(store, "二次", KEYS, [(r.label, r, m, f) for r, (m, f) in zip(RULES, columns)])
+    errors = np.zeros((N_ROWS, N_RULES), dtype=bool)
+    for i in range(N_RULES):
+        errors[:, i] = plan.compare(i, compare_series_vec).to_numpy(dtype=bool)
+        plan.record(i, errors[:, i])
+    plan.commit()
+    full = np.column_stack([
+        compare_series_vec(m, f, rule).to_numpy(dtype=bool) for rule, (m, f) in zip(RULES, columns)
+    ])
+    return errors, full, plan.summary()
+
+
+def test_many_rules_round_trip(tmp_path):
+    store = FingerprintStore(str(tmp_path / "fingerprints.sqlite"))
+    columns = _columns(0)
+    errors, full, summary = _run(store, columns)
+    assert (errors == full).all() and summary["reused"] == 0
+
+    errors, full, summary = _run(store, columns)
+    assert (errors == full).all()
+    assert summary["reused"] == N_ROWS and summary["full_rules"] == []
+
+    changed = [(m.copy(), f.copy()) for m, f in columns]
+    for j in range(0, N_RULES, 3):
+        changed[j][0][j % N_ROWS] = 9.0
+    changed[5][0][10] = "文本"  # 整列上下文变化：该规则整列重算
+    errors, full, summary = _run(store, changed)
+    assert (errors == full).all()
+    assert 0 < summary["recompared"] < N_ROWS
+    assert summary["full_rules"] == [RULES[5].label]
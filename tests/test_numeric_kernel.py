@@ -0,0 +1,84 @@
+# =====================================
+# 🧪 数值内核：向量化规范化与逐元素的 normalize_num 一致
+# =====================================
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from audit_engine import normalize_num
+from numeric_kernel import normalize_num_vec, numeric_row_flags
+
+# 月重卡与参考表里实际出现过的各种写法
+MIXED = [
+    None, np.nan, pd.NaT, "", " ", "-", " - ", "nan", " nan ", "None",
+    0, 1, -3, 2.5, 1e-9, True, False,
+    "12", " 7 ", "-0.5", "+3", "1e3", "1E-2", ".5", "5.", "1_000",
+    "1,234.56", "12,345,678", "-1,000", ",", "1,2,3",
+    "12.5%", "-3%", "1,000%", "%", "abc%", "nan%", " 50 % ",
+    "１２３", "１２．５", "１，２３４", "٣٤", "１２％",
+    "inf", "-Infinity", "NaN",
+    "#N/A", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?",
+    "1.2.3", "--1", "1e", "e3", "1 2", "abc", "HT-2024-0001",
+    pd.Timestamp("2024-10-31"),
+]
+
+COLUMNS = {
+    "mixed": MIXED,
+    "numeric_text": ["1", "2.5", "1,000", "12%", "", "-", None],
+    "fallback": ["1", "2", "1.2.3", "3"],  # 候选中有 float() 拒绝的字符串，走逐个回退
+    "all_null": [None, np.nan, "", "-", "nan"],
+    "float": [1.5, np.nan, -2.0, 0.0],
+    "int": [1, 2, 3],
+    "empty": [],
+}
+
+
+def _same(a, b):
+    if isinstance(a, float) and isinstance(b, float):
+        return a == b or (math.isnan(a) and math.isnan(b))
+    return type(a) is type(b) and a == b
+
+
+def _expected(values):
+    return [normalize_num(v) for v in values]
+
+
+@pytest.mark.parametrize("name", sorted(COLUMNS))
+def test_normalize_num_vec_matches_scalar(name):
+    series = pd.Series(COLUMNS[name], dtype=object if name == "mixed" else None)
+    norm = normalize_num_vec(series)
+    for i, expected in enumerate(_expected(series)):
+        if expected is None:
+            assert norm.is_null[i], (i, series.iloc[i])
+            assert norm.leftover[i] is None
+        elif isinstance(expected, str):
+            assert not norm.is_null[i]
+            assert norm.leftover[i] == expected, (i, series.iloc[i])
+            assert np.isnan(norm.values[i])
+        else:
+            assert not norm.is_null[i]
+            assert norm.leftover[i] is None, (i, series.iloc[i])
+            assert _same(float(norm.values[i]), expected), (i, series.iloc[i], norm.values[i], expected)
+            assert norm.is_pct[i] == ("%" in str(series.iloc[i])), (i, series.iloc[i])
+
+
+@pytest.mark.parametrize("name", sorted(COLUMNS))
+def test_numeric_row_flags_match_scalar(name):
+    series = pd.Series(COLUMNS[name], dtype=object if name == "mixed" else None)
+    has_str, is_float = numeric_row_flags(series)
+    expected = _expected(series)
+    assert list(has_str) == [isinstance(v, str) for v in expected]
+    assert list(is_float) == [isinstance(v, float) for v in expected]
+
+
+def test_normalize_num_vec_keeps_order_after_shuffle():
+    rng = np.random.default_rng(0)
+    values = [MIXED[i] for i in rng.integers(0, len(MIXED), 500)]
+    norm = normalize_num_vec(pd.Series(values, dtype=object))
+    for i, expected in enumerate(_expected(values)):
+        if isinstance(expected, float):
+            assert _same(float(norm.values[i]), expected)
+        else:
+            assert norm.leftover[i] == expected
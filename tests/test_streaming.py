@@ -0,0 +1,153 @@
+# =====================================
+# 🧪 流式检查：分块读取的结果与整表 check_one_sheet 一致
+# =====================================
+import datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+
+from annotator import RED_FILL, YELLOW_FILL
+from audit_engine import check_one_sheet, check_one_sheet_streaming, prepare_ref_df
+from audit_rules import RULES
+from key_interner import KeyInterner
+from ref_index import RefIndex
+from workbook_loader import SheetChunkReader, load_workbook_sheets
+
+SHEET = "二次"
+N_ROWS, CHUNK_ROWS = 40, 7  # 块比 sheet 小，最后一块不满
+HEADER = ["序号", "合同编号", "授信方", "租赁本金", "租赁期限", "起租时间", "保证金比例", "城市经理"]
+
+
+def _main_rows():
+    rows = []
+    for i in range(N_ROWS):
+        rows.append([
+            i + 1,
+            f"HT-{i:04d}" if i % 9 else f" ht-{i:04d} ",   # 部分合同键需要规范化
+            "银行A" if i % 4 else "银行B",
+            float(1000 + i * 10 + (5 if i % 6 == 0 else 0)),
+            36 if i % 5 else 24,
+            datetime.datetime(2024, 1, 1) + datetime.timedelta(days=int(i + (i % 7 == 0))),
+            0.1 if i % 8 else 0.12,
+            "张三" if i % 3 else "李四",
+        ])
+    # 租赁本金：前两块全是数字，第三块起混入文本，跨块 dtype 不同（需要整列重新推断）
+    rows[16][3] = "待定"
+    rows[30][3] = "1,050"
+    # 起租时间：跨块混入 Excel 序列号与文本
+    rows[20][5] = 45320
+    rows[33][5] = "2024-02-03"
+    # 参考表中不存在的合同
+    rows[25][1] = "HT-9999"
+    # 表内空行：整表解析保留，流式也应保留
+    rows[12] = [None] * len(HEADER)
+    return rows
+
+
+def _write_main(path):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = SHEET
+    ws.append(["月重卡"])  # 表头在第 2 行（header=1），数据从第 3 行开始
+    ws.append(HEADER)
+    for row in _main_rows():
+        ws.append(row)
+    wb.save(path)
+
+
+def _ref_frames(keys):
+    fk = pd.DataFrame({
+        "合同编号": [f"HT-{i:04d}" for i in range(N_ROWS)],
+        "授信方": ["银行A"] * N_ROWS,
+        "租赁本金": [float(1000 + i * 10) for i in range(N_ROWS)],
+        "租赁期限": [3] * N_ROWS,
+        "挂车数量": [1] * N_ROWS,
+        "XIRR": [0.05] * N_ROWS,
+    })
+    zd = pd.DataFrame({
+        "合同编号": [f"HT-{i:04d}" for i in range(N_ROWS)],
+        "保证金比例_2": [0.1] * N_ROWS,
+        "起租日_商": [datetime.datetime(2024, 1, 1) + datetime.timedelta(days=i) for i in range(N_ROWS)],
+        "城市经理": [None if i % 10 == 0 else "张三" for i in range(N_ROWS)],  # 参考值为空的行跳过
+    })
+    mappings_all = {
+        prefix: (RULES.sources[prefix], prepare_ref_df(raw, RULES.sources[prefix], keys=keys))
+        for prefix, raw in (("fk", fk), ("zd", zd))
+    }
+    ref_index = RefIndex({prefix: std_df for prefix, (_, std_df) in mappings_all.items()}).bind(keys)
+    return mappings_all, ref_index
+
+
+def _ledger(files):
+    _, data = files["ledger"]
+    data.seek(0)
+    return pd.read_json(data, lines=True, dtype=False).sort_values(["row", "column"]).reset_index(drop=True)
+
+
+def _fills(files):
+    """标注版中红色、黄色单元格的坐标。"""
+    _, data = files["full_report"]
+    data.seek(0)
+    ws = load_workbook(data)[SHEET]
+    marked = {RED_FILL.fgColor.rgb: set(), YELLOW_FILL.fgColor.rgb: set()}
+    for row in ws.iter_rows():
+        for cell in row:
+            if cell.fill is not None and cell.fill.fill_type == "solid" and cell.fill.fgColor.rgb in marked:
+                marked[cell.fill.fgColor.rgb].add((cell.row, cell.column))
+    return marked
+
+
+@pytest.fixture()
+def main_file(tmp_path):
+    path = tmp_path / "月重卡.xlsx"
+    _write_main(path)
+    return str(path)
+
+
+def test_chunk_reader_matches_whole_sheet(main_file):
+    whole = pd.read_excel(main_file, sheet_name=SHEET, header=1)
+    reader = SheetChunkReader(main_file, SHEET, header=1, chunk_rows=CHUNK_ROWS)
+    try:
+        chunks = [df for _, df in reader]
+        assert reader.rows == len(whole) and len(chunks) == -(-len(whole) // CHUNK_ROWS)
+        streamed = pd.concat(chunks)
+    finally:
+        reader.close()
+    # 各块单独推断的 dtype 不同的列已按整列重新推断
+    assert streamed["租赁本金"].dtype == whole["租赁本金"].dtype == object
+    pd.testing.assert_frame_equal(streamed, whole)
+    for col in ("租赁本金", "起租时间"):  # 混合列逐个元素的类型也相同（不被逐块推断成 Timestamp / NaT）
+        assert [type(v) for v in streamed[col]] == [type(v) for v in whole[col]], col
+
+
+@pytest.mark.parametrize("chunk_rows", [1, CHUNK_ROWS])
+def test_streaming_matches_check_one_sheet(main_file, chunk_rows):
+    keys = KeyInterner()
+    mappings_all, ref_index = _ref_frames(keys)
+
+    book = load_workbook_sheets(main_file, [SHEET], header=1, keep_workbook=True)
+    stats, files = check_one_sheet(
+        SHEET, book["sheets"][SHEET], book["workbook"], ref_index, mappings_all, ledger="jsonl",
+    )
+    s_stats, s_files = check_one_sheet_streaming(
+        SHEET, main_file, SHEET, ref_index, mappings_all, chunk_rows=chunk_rows, ledger="jsonl",
+    )
+
+    total, _, skipped, seen, metrics = stats
+    s_total, _, s_skipped, s_seen, s_metrics = s_stats
+    assert total > 0 and skipped > 0
+    assert (s_total, s_skipped) == (total, skipped)
+    np.testing.assert_array_equal(s_seen, seen)
+    assert s_metrics["rows"] == metrics["rows"] == N_ROWS
+    for label, column in metrics["columns"].items():
+        assert (s_metrics["columns"][label]["rows"], s_metrics["columns"][label]["errors"]) == \
+            (column["rows"], column["errors"]), label
+
+    # 出错坐标：错误明细逐条一致，标注版中标红/标黄的单元格一致
+    ledger, s_ledger = _ledger(files), _ledger(s_files)
+    assert len(ledger) == total
+    pd.testing.assert_frame_equal(s_ledger, ledger)
+    assert {"待定", "1,050"} & set(ledger.loc[ledger["column"] == "租赁本金", "main_value"])
+    assert _fills(s_files) == _fills(files)
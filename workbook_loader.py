@@ -0,0 +1,324 @@
+# =====================================
+# 📖 工作簿加载器：每个上传的 xlsx 只打开、解析一次
+# =====================================
+"""
+一次打开工作簿，按关键词一次性解析出所有需要的 sheet，
+之后各 sheet 检查与漏填检查都直接使用这里解析好的 DataFrame。
+参考表只用到少数几列时可以按列投影读取（columns 参数），其余列的单元格不会转成 Python 对象。
+"""
+
+import pickle
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+from openpyxl import load_workbook
+from openpyxl.cell.cell import TYPE_ERROR, TYPE_NUMERIC
+from openpyxl.worksheet._read_only import ReadOnlyWorksheet
+from pandas.io.parsers import TextParser
+
+
+def resolve_sheets(sheet_names, keywords):
+    """
+    一次遍历 sheet 名称，为每个关键词找到第一个包含它的 sheet。
+    关键词为 None 表示“第一个 sheet”；找不到时对应值为 None。
+    """
+    resolved = {kw: None for kw in keywords}
+    pending = [kw for kw in keywords if kw is not None]
+    for name in sheet_names:
+        for kw in list(pending):
+            if kw in name:
+                resolved[kw] = name
+                pending.remove(kw)
+        if not pending:
+            break
+    if None in resolved and sheet_names:
+        resolved[None] = sheet_names[0]
+    return resolved
+
+
+def _convert_cell(cell):
+    """与 pandas 的 openpyxl 读取器相同：空单元格为 ""，错误值为 NaN，整数值的浮点数转为 int。"""
+    value = cell.value
+    if value is None:
+        return ""
+    if cell.data_type == TYPE_ERROR:
+        return np.nan
+    if cell.data_type == TYPE_NUMERIC:
+        as_int = int(value)
+        return as_int if as_int == value else float(value)
+    return value
+
+
+def _converted_row(row):
+    """整行转换并去掉行尾空单元格（pandas 判断“空行”的口径）。"""
+    converted = [_convert_cell(cell) for cell in row]
+    while converted and converted[-1] == "":
+        converted.pop()
+    return converted
+
+
+def parse_sheet_columns(ws, header, columns):
+    """
+    按列投影解析一个 sheet，结果与 pd.read_excel(header=header) 再取这些列完全一致
+    （相同的单元格转换、表尾空行裁剪与 TextParser 类型推断），但只有选中列的单元格被转换和保留，
+    宽表的峰值内存随选中列数而不是总列数增长。
+
+    columns - 函数：接收 pandas 解析出的完整列名列表，返回要保留的列名
+    选中的列为空、或表头行不存在时返回 None，由调用方退回整表解析。
+    """
+    if isinstance(ws, ReadOnlyWorksheet):
+        ws.reset_dimensions()
+    rows = ws.iter_rows()
+
+    head = []  # 表头及其之前的行（完整保留，用于得到与整表解析相同的列名）
+    for row in rows:
+        head.append(_converted_row(row))
+        if len(head) > header:
+            break
+    if len(head) <= header:
+        return None
+    header_index = TextParser(head, header=header, skip_blank_lines=False).read().columns
+    names = list(header_index)
+    keep = set(columns(names))
+    positions = [i for i, name in enumerate(names) if name in keep]
+    if not positions:
+        return None
+
+    def project(values):
+        return [values[p] if p < len(values) else "" for p in positions]
+
+    data = [project(h) for h in head]
+    last_with_data = max((i for i, h in enumerate(head) if h), default=-1)
+    width = max(len(h) for h in head)
+    for row in rows:
+        # 整行是否为空、行宽按全部单元格判断，只转换选中的列
+        for i in range(len(row) - 1, -1, -1):
+            value = row[i].value
+            if value is not None and value != "":
+                last_with_data = len(data)
+                width = max(width, i + 1)
+                break
+        data.append([_convert_cell(row[p]) if p < len(row) else "" for p in positions])
+    data = data[: last_with_data + 1]
+
+    df = TextParser(data, header=header, skip_blank_lines=False).read()
+    if width > len(header_index):
+        # 整表解析时表头按最宽的行补齐（多出的列名为 "Unnamed: n"），列名索引的类型随之变化
+        padded = [h + [""] * (width - len(h)) for h in head]
+        header_index = TextParser(padded, header=header, skip_blank_lines=False).read().columns
+    df.columns = header_index[positions]  # 重复列名按整表的编号（x、x.1 …）
+    return df
+
+
+class SheetChunkReader:
+    """
+    按行块流式读取一个 sheet（read-only 模式，不把整张表读进内存），用于超大的月重卡 sheet：
+
+        reader = SheetChunkReader(f, sheet_name, header=1, chunk_rows=20000)
+        reader.head_rows     # 表头及其之前各行的原始单元格值（写回标注版用）
+        reader.columns       # 与整表解析相同的列名
+        for raw_rows, df in reader:   # 可以反复遍历
+            ...                       # raw_rows: 每行原始单元格值；df: 这些行解析出的 DataFrame
+        reader.close()
+
+    构造时把整张 sheet 读一遍，逐块写入磁盘上的临时文件，之后的遍历只从临时文件读回，内存只占一块。
+    拼起来的各块与整表解析（pd.read_excel）逐列一致：相同的单元格转换、空行取舍（表内空行保留，表尾丢弃）
+    与类型推断。各块单独推断出的 dtype 不同的列（例如某块里全是数字、别的块里混有文本），
+    会从临时文件取出整列重新推断一次，这一步一次只占几列的内存。
+    df 的索引是该行在整表 DataFrame 中的位置；比表头更宽的行，多出的单元格只保留在 raw_rows 里。
+    """
+
+    def __init__(self, f, sheet_name, header=0, chunk_rows=20000):
+        if hasattr(f, "seek"):
+            f.seek(0)
+        self.chunk_rows = max(1, int(chunk_rows))
+        self.rows = 0
+        self._spool = tempfile.TemporaryFile()
+        self._chunks = []  # [(行数, 各列转换值的偏移, 原始行 + DataFrame 的偏移)]
+        self._fixed = {}   # (块序号, 列位置) -> 整列重新推断后该块的值的偏移
+        wb = load_workbook(f, read_only=True, data_only=True)
+        try:
+            ws = wb[sheet_name]
+            ws.reset_dimensions()
+            rows = ws.iter_rows()
+            self.head_rows = []
+            head = []
+            for row in rows:
+                self.head_rows.append([cell.value for cell in row])
+                head.append(_converted_row(row))
+                if len(head) > header:
+                    break
+            if len(head) <= header:
+                self.columns = pd.Index([])
+                return
+            self.columns = TextParser(head, header=header, skip_blank_lines=False).read().columns
+            dtypes = [set() for _ in self.columns]
+            for raw, converted in self._read_blocks(rows):
+                df, data = self._frame(converted)
+                for i in range(len(self.columns)):
+                    dtypes[i].add(str(df.dtypes.iloc[i]))
+                self._dump_chunk(raw, df, data)
+        finally:
+            wb.close()
+        self._fix_mixed([i for i, seen in enumerate(dtypes) if len(seen) > 1])
+
+    def _read_blocks(self, rows):
+        raw, converted = [], []
+        blank_raw = []  # 连续空行先暂存：后面还有数据行才算表内空行，否则是表尾，丢弃
+        for row in rows:
+            values = _converted_row(row)
+            if not values:
+                blank_raw.append([cell.value for cell in row])
+                continue
+            raw.extend(blank_raw)
+            converted.extend([] for _ in blank_raw)
+            blank_raw = []
+            raw.append([cell.value for cell in row])
+            converted.append(values)
+            if len(converted) >= self.chunk_rows:
+                yield raw, converted
+                raw, converted = [], []
+        if converted:
+            yield raw, converted
+
+    def _frame(self, converted):
+        width = len(self.columns)
+        data = [row[:width] + [""] * (width - len(row)) for row in converted]
+        df = TextParser(data, header=None, skip_blank_lines=False).read()
+        df.columns = self.columns
+        df.index = pd.RangeIndex(self.rows, self.rows + len(df))
+        return df, data
+
+    def _dump_chunk(self, raw, df, data):
+        by_column = [list(col) for col in zip(*data)] if data else []
+        conv_at = self._spool.tell()
+        pickle.dump(by_column, self._spool, protocol=pickle.HIGHEST_PROTOCOL)
+        main_at = self._spool.tell()
+        pickle.dump((raw, df), self._spool, protocol=pickle.HIGHEST_PROTOCOL)
+        self._chunks.append((len(df), conv_at, main_at))
+        self.rows += len(df)
+
+    def _load(self, offset):
+        self._spool.seek(offset)
+        return pickle.load(self._spool)
+
+    def _fix_mixed(self, positions):
+        """各块 dtype 不一致的列：分批取出整列重新推断，按块切开后写回临时文件。"""
+        if not positions or not self.rows:
+            return
+        # 每批的单元格数与一块相当，峰值内存仍由块大小决定
+        per_batch = max(1, self.chunk_rows * len(self.columns) // self.rows)
+        for start in range(0, len(positions), per_batch):
+            batch = positions[start:start + per_batch]
+            values = {i: [] for i in batch}
+            for _, conv_at, _ in self._chunks:
+                by_column = self._load(conv_at)
+                for i in batch:
+                    values[i].extend(by_column[i])
+            for i in batch:
+                whole = TextParser([[v] for v in values.pop(i)], header=None, skip_blank_lines=False).read()[0]
+                self._spool.seek(0, 2)
+                offset = 0
+                for n, (rows, _, _) in enumerate(self._chunks):
+                    self._fixed[(n, i)] = self._spool.tell()
+                    pickle.dump(whole.iloc[offset:offset + rows].to_numpy(), self._spool,
+                                protocol=pickle.HIGHEST_PROTOCOL)
+                    offset += rows
+
+    def __iter__(self):
+        for n, (_, _, main_at) in enumerate(self._chunks):
+            raw, df = self._load(main_at)
+            for i in range(len(self.columns)):
+                if (n, i) in self._fixed:
+                    # 显式带上整列推断出的 dtype：直接赋 ndarray 时 pandas 会对本块的 object 值重新推断
+                    # （例如本块全是日期时变成 datetime64），与整表解析不一致
+                    values = self._load(self._fixed[(n, i)])
+                    df.isetitem(i, pd.Series(values, index=df.index, dtype=values.dtype))
+            yield raw, df
+
+    def close(self):
+        self._spool.close()
+
+
+def resolve_workbook_sheets(f, keywords):
+    """只读取工作簿的 sheet 名称（read-only），返回 {关键词: sheet名或None}。"""
+    if hasattr(f, "seek"):
+        f.seek(0)
+    wb = load_workbook(f, read_only=True)
+    try:
+        return resolve_sheets(wb.sheetnames, keywords)
+    finally:
+        wb.close()
+
+
+class LoadCancelled(Exception):
+    """加载被 cancel 事件中止（见 load_workbook_sheets）。"""
+
+
+def load_workbook_sheets(f, keywords, header=0, keep_workbook=False, columns=None, cancel=None):
+    """
+    打开工作簿一次并解析 keywords 对应的全部 sheet。
+    keep_workbook=True 时以可编辑模式加载（data_only，公式取缓存值），
+    DataFrame 直接从这份内存中的工作簿解析，工作簿本身随结果返回供标注使用。
+
+    返回 dict:
+        name     - 文件名
+        sheets   - {关键词: {"sheet": sheet名或None, "df": DataFrame或None, "error": 异常或None}}
+        elapsed  - 打开 + 解析耗时（秒）
+        workbook - keep_workbook=True 时为 openpyxl Workbook，否则为 None
+    同一个 sheet 被多个关键词命中时只解析一次。
+    columns 给出时按列投影解析（见 parse_sheet_columns），只保留需要的列。
+    cancel 为 threading.Event（可选）：打开工作簿后、每个 sheet 解析前检查，已设置时抛出 LoadCancelled。
+    """
+    start_time = time.time()
+    workbook = None
+    if keep_workbook:
+        workbook = load_workbook(f, data_only=True)
+        xls = pd.ExcelFile(workbook, engine="openpyxl")
+    else:
+        xls = pd.ExcelFile(f)
+    resolved = resolve_sheets(xls.sheet_names, keywords)
+
+    parsed = {}  # sheet名 -> (df, error)
+    sheets = {}
+    for kw in keywords:
+        sheet_name = resolved[kw]
+        if sheet_name is None:
+            sheets[kw] = {"sheet": None, "df": None, "error": None}
+            continue
+        if cancel is not None and cancel.is_set():
+            xls.close()
+            raise LoadCancelled(getattr(f, "name", ""))
+        if sheet_name not in parsed:
+            try:
+                df = None
+                if columns is not None:
+                    df = parse_sheet_columns(xls.book[sheet_name], header, columns)
+                if df is None:
+                    df = xls.parse(sheet_name, header=header)
+                parsed[sheet_name] = (df, None)
+            except Exception as e:
+                parsed[sheet_name] = (None, e)
+        df, error = parsed[sheet_name]
+        sheets[kw] = {"sheet": sheet_name, "df": df, "error": error}
+    if workbook is None:
+        xls.close()
+
+    return {
+        "name": getattr(f, "name", ""),
+        "sheets": sheets,
+        "elapsed": time.time() - start_time,
+        "workbook": workbook,
+    }
+
+
+def required_sheet_df(loaded, keyword):
+    """取出必需 sheet 的 DataFrame；缺失时抛出与 find_sheet 一致的 ValueError。"""
+    entry = loaded["sheets"][keyword]
+    if entry["sheet"] is None:
+        raise ValueError(f"❌ 未找到包含关键词「{keyword}」的sheet: {keyword}")
+    if entry["error"] is not None:
+        raise entry["error"]
+    return entry["df"]